@@ -0,0 +1,87 @@
+"""Vergleicht zwei Benchmark-Ergebnisse (JSON aus `bench/run.py`).
+
+Beispiel:
+    python -m bench.compare bench/results/alt.json bench/results/neu.json --threshold 10
+
+Der Exit-Code ist 1, wenn eine Kennzahl sich um mehr als `--threshold` Prozent verschlechtert
+hat oder neue Fehler auftreten (für CI geeignet).
+"""
+import sys
+import json
+import argparse
+
+# Kennzahl -> (Pfad im Szenario, True wenn größer besser ist)
+METRICS = {
+    'p50 ms': (('latency_ms', 'p50'), False),
+    'p95 ms': (('latency_ms', 'p95'), False),
+    'p99 ms': (('latency_ms', 'p99'), False),
+    'first event p50 ms': (('first_event_ms', 'p50'), False),
+    'rps': (('rps',), True),
+    'throughput MB/s': (('throughput_mb_s',), True),
+    'peak RSS MB': (('resources', 'peak_rss_mb'), False),
+    'disk high-water MB': (('resources', 'disk_high_water_mb'), False),
+    'ffmpeg CPU s': (('resources', 'ffmpeg_cpu_s'), False),
+    'startup ms': (('startup', 'listen_ms'), False),
+    'warm ms': (('startup', 'warm_ms'), False),
+    'errors': (('errors',), False),
+}
+
+
+def lookup(data, path):
+    for key in path:
+        if not isinstance(data, dict):
+            return None
+        data = data.get(key)
+    return data
+
+
+def compare(baseline, candidate, threshold):
+    """Liefert (Zeilen, Regressionen) für alle Szenarien, die in beiden Läufen vorkommen."""
+    rows, regressions = [], []
+    for scenario in baseline['scenarios']:
+        if scenario not in candidate['scenarios']:
+            continue
+        old_result, new_result = baseline['scenarios'][scenario], candidate['scenarios'][scenario]
+        for name, (path, higher_is_better) in METRICS.items():
+            old, new = lookup(old_result, path), lookup(new_result, path)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old * 100 if old else (0.0 if new == old else float('inf'))
+            worse = change < -threshold if higher_is_better else change > threshold
+            if name == 'errors':
+                worse = new > old
+            rows.append((scenario, name, old, new, change, worse))
+            if worse:
+                regressions.append(f'{scenario}: {name} {old} -> {new}')
+    return rows, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Vergleicht zwei Benchmark-Läufe')
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=10.0, help='Toleranz in Prozent')
+    args = parser.parse_args(argv)
+
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(args.candidate, encoding='utf-8') as f:
+        candidate = json.load(f)
+
+    print(f"{'scenario':<15} {'metric':<20} {'baseline':>12} {'candidate':>12} {'change':>9}")
+    rows, regressions = compare(baseline, candidate, args.threshold)
+    for scenario, name, old, new, change, worse in rows:
+        marker = ' ❌' if worse else ''
+        print(f'{scenario:<15} {name:<20} {old:>12} {new:>12} {change:>+8.1f}%{marker}')
+
+    if regressions:
+        print(f"\n❌ {len(regressions)} regression(s) above {args.threshold}%:")
+        for regression in regressions:
+            print(f'   - {regression}')
+        return 1
+    print('\n✅ No regressions')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
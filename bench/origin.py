@@ -0,0 +1,218 @@
+"""Lokaler Ersatz-Origin für Benchmarks: synthetische Medien und Format-Manifeste.
+
+Routen (jeweils für beliebige Video-Namen `<vid>`):
+    /watch/<vid>           HTML-Seite mit mehreren <video>-Quellen (yt-dlp: generic extractor)
+    /media/<vid>/<fmt>     Mediendatei des Formats (Range-fähig, optional gedrosselt)
+    /hls/<vid>/index.m3u8  HLS-Playlist mit Segmenten (fragmentierter Download)
+    /hls/<vid>/master.m3u8 HLS-Master mit getrennter Video- und Audiospur (bestvideo+bestaudio)
+    /hls/<vid>/<spur>-<n>.ts  HLS-Segment
+
+Ist ffmpeg vorhanden, werden echte Testclips (Testbild + Sinuston) erzeugt, damit auch
+Konvertierung und Audio-Extraktion gemessen werden können; sonst Zufallsbytes.
+"""
+import os
+import re
+import shutil
+import hashlib
+import tempfile
+import threading
+import subprocess
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Formate der Testseite: Name -> (Dateiendung, MIME-Typ, Größe in Bytes ohne ffmpeg)
+FORMATS = {
+    '360p': ('mp4', 'video/mp4', 2 * 1024 * 1024),
+    '720p': ('mp4', 'video/mp4', 6 * 1024 * 1024),
+    'audio': ('m4a', 'audio/mp4', 1024 * 1024),
+}
+HLS_SEGMENTS = 10
+HLS_SEGMENT_SIZE = 256 * 1024
+CHUNK_SIZE = 64 * 1024
+
+_range_re = re.compile(r'bytes=(\d*)-(\d*)')
+
+
+def _synthetic_bytes(name, size):
+    """Deterministische Pseudozufallsbytes (gleicher Name -> gleicher Inhalt)."""
+    seed = hashlib.sha256(name.encode()).digest()
+    block = hashlib.sha256(seed).digest() * (CHUNK_SIZE // 32)
+    return (block * (size // len(block) + 1))[:size]
+
+
+def _generate_clip(path, fmt, duration):
+    """Erzeugt einen echten Testclip mit ffmpeg; liefert False, wenn ffmpeg fehlt."""
+    ffmpeg = shutil.which('ffmpeg')
+    if not ffmpeg:
+        return False
+    height = {'360p': 360, '720p': 720}.get(fmt)
+    cmd = [ffmpeg, '-y', '-loglevel', 'error']
+    if height:
+        cmd += ['-f', 'lavfi', '-i', f'testsrc=size={height * 16 // 9}x{height}:rate=25:duration={duration}']
+    cmd += ['-f', 'lavfi', '-i', f'sine=frequency=440:duration={duration}']
+    if height:
+        cmd += ['-c:v', 'libx264', '-preset', 'ultrafast', '-pix_fmt', 'yuv420p']
+    cmd += ['-c:a', 'aac', '-b:a', '128k', '-movflags', '+faststart', path]
+    return subprocess.run(cmd, check=False).returncode == 0
+
+
+class MediaLibrary:
+    """Erzeugt und cached die Testdateien pro Format (alle Videos teilen denselben Inhalt)."""
+
+    def __init__(self, root=None, duration=10):
+        self.root = root or tempfile.mkdtemp(prefix='bench-origin-')
+        self.duration = duration
+        self._files = {}
+        self._lock = threading.Lock()
+
+    def path(self, fmt):
+        with self._lock:
+            if fmt not in self._files:
+                ext, _, size = FORMATS[fmt]
+                path = os.path.join(self.root, f'{fmt}.{ext}')
+                if not _generate_clip(path, fmt, self.duration):
+                    with open(path, 'wb') as f:
+                        f.write(_synthetic_bytes(fmt, size))
+                self._files[fmt] = path
+            return self._files[fmt]
+
+    def cleanup(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+def make_handler(library, throttle_bps=None):
+    """Baut die Handler-Klasse; `throttle_bps` simuliert eine langsame Origin-Leitung."""
+
+    class OriginHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_bytes(self, data, content_type):
+            start, end = 0, len(data) - 1
+            match = _range_re.match(self.headers.get('Range', ''))
+            if match and (match.group(1) or match.group(2)):
+                if match.group(1):
+                    start = int(match.group(1))
+                    end = min(int(match.group(2)), end) if match.group(2) else end
+                else:
+                    start = max(len(data) - int(match.group(2)), 0)
+                self.send_response(206)
+                self.send_header('Content-Range', f'bytes {start}-{end}/{len(data)}')
+            else:
+                self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(end - start + 1))
+            self.send_header('Accept-Ranges', 'bytes')
+            self.end_headers()
+            if self.command == 'HEAD':
+                return
+            view = memoryview(data)[start:end + 1]
+            pause = CHUNK_SIZE / throttle_bps if throttle_bps else 0
+            for offset in range(0, len(view), CHUNK_SIZE):
+                self.wfile.write(view[offset:offset + CHUNK_SIZE])
+                if pause:
+                    threading.Event().wait(pause)
+
+        def _send_text(self, text, content_type, status=200):
+            body = text.encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            if self.command != 'HEAD':
+                self.wfile.write(body)
+
+        def do_HEAD(self):
+            self.do_GET()
+
+        def do_GET(self):
+            parts = [part for part in self.path.split('?', 1)[0].split('/') if part]
+            try:
+                if len(parts) == 2 and parts[0] == 'watch':
+                    return self._send_text(self._watch_page(parts[1]), 'text/html; charset=utf-8')
+                if len(parts) == 3 and parts[0] == 'media' and parts[2] in FORMATS:
+                    with open(library.path(parts[2]), 'rb') as f:
+                        data = f.read()
+                    return self._send_bytes(data, FORMATS[parts[2]][1])
+                if len(parts) == 3 and parts[0] == 'hls' and parts[2] == 'master.m3u8':
+                    return self._send_text(self._hls_master(), 'application/vnd.apple.mpegurl')
+                if len(parts) == 3 and parts[0] == 'hls' and parts[2] in ('index.m3u8', 'video.m3u8', 'audio.m3u8'):
+                    track = parts[2].split('.', 1)[0]
+                    return self._send_text(self._hls_playlist(track), 'application/vnd.apple.mpegurl')
+                if len(parts) == 3 and parts[0] == 'hls' and parts[2].endswith('.ts'):
+                    data = _synthetic_bytes(self.path, HLS_SEGMENT_SIZE)
+                    return self._send_bytes(data, 'video/mp2t')
+            except (BrokenPipeError, ConnectionResetError):
+                return
+            self._send_text('not found', 'text/plain', status=404)
+
+        def _watch_page(self, vid):
+            sources = '\n'.join(
+                f'<source src="/media/{vid}/{fmt}" type="{mime}" label="{fmt}" res="{fmt.rstrip("p")}">'
+                for fmt, (_, mime, _) in FORMATS.items() if mime.startswith('video/')
+            )
+            return (
+                f'<!DOCTYPE html><html><head><title>Benchmark video {vid}</title>'
+                f'<meta property="og:title" content="Benchmark video {vid}"></head>'
+                f'<body><video controls>{sources}</video></body></html>'
+            )
+
+        def _hls_master(self):
+            return (
+                '#EXTM3U\n'
+                '#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="aud",NAME="audio",DEFAULT=YES,AUTOSELECT=YES,URI="audio.m3u8"\n'
+                '#EXT-X-STREAM-INF:BANDWIDTH=2000000,RESOLUTION=1280x720,CODECS="avc1.64001f",AUDIO="aud"\n'
+                'video.m3u8\n'
+            )
+
+        def _hls_playlist(self, track):
+            segments = ''.join(f'#EXTINF:1.0,\n{track}-{i}.ts\n' for i in range(HLS_SEGMENTS))
+            return f'#EXTM3U\n#EXT-X-VERSION:3\n#EXT-X-TARGETDURATION:1\n{segments}#EXT-X-ENDLIST\n'
+
+    return OriginHandler
+
+
+class _QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Vom Client abgebrochene Verbindungen sind im Benchmark normal
+        pass
+
+
+class Origin:
+    """Startet den Origin-Server in einem Hintergrund-Thread."""
+
+    def __init__(self, host='127.0.0.1', port=0, throttle_bps=None, duration=10):
+        self.library = MediaLibrary(duration=duration)
+        self.server = _QuietServer((host, port), make_handler(self.library, throttle_bps))
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def __enter__(self):
+        # Dateien vorab erzeugen, damit die Messung nicht die Erzeugung enthält
+        for fmt in FORMATS:
+            self.library.path(fmt)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+        self.library.cleanup()
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Lokaler Benchmark-Origin')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--throttle', type=int, default=None, help='Bytes pro Sekunde und Verbindung')
+    args = parser.parse_args()
+    with Origin(port=args.port, throttle_bps=args.throttle) as origin:
+        print(f"🎬 Benchmark origin running on {origin.base_url}")
+        origin.thread.join()
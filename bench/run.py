@@ -0,0 +1,444 @@
+"""Last- und Leistungstest für Stream-DL gegen einen lokalen Origin (komplett offline).
+
+Jedes Szenario startet einen frischen Server-Prozess (uvicorn, `src.asgi:app`) mit eigenem
+Arbeitsverzeichnis und misst:
+    - Latenzen p50/p95/p99, Durchsatz (Requests/s), Fehler
+    - Spitzen-RSS des Server-Prozesses (während der Messung abgetastet und VmHWM)
+    - Hochwassermarke des temporären Speicherplatzes (TMPDIR + Result-Store)
+    - CPU-Zeit der Kindprozesse (ffmpeg) über cutime/cstime aus /proc
+    - Kaltstart: Zeit bis der Port offen ist und bis yt-dlp vorgewärmt ist (`/ready`)
+
+Das Ergebnis wird als JSON gespeichert und kann mit `bench/compare.py` verglichen werden.
+
+Beispiel:
+    python -m bench.run --scenario all --requests 50 --concurrency 8
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import signal
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.origin import Origin
+
+SCENARIOS = ('analyze', 'download_sse', 'download_file')
+SAMPLE_INTERVAL = 0.1
+_CLK_TCK = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+
+# ====== HILFSFUNKTIONEN ======
+def percentile(values, p):
+    """Perzentil mit linearer Interpolation (wie numpy.percentile)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * p / 100.0
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def latency_summary(seconds):
+    """Fasst Latenzen (Sekunden) in Millisekunden zusammen."""
+    if not seconds:
+        return None
+    return {
+        'p50': round(percentile(seconds, 50) * 1000, 2),
+        'p95': round(percentile(seconds, 95) * 1000, 2),
+        'p99': round(percentile(seconds, 99) * 1000, 2),
+        'mean': round(sum(seconds) / len(seconds) * 1000, 2),
+        'max': round(max(seconds) * 1000, 2),
+    }
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def directory_size(path):
+    """Summe aller Dateigrößen unterhalb von `path` (Dateien können währenddessen verschwinden)."""
+    total = 0
+    try:
+        entries = list(os.scandir(path))
+    except OSError:
+        return 0
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                total += directory_size(entry.path)
+            elif entry.is_file(follow_symlinks=False):
+                total += entry.stat(follow_symlinks=False).st_size
+        except OSError:
+            continue
+    return total
+
+
+def read_proc_status(pid):
+    """Liest VmRSS und VmHWM (in Bytes) aus /proc; None, wenn nicht verfügbar (kein Linux)."""
+    values = {}
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith(('VmRSS:', 'VmHWM:')):
+                    name, amount = line.split(':', 1)
+                    values[name] = int(amount.split()[0]) * 1024
+    except OSError:
+        return None
+    return values
+
+
+def read_children_cpu(pid):
+    """CPU-Sekunden aller beendeten Kindprozesse (cutime + cstime), z.B. ffmpeg."""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+    except OSError:
+        return None
+    # Nach dem Prozessnamen beginnt die Zeile mit Feld 3 (state); cutime/cstime sind Feld 16 und 17
+    return (int(fields[13]) + int(fields[14])) / _CLK_TCK
+
+
+class ResourceSampler:
+    """Tastet RSS des Servers und den Plattenverbrauch des Arbeitsverzeichnisses periodisch ab."""
+
+    def __init__(self, pid, work_dir, interval=SAMPLE_INTERVAL):
+        self.pid = pid
+        self.work_dir = work_dir
+        self.interval = interval
+        self.peak_rss = 0
+        self.peak_disk = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='bench-sampler', daemon=True)
+
+    def _sample(self):
+        status = read_proc_status(self.pid)
+        if status:
+            self.peak_rss = max(self.peak_rss, status.get('VmRSS', 0))
+        self.peak_disk = max(self.peak_disk, directory_size(self.work_dir))
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        self._cpu_start = read_children_cpu(self.pid)
+        self._sample()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+        cpu_end = read_children_cpu(self.pid)
+        self.children_cpu = (
+            round(cpu_end - self._cpu_start, 3) if cpu_end is not None and self._cpu_start is not None else None
+        )
+        self.process_hwm = (read_proc_status(self.pid) or {}).get('VmHWM')
+
+    def summary(self):
+        return {
+            'peak_rss_mb': round(self.peak_rss / 1024 ** 2, 2) if self.peak_rss else None,
+            'process_hwm_mb': round(self.process_hwm / 1024 ** 2, 2) if self.process_hwm else None,
+            'disk_high_water_mb': round(self.peak_disk / 1024 ** 2, 2),
+            'ffmpeg_cpu_s': self.children_cpu,
+        }
+
+
+# ====== SERVER ======
+class AppServer:
+    """Startet die App als eigenen Prozess mit isoliertem TMPDIR und Result-Store."""
+
+    def __init__(self, env_overrides=None):
+        self.work_dir = tempfile.mkdtemp(prefix='bench-app-')
+        self.port = free_port()
+        self.base_url = f'http://127.0.0.1:{self.port}'
+        tmp_dir = os.path.join(self.work_dir, 'tmp')
+        os.makedirs(tmp_dir)
+        self.env = dict(os.environ)
+        self.env.update({
+            'TMPDIR': tmp_dir,
+            'RESULT_STORE_DIR': os.path.join(self.work_dir, 'results'),
+            'NO_PROXY': '127.0.0.1,localhost',
+            'no_proxy': '127.0.0.1,localhost',
+            'PYTHONUNBUFFERED': '1',
+        })
+        self.env.update(env_overrides or {})
+        self.log_path = os.path.join(self.work_dir, 'server.log')
+        self.process = None
+        self.listen_ms = None
+
+    def __enter__(self):
+        self._log = open(self.log_path, 'wb')
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'uvicorn', 'src.asgi:app', '--host', '127.0.0.1',
+             '--port', str(self.port), '--log-level', 'warning', '--no-access-log'],
+            cwd=ROOT, env=self.env, stdout=self._log, stderr=subprocess.STDOUT,
+        )
+        started = time.monotonic()
+        deadline = started + 60
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f'Server exited early, see {self.log_path}')
+            try:
+                with socket.create_connection(('127.0.0.1', self.port), timeout=0.5):
+                    self.listen_ms = round((time.monotonic() - started) * 1000, 1)
+                    return self
+            except OSError:
+                time.sleep(0.1)
+        raise RuntimeError('Server did not start within 60s')
+
+    def startup(self):
+        """Kaltstart-Zeiten: bis der Port offen ist (vom Prozessstart aus gemessen) sowie App- und
+        yt-dlp-Bereitschaft laut `/ready`."""
+        try:
+            ready = make_session().get(f'{self.base_url}/ready', timeout=10).json()
+        except (requests.RequestException, ValueError):
+            ready = {}
+        to_ms = lambda seconds: round(seconds * 1000, 1) if seconds is not None else None
+        return {
+            'listen_ms': self.listen_ms,
+            'app_ms': to_ms(ready.get('app_seconds')),
+            'warm_ms': to_ms(ready.get('warm_seconds')),
+        }
+
+    def log_tail(self, lines=20):
+        """Letzte Zeilen des Server-Logs (für die Fehlersuche im Bericht)."""
+        self._log.flush()
+        with open(self.log_path, 'r', encoding='utf-8', errors='replace') as f:
+            return f.read().splitlines()[-lines:]
+
+    def __exit__(self, *exc):
+        if self.process and self.process.poll() is None:
+            self.process.send_signal(signal.SIGINT)
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self._log.close()
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+
+def make_session():
+    session = requests.Session()
+    # Niemals über einen System-Proxy gehen: alles ist lokal
+    session.trust_env = False
+    return session
+
+
+# ====== SZENARIEN ======
+def video_url(origin, run_id, index, distinct):
+    slot = index % distinct if distinct else index
+    return f'{origin.base_url}/watch/{run_id}-{slot}'
+
+
+def analyze_request(session, server, url):
+    response = session.get(f'{server.base_url}/api/analyze', params={'url': url}, timeout=120)
+    response.raise_for_status()
+    return {'bytes': len(response.content)}
+
+
+def download_sse_request(session, server, url, args):
+    """Startet einen Download über /api/download und liest den SSE-Strom bis zum Ende."""
+    params = {'url': url, 'type': args.type, 'quality': args.quality, 'format': args.format}
+    started = time.perf_counter()
+    first_event = None
+    events = 0
+    with session.get(f'{server.base_url}/api/download', params=params, stream=True, timeout=300) as response:
+        response.raise_for_status()
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith('data:'):
+                continue
+            events += 1
+            if first_event is None:
+                first_event = time.perf_counter() - started
+            event = json.loads(line[len('data:'):].strip())
+            if event.get('status') == 'complete':
+                return {'first_event': first_event, 'events': events, 'file_url': event.get('file_url')}
+            if event.get('status') in ('error', 'cancelled'):
+                raise RuntimeError(event.get('message') or event.get('status'))
+    raise RuntimeError('stream ended without result')
+
+
+def download_file_request(session, server, file_url):
+    """Lädt eine fertige Datei vollständig herunter."""
+    started = time.perf_counter()
+    first_byte = None
+    received = 0
+    with session.get(f'{server.base_url}{file_url}', stream=True, timeout=300) as response:
+        response.raise_for_status()
+        for chunk in response.iter_content(chunk_size=256 * 1024):
+            if first_byte is None:
+                first_byte = time.perf_counter() - started
+            received += len(chunk)
+    return {'first_event': first_byte, 'bytes': received}
+
+
+def prepare_file(session, server, origin, run_id, args):
+    """Erzeugt vorab eine fertige Datei, die im Szenario download_file ausgeliefert wird."""
+    result = download_sse_request(session, server, video_url(origin, run_id, 'file', 0), args)
+    return result['file_url']
+
+
+def run_load(fn, count, concurrency):
+    """Führt `fn(index)` `count`-mal mit `concurrency` Threads aus und sammelt Latenzen."""
+    latencies, extras, errors = [], [], []
+
+    def timed(index):
+        started = time.perf_counter()
+        try:
+            extra = fn(index)
+        except Exception as e:
+            return None, None, str(e)
+        return time.perf_counter() - started, extra, None
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for latency, extra, error in pool.map(timed, range(count)):
+            if error:
+                errors.append(error)
+            else:
+                latencies.append(latency)
+                extras.append(extra)
+    return time.perf_counter() - started, latencies, extras, errors
+
+
+def run_scenario(name, origin, args, run_id):
+    local = threading.local()
+
+    def session():
+        if not hasattr(local, 'session'):
+            local.session = make_session()
+        return local.session
+
+    with AppServer(env_overrides=dict(args.env)) as server:
+        if name == 'analyze':
+            fn = lambda i: analyze_request(session(), server, video_url(origin, run_id, i, args.distinct))
+        elif name == 'download_sse':
+            fn = lambda i: download_sse_request(session(), server, video_url(origin, run_id, i, args.distinct), args)
+        else:
+            file_url = prepare_file(session(), server, origin, run_id, args)
+            fn = lambda i: download_file_request(session(), server, file_url)
+
+        with ResourceSampler(server.process.pid, server.work_dir) as sampler:
+            wall, latencies, extras, errors = run_load(fn, args.requests, args.concurrency)
+
+        try:
+            cache_stats = make_session().get(f'{server.base_url}/api/cache/stats', timeout=10).json()
+        except (requests.RequestException, ValueError):
+            cache_stats = None
+        startup = server.startup()
+        log_tail = server.log_tail() if errors else None
+
+    first_events = [extra['first_event'] for extra in extras if extra.get('first_event') is not None]
+    transferred = sum(extra.get('bytes', 0) for extra in extras)
+    result = {
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'ok': len(latencies),
+        'errors': len(errors),
+        'error_samples': sorted(set(errors))[:5],
+        'wall_s': round(wall, 3),
+        'rps': round(len(latencies) / wall, 2) if wall else None,
+        'latency_ms': latency_summary(latencies),
+        'first_event_ms': latency_summary(first_events),
+        'resources': sampler.summary(),
+        'cache': cache_stats,
+        'startup': startup,
+    }
+    if log_tail:
+        result['server_log_tail'] = log_tail
+    if transferred:
+        result['bytes'] = transferred
+        result['throughput_mb_s'] = round(transferred / 1024 ** 2 / wall, 2) if wall else None
+    return result
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Stream-DL Benchmark (offline, lokaler Origin)')
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS + ('all',),
+                        help='Szenario (mehrfach möglich), Standard: all')
+    parser.add_argument('--requests', type=int, default=20, help='Anfragen pro Szenario')
+    parser.add_argument('--concurrency', type=int, default=4, help='Parallele Clients')
+    parser.add_argument('--distinct', type=int, default=0,
+                        help='Anzahl verschiedener Videos (0 = jede Anfrage ein neues Video)')
+    parser.add_argument('--throttle', type=int, default=None, help='Origin-Bandbreite pro Verbindung in Bytes/s')
+    parser.add_argument('--type', default='video', choices=('video', 'audio'))
+    parser.add_argument('--quality', default='360p', help='Format-ID der Testseite (360p, 720p)')
+    parser.add_argument('--format', default='mp4', help='Zielformat')
+    parser.add_argument('--env', action='append', default=[], type=lambda s: tuple(s.split('=', 1)),
+                        metavar='NAME=VALUE', help='Zusätzliche Umgebungsvariable für den Server')
+    parser.add_argument('--output', default=None, help='Ziel-JSON (Standard: bench/results/<zeit>-<rev>.json)')
+    parser.add_argument('--label', default=None, help='Freitext zur Beschreibung des Laufs')
+    args = parser.parse_args(argv)
+    scenarios = args.scenario or ['all']
+    args.scenarios = list(SCENARIOS) if 'all' in scenarios else list(dict.fromkeys(scenarios))
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    revision = git_revision()
+    timestamp = datetime.now(timezone.utc)
+    run_id = timestamp.strftime('%Y%m%d%H%M%S')
+    report = {
+        'meta': {
+            'timestamp': timestamp.isoformat(),
+            'revision': revision,
+            'label': args.label,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'ffmpeg': shutil.which('ffmpeg') is not None,
+            'config': {
+                'requests': args.requests, 'concurrency': args.concurrency, 'distinct': args.distinct,
+                'throttle': args.throttle, 'type': args.type, 'quality': args.quality,
+                'format': args.format, 'env': dict(args.env),
+            },
+        },
+        'scenarios': {},
+    }
+
+    with Origin(throttle_bps=args.throttle) as origin:
+        for name in args.scenarios:
+            print(f"🏁 Running scenario {name} ({args.requests} requests, concurrency {args.concurrency})")
+            result = run_scenario(name, origin, args, f'{run_id}-{name}')
+            report['scenarios'][name] = result
+            latency = result['latency_ms'] or {}
+            print(f"   ✅ ok={result['ok']} errors={result['errors']} rps={result['rps']} "
+                  f"p50={latency.get('p50')}ms p95={latency.get('p95')}ms p99={latency.get('p99')}ms")
+
+    output = args.output or os.path.join(ROOT, 'bench', 'results', f"{run_id}-{revision or 'local'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"📄 Results written to {output}")
+    return report
+
+
+if __name__ == '__main__':
+    main()
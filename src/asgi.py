@@ -0,0 +1,227 @@
+import os
+import re
+import sys
+import json
+import asyncio
+import threading
+from tempfile import SpooledTemporaryFile
+from urllib.parse import parse_qs
+from concurrent.futures import ThreadPoolExecutor
+
+# Gleiche Pfad-Logik wie in main.py, damit `src.*` importierbar ist
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from asgiref.sync import AsyncToSync, sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from src.main import app as flask_app
+from src.services.broker import resume_cursor
+from src.routes.youtube import job_scheduler, progress_broker, parse_job_params, job_result_key, result_event_for
+
+# SSE-Endpunkte, die asynchron bedient werden; alles andere läuft über Flask
+_job_events_re = re.compile(r'^/api/jobs/([0-9a-f]+)/events$')
+
+# asgiref führt WSGI-Aufrufe standardmäßig "thread_sensitive" auf einem einzigen Thread aus;
+# damit würden alle Flask-Anfragen (inkl. Dateiauslieferung) nacheinander bedient.
+_wsgi_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('WSGI_THREADS', 32)), thread_name_prefix='wsgi'
+)
+
+
+class _ThreadedWsgiInstance(WsgiToAsgiInstance):
+    """Bedient eine Flask-Anfrage auf dem Thread-Pool.
+
+    Anders als asgiref wird `close()` des WSGI-Iterables immer aufgerufen (Freigabe von
+    Stream-Slots und Result-Store-Referenzen, Metriken, Beenden von ffmpeg), und nach einem
+    `http.disconnect` wird nicht weiter iteriert.
+    """
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            raise ValueError('WSGI wrapper received a non-HTTP scope')
+        self.scope = scope
+        self.disconnected = threading.Event()
+        with SpooledTemporaryFile(max_size=65536) as body:
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    return
+                if message['type'] != 'http.request':
+                    raise ValueError('WSGI wrapper received a non-HTTP-request message')
+                body.write(message.get('body', b''))
+                if not message.get('more_body'):
+                    break
+            body.seek(0)
+            self.sync_send = AsyncToSync(send)
+            watcher = asyncio.create_task(self._watch_disconnect(receive))
+            try:
+                await self.run_wsgi_app(body)
+            finally:
+                watcher.cancel()
+
+    async def _watch_disconnect(self, receive):
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                self.disconnected.set()
+                return
+
+    @sync_to_async(thread_sensitive=False, executor=_wsgi_executor)
+    def run_wsgi_app(self, body):
+        try:
+            environ = self.build_environ(self.scope, body)
+        except ValueError:
+            # Zu viele doppelte Header (wie asgiref)
+            self.sync_send({'type': 'http.response.start', 'status': 400,
+                            'headers': [(b'content-type', b'text/plain')]})
+            self.sync_send({'type': 'http.response.body', 'body': b'Bad Request: Too many duplicate headers'})
+            return
+        iterable = self.wsgi_application(environ, self.start_response)
+        try:
+            bytes_sent = 0
+            for output in iterable:
+                if self.disconnected.is_set():
+                    return
+                if not self.response_started:
+                    self.response_started = True
+                    self.sync_send(self.response_start)
+                # Nie mehr senden als Content-Length erlaubt
+                if self.response_content_length is not None:
+                    output = output[:self.response_content_length - bytes_sent]
+                self.sync_send({'type': 'http.response.body', 'body': output, 'more_body': True})
+                bytes_sent += len(output)
+                if bytes_sent == self.response_content_length:
+                    break
+            if self.disconnected.is_set():
+                return
+            if not self.response_started:
+                self.response_started = True
+                self.sync_send(self.response_start)
+            self.sync_send({'type': 'http.response.body'})
+        finally:
+            close = getattr(iterable, 'close', None)
+            if close is not None:
+                close()
+
+
+class _ThreadedWsgiToAsgi(WsgiToAsgi):
+    """WsgiToAsgi, das Flask-Anfragen parallel auf einem Thread-Pool (WSGI_THREADS) bedient."""
+
+    async def __call__(self, scope, receive, send):
+        await _ThreadedWsgiInstance(self.wsgi_application, self.duplicate_header_limit)(scope, receive, send)
+
+
+wsgi_app = _ThreadedWsgiToAsgi(flask_app)
+
+
+async def _in_thread(func, *args, **kwargs):
+    """Führt einen blockierenden Aufruf auf dem Thread-Pool aus (z.B. SQLite im gemeinsamen Backend),
+    damit die Event-Loop alle anderen Verbindungen weiter bedient."""
+    return await sync_to_async(func, thread_sensitive=False, executor=_wsgi_executor)(*args, **kwargs)
+
+
+def _headers(scope):
+    return {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope.get('headers', [])}
+
+
+async def _send_json(send, status, payload):
+    body = json.dumps(payload).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'access-control-allow-origin', b'*')],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _stream_job(job, cursor, receive, send, filename=None):
+    """Sendet die Job-Ereignisse als SSE, ohne einen Worker-Thread zu blockieren."""
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [
+            (b'content-type', b'text/event-stream; charset=utf-8'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+            (b'access-control-allow-origin', b'*'),
+        ],
+    })
+
+    disconnected = asyncio.Event()
+
+    async def watch_disconnect():
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                disconnected.set()
+                return
+
+    async def is_disconnected():
+        return disconnected.is_set()
+
+    watcher = asyncio.create_task(watch_disconnect())
+    job_scheduler.subscribe(job)
+    try:
+        transform = lambda event: result_event_for(event, filename)
+        async for chunk in progress_broker.stream(job, cursor, is_disconnected, transform):
+            if disconnected.is_set():
+                break
+            await send({'type': 'http.response.body', 'body': chunk.encode('utf-8'), 'more_body': True})
+        if not disconnected.is_set():
+            await send({'type': 'http.response.body', 'body': b''})
+    except OSError:
+        # Verbindung während des Sendens abgebrochen
+        pass
+    finally:
+        watcher.cancel()
+        # Ohne Wiederverbinden (AUTO_CANCEL_GRACE) bricht ein getrennter Client Jobs mit auto_cancel ab
+        job_scheduler.unsubscribe(job)
+
+
+async def _handle_sse(scope, receive, send):
+    """Liefert True, wenn die Anfrage ein asynchron bedienter SSE-Endpunkt war."""
+    if scope['type'] != 'http' or scope['method'] != 'GET':
+        return False
+    path = scope['path']
+    query = {key: values[-1] for key, values in parse_qs(scope.get('query_string', b'').decode('latin-1')).items()}
+    headers = _headers(scope)
+    cursor = resume_cursor(headers.get('last-event-id') or query.get('last_event_id'))
+
+    match = _job_events_re.match(path)
+    if match:
+        job = await _in_thread(job_scheduler.get, match.group(1))
+        if job is None:
+            await _send_json(send, 404, {'error': 'Job not found'})
+        else:
+            await _stream_job(job, cursor, receive, send, query.get('filename'))
+        return True
+
+    if path == '/api/download' and query.get('stream') not in ('1', 'true'):
+        params, priority, error = parse_job_params(query)
+        if error:
+            await _send_json(send, 400, {'error': error})
+            return True
+        client = headers.get('x-client-id') or (scope.get('client') or ('anonymous',))[0]
+        job = await _in_thread(
+            job_scheduler.submit, params, priority=priority, client_id=client, auto_cancel=True,
+            dedup_key=job_result_key(params),
+        )
+        await _stream_job(job, cursor, receive, send, params['filename'])
+        return True
+
+    return False
+
+
+async def app(scope, receive, send):
+    """ASGI-Einstiegspunkt: SSE-Fortschritt asynchron, alle anderen Routen über die Flask-App."""
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await _in_thread(job_scheduler.start)
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    if await _handle_sse(scope, receive, send):
+        return
+    await wsgi_app(scope, receive, send)
@@ -0,0 +1,21 @@
+import os
+
+# Gunicorn-Konfiguration: Flask direkt per WSGI, fertige Dateien gehen über `wsgi.file_wrapper`
+# per sendfile (Zero-Copy) an den Client. SSE-Fortschritt belegt hier je Verbindung einen Thread.
+# Start: SERVER=gunicorn python main.py  oder  gunicorn -c src/gunicorn.conf.py src.main:app
+
+bind = f"{os.environ.get('HOST', '0.0.0.0')}:{os.environ.get('PORT', 5000)}"
+# Ein Prozess: Scheduler, Caches und Broker leben im Prozess (mehrere Instanzen: STATE_BACKEND)
+workers = 1
+worker_class = 'gthread'
+threads = int(os.environ.get('WSGI_THREADS', 32))
+# `sendfile` nicht setzen: Response.can_sendfile() prüft `cfg.sendfile is not False`, und die
+# Config-Eigenschaft liefert False, sobald die Einstellung gesetzt ist (sie kennt nur --no-sendfile).
+# Ungesetzt gilt die Umgebungsvariable SENDFILE, ohne sie ist sendfile aktiv.
+loglevel = os.environ.get('LOG_LEVEL', 'info')
+
+
+def post_worker_init(worker):
+    # Unfertige Jobs sofort wieder aufnehmen (unter ASGI übernimmt das der Lifespan-Start)
+    from src.routes.youtube import job_scheduler
+    job_scheduler.start()
@@ -7,11 +7,13 @@ load_dotenv()
 # This is useful for making modules in sibling directories importable.
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
+# Zuerst importieren: nur wegen des Nebeneffekts, der Import setzt den Startzeitpunkt (PROCESS_STARTED)
+from src.services import startup  # noqa: F401
 from flask import Flask, send_from_directory
 from flask_cors import CORS
 # from src.models.user import db # Removed
 # from src.routes.user import user_bp # Removed
-from src.routes.youtube import youtube_bp
+from src.routes.youtube import youtube_bp, metrics_endpoint, ready_endpoint, warmup
 
 # Initialize the Flask app
 # The static_folder is set to the 'static' directory relative to this file.
@@ -25,6 +27,14 @@ CORS(app)
 # app.register_blueprint(user_bp, url_prefix='/api/users') # Removed
 app.register_blueprint(youtube_bp, url_prefix='/api')
 
+# Prometheus-Metriken (Phasen-Histogramme, Warteschlange, Bytes, Caches)
+app.add_url_rule('/metrics', 'metrics', metrics_endpoint)
+# Readiness mit Warm-/Kaltzustand (z.B. für wait_for_server.py oder Load-Balancer)
+app.add_url_rule('/ready', 'ready', ready_endpoint)
+
+# Cache-Dauer für statische Dateien außer index.html (Sekunden)
+STATIC_MAX_AGE = int(os.environ.get('STATIC_MAX_AGE', 3600))
+
 # Uncomment the following lines if you need to use a database
 # app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
 # app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
@@ -45,17 +55,43 @@ def serve(path):
             return "Static folder not configured", 404
 
     # If the path is not empty and the file exists, send the requested file
-    if path != "" and os.path.exists(os.path.join(static_folder_path, path)):
-        return send_from_directory(static_folder_path, path)
+    if path != "" and path != 'index.html' and os.path.exists(os.path.join(static_folder_path, path)):
+        return send_from_directory(static_folder_path, path, max_age=STATIC_MAX_AGE)
     else:
         # Otherwise, try to send the index.html file
         index_path = os.path.join(static_folder_path, 'index.html')
         if os.path.exists(index_path):
-            return send_from_directory(static_folder_path, 'index.html')
+            # Immer per ETag/Last-Modified revalidieren (304), damit Updates sofort ankommen
+            response = send_from_directory(static_folder_path, 'index.html')
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
         else:
             return "index.html not found", 404
 
+# App ist bereit; yt-dlp wird im Hintergrund vorgewärmt (YTDLP_PREWARM)
+warmup.app_ready()
+warmup.start()
+
 
 # This block runs the app when the script is executed directly
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    host = os.environ.get('HOST', '0.0.0.0')
+    port = int(os.environ.get('PORT', 5000))
+    if os.environ.get('DEV_SERVER') == '1':
+        # Flask-Entwicklungsserver mit Debugger und Reloader
+        app.run(host=host, port=port, debug=True)
+    elif os.environ.get('SERVER') == 'gunicorn':
+        # WSGI mit sendfile-Auslieferung (nicht unter Windows), siehe src/gunicorn.conf.py.
+        # Eigener Prozess: Threads dieses Prozesses (Sweeper, Vorwärmen) überleben den Fork nicht
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        os.chdir(root)
+        os.execv(sys.executable, [sys.executable, '-m', 'gunicorn', '-c', os.path.join('src', 'gunicorn.conf.py'), 'src.main:app'])
+    else:
+        # Produktion: ASGI-Server, SSE-Fortschritt läuft asynchron (siehe src/asgi.py);
+        # uvicorn bietet kein sendfile, Dateien werden in Blöcken gesendet
+        import uvicorn
+        # src.asgi importiert src.main: dieses Modul wiederverwenden, statt App und Dienste
+        # ein zweites Mal aufzubauen (das Skript läuft als __main__)
+        sys.modules.setdefault('src.main', sys.modules[__name__])
+        from src.asgi import app as asgi_app
+        uvicorn.run(asgi_app, host=host, port=port, log_level=os.environ.get('LOG_LEVEL', 'info'))
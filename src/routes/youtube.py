@@ -2,19 +2,68 @@ import os
 import json
 import uuid
 import tempfile
-import shutil
-from flask import Blueprint, request, Response, stream_with_context, send_file, after_this_request
-from threading import Thread
-from queue import Queue
-import yt_dlp
+from urllib.parse import urlencode
+from flask import Blueprint, request, Response, stream_with_context
+from werkzeug.wsgi import ClosingIterator
 import re
 import time
+import atexit
+from src.services.metadata_cache import MetadataCache, normalize_video_key
+from src.services.jobs import JobScheduler, JobCancelled, FINISHED_STATES
+from src.services.result_store import ResultStore, result_key
+from src.services.state import state_backend_from_env
+from src.services.startup import LazyModule, Warmup, extractor_options
+from src.services.delivery import file_response, content_disposition
+from src.services.progress import ProgressAggregator, FFMPEG_PROGRESS_FILE
+from src.services.batch import BatchAnalyzer
+from src.services.broker import ProgressBroker, format_sse, heartbeat_interval, resume_cursor
+from src.services.streaming import StreamPlan, StreamSlots, StreamingUnsupported, selected_formats, iter_passthrough, iter_ffmpeg
+from src.services.metrics import MetricsRegistry, JobTrace
+from src.services.transfer import BandwidthBudget, ConcurrencyController, fast_downloads_enabled
+from src.services.transcode import plan_transcode, lookup_formats, resolve_formats
+from src.services.workdir import WorkDirManager, OWNER_FILE, postprocess_overhead, projected_bytes
 
-ansi_escape = re.compile(r'\x1B\[[0-?]*[ -/]*[@-~]')
+# yt-dlp (samt Extraktor-Registry) wird erst beim ersten Zugriff bzw. vom Vorwärm-Thread geladen
+yt_dlp = LazyModule('yt_dlp')
+warmup = Warmup(yt_dlp, modules=('src.services.parallel_download',) if fast_downloads_enabled() else ())
 
 # Create a Blueprint for the YouTube routes
 youtube_bp = Blueprint('youtube', __name__)
 
+# Gemeinsamer Metadaten-Cache für /api/analyze (TTL + LRU, optional persistent)
+metadata_cache = MetadataCache.from_env()
+
+# Gemeinsamer Zustand mehrerer Instanzen (STATE_BACKEND); ohne bleibt alles im Prozess
+state_backend = state_backend_from_env()
+
+# Inhaltsadressierter Speicher für fertige Downloads (geteilt zwischen identischen Anfragen)
+result_store = ResultStore.from_env(index=state_backend)
+
+# Arbeitsordner der Downloads: Quota, Platzreservierung, Sweeper und Aufräumen nach Absturz
+work_dirs = WorkDirManager.from_env()
+work_dirs.start()
+
+# ====== METRIKEN (PROMETHEUS, /metrics) ======
+metrics_registry = MetricsRegistry()
+phase_seconds = metrics_registry.histogram(
+    'phase_duration_seconds',
+    'Dauer der Verarbeitungsphasen (queue, extract, download, Postprozessoren, store, metadata, delivery, stream)',
+    ['phase'],
+)
+job_seconds = metrics_registry.histogram('job_duration_seconds', 'Gesamtdauer eines Jobs ab dem Einreihen', ['status'])
+jobs_finished = metrics_registry.counter('jobs_finished_total', 'Beendete Jobs nach Status', ['status'])
+downloaded_bytes = metrics_registry.counter('downloaded_bytes_total', 'Vom Origin heruntergeladene Bytes')
+served_bytes = metrics_registry.counter('served_bytes_total', 'An Clients ausgelieferte Bytes', ['mode'])
+transcode_decisions = metrics_registry.counter(
+    'transcode_decisions_total', 'Entscheidungen des Transcode-Planers (none, copy, remux, reencode)', ['action'],
+)
+
+def observe_span(span):
+    """Überträgt eine abgeschlossene Phase aus dem Job-Trace in die Histogramme."""
+    phase_seconds.observe(span['duration'], phase=span['phase'])
+    if span['phase'] == 'download' and span.get('bytes'):
+        downloaded_bytes.inc(span['bytes'])
+
 # ====== NEUE FUNKTION: COOKIES HANDELN ======
 def setup_cookies():
     """Erstellt eine temporäre Cookie-Datei aus der Umgebungsvariable YT_COOKIES"""
@@ -49,6 +98,91 @@ def parse_duration(seconds):
         return f"{h:02d}:{m:02d}:{s:02d}"
     return f"{m:02d}:{s:02d}"
 
+def reduce_info(info):
+    """Reduziert das yt-dlp-Info-Dict auf Titel, Dauer, Thumbnail und die Formatlisten."""
+    video_formats = []
+    audio_formats = []
+    
+    # Regulärer Ausdruck, um die Qualität (z.B. 1080p) aus dem format_note zu extrahieren
+    quality_re = re.compile(r'(\d{3,4}p)')
+
+    for f in info.get('formats', []):
+        # Ignoriere Formate ohne Audio und Video (z.B. nur Storyboards)
+        if f.get('acodec') == 'none' and f.get('vcodec') == 'none':
+            continue
+
+        filesize = f.get('filesize') or f.get('filesize_approx')
+        filesize_str = f"{filesize / (1024*1024):.2f} MB" if filesize else "N/A"
+
+        # Für Videoformate (mit Video-Codec)
+        if f.get('vcodec') != 'none':
+            # Extrahiere Qualität aus format_note, sonst Fallback
+            quality_match = quality_re.search(f.get('format_note') or '')
+            quality = quality_match.group(1) if quality_match else (f.get('resolution') or 'N/A')
+            
+            video_formats.append({
+                'format_id': f['format_id'],
+                'quality': quality,
+                'ext': f.get('ext'),
+                'filesize': filesize_str,
+                'filesize_bytes': filesize,
+                'has_audio': f.get('acodec') != 'none',
+                # Codecs für den Transcode-Planer (Remux statt Neukodierung)
+                'vcodec': f.get('vcodec'),
+                'acodec': f.get('acodec'),
+                'abr': f.get('abr'),
+            })
+        
+        # Für reine Audioformate (kein Video-Codec)
+        elif f.get('vcodec') == 'none' and f.get('acodec') != 'none':
+            audio_formats.append({
+                'format_id': f['format_id'],
+                'quality': f"{f.get('abr')}k" if f.get('abr') else "Beste",
+                'ext': f.get('ext'),
+                'filesize': filesize_str,
+                'filesize_bytes': filesize,
+                'vcodec': f.get('vcodec'),
+                'acodec': f.get('acodec'),
+                'abr': f.get('abr'),
+            })
+
+    # Sortiere Formate
+    video_formats.sort(key=lambda x: int(x['quality'].replace('p', '')) if x['quality'][:-1].isdigit() else 0, reverse=True)
+    audio_formats.sort(key=lambda x: int(x['quality'].replace('k', '')) if x['quality'][:-1].isdigit() else 0, reverse=True)
+
+    return {
+        'title': info.get('title'),
+        'duration': parse_duration(info.get('duration')),
+        'thumbnail': info.get('thumbnail'),
+        'video_formats': video_formats,
+        'audio_formats': audio_formats
+    }
+
+def extract_metadata(video_url, ydl=None):
+    """Extrahiert Videoinformationen und die reduzierten Formatlisten für eine URL.
+
+    Mit `ydl` wird eine bestehende YoutubeDL-Instanz wiederverwendet (Batch-Worker).
+    """
+    if ydl is not None:
+        with phase_seconds.time(phase='metadata'):
+            return reduce_info(ydl.extract_info(video_url, download=False))
+
+    cookie_path = None
+    try:
+        # ====== COOKIES EINBINDEN ======
+        cookie_path = setup_cookies()
+        
+        ydl_opts = {'quiet': True, **extractor_options()}
+        if cookie_path:
+            ydl_opts['cookiefile'] = cookie_path
+            
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl, phase_seconds.time(phase='metadata'):
+            info = ydl.extract_info(video_url, download=False)
+            return reduce_info(info)
+    finally:
+        # ====== COOKIES AUFRÄUMEN ======
+        cleanup_cookies(cookie_path)
+
 # -------------------------------
 # Neuer Endpoint: Datei direkt zurückgeben
 # -------------------------------
@@ -59,246 +193,590 @@ def analyze_url():
     if not video_url:
         return Response(json.dumps({'error': 'URL parameter is required'}), status=400, mimetype='application/json')
 
+    try:
+        # ====== METADATEN AUS DEM CACHE (ODER EINMALIG EXTRAHIEREN) ======
+        response_data = metadata_cache.get_or_extract(video_url, extract_metadata)
+        return Response(json.dumps(response_data), status=200, mimetype='application/json')
+    except Exception as e:
+        return Response(json.dumps({'error': str(e)}), status=500, mimetype='application/json')
+
+def create_batch_ydl(flat=False):
+    """Erstellt die YoutubeDL-Instanz eines Batch-Workers; sie bleibt für die Lebensdauer des Threads offen."""
+    # ====== COOKIES EINBINDEN ======
+    cookie_path = setup_cookies()
+    if cookie_path:
+        atexit.register(cleanup_cookies, cookie_path)
+    ydl_opts = {'quiet': True, **extractor_options()}
+    if flat:
+        ydl_opts['extract_flat'] = 'in_playlist'
+    else:
+        ydl_opts['noplaylist'] = True
+    if cookie_path:
+        ydl_opts['cookiefile'] = cookie_path
+    return yt_dlp.YoutubeDL(ydl_opts)
+
+def analyze_with_cache(video_url, ydl):
+    """Batch-Variante von /api/analyze: gleicher Cache, aber die YoutubeDL-Instanz des Workers."""
+    return metadata_cache.get_or_extract(video_url, lambda url: extract_metadata(url, ydl))
+
+# Paralleler Pool für /api/analyze/batch
+batch_analyzer = BatchAnalyzer.from_env(analyze_with_cache, create_batch_ydl)
+
+@youtube_bp.route('/analyze/batch', methods=['POST'])
+def analyze_batch():
+    """Analysiert viele URLs bzw. eine Playlist und streamt jedes Ergebnis, sobald es fertig ist.
+
+    Body: {"urls": [...]} und/oder {"playlist": "..."}; Antwort als NDJSON oder mit
+    `?format=sse` bzw. `Accept: text/event-stream` als SSE.
+    """
+    body = request.get_json(silent=True) or {}
+    if not isinstance(body, dict):
+        return Response(json.dumps({'error': 'JSON object expected'}), status=400, mimetype='application/json')
+    urls = body.get('urls') or []
+    if isinstance(urls, str):
+        urls = [urls]
+    playlist = body.get('playlist')
+    # Vor dem Streamen prüfen: ein Fehler im Generator ergäbe nur eine abgeschnittene 200-Antwort
+    if not isinstance(urls, list) or not all(isinstance(url, str) for url in urls):
+        return Response(json.dumps({'error': 'urls must be a list of strings'}), status=400, mimetype='application/json')
+    if playlist is not None and not isinstance(playlist, str):
+        return Response(json.dumps({'error': 'playlist must be a string'}), status=400, mimetype='application/json')
+    playlists = [playlist] if playlist else []
+    if not urls and not playlists:
+        return Response(json.dumps({'error': 'urls or playlist is required'}), status=400, mimetype='application/json')
+
+    use_sse = request.args.get('format') == 'sse' or 'text/event-stream' in request.headers.get('Accept', '')
+
+    def encode(item):
+        return f"data: {json.dumps(item)}\n\n" if use_sse else json.dumps(item) + "\n"
+
+    def generate():
+        entries, errors = batch_analyzer.expand(urls, playlists)
+        yield encode({'type': 'start', 'count': len(entries)})
+        for error in errors:
+            yield encode(error)
+        failed = len(errors)
+        for item in batch_analyzer.iter_results(entries):
+            if item['type'] == 'error':
+                failed += 1
+            yield encode(item)
+        yield encode({'type': 'done', 'count': len(entries), 'errors': failed})
+
+    mimetype = 'text/event-stream' if use_sse else 'application/x-ndjson'
+    return Response(stream_with_context(generate()), mimetype=mimetype, headers=SSE_HEADERS)
+
+@youtube_bp.route('/cache/stats')
+def cache_stats():
+    """Liefert Treffer-, Fehlzugriffs- und Latenzzähler von Metadaten-Cache und Result-Store."""
+    stats = {'metadata': metadata_cache.stats(), 'results': result_store.stats()}
+    return Response(json.dumps(stats), status=200, mimetype='application/json')
+
+def build_ydl_opts(download_type, quality, output_format, cookie_path=None, plan=None):
+    """Baut die yt-dlp-Optionen für Download-Typ, Format-ID und Zielformat.
+
+    Mit `plan` (siehe transcode.plan_transcode) werden dessen Postprozessoren verwendet,
+    damit z.B. nur umkopiert statt neu kodiert wird.
+    """
+    # Bestimme den Pfad zu ffmpeg – funktioniert auf allen Systemen
+    ffmpeg_path = os.path.abspath('ffmpeg')
+    if os.name == 'nt':  # Wenn Windows
+        ffmpeg_path += '.exe'
+    
+    # Build yt-dlp options dynamically
+    ydl_opts = {
+        'format': 'bestvideo+bestaudio/best',
+        'noplaylist': True,
+        'ffmpeg_location': ffmpeg_path,
+        **extractor_options(),
+        'cookiefile': cookie_path,  # falls du Cookies nutzt
+        # Optional: Falls du nur Audio willst
+        # 'postprocessors': [{
+        #     'key': 'FFmpegExtractAudio',
+        #     'preferredcodec': 'mp3',
+        # }],
+    }
+    
+    # ====== COOKIES EINBINDEN ======
+    if cookie_path:
+        ydl_opts['cookiefile'] = cookie_path
+
+    if download_type == 'audio':
+        ydl_opts['format'] = quality # Select best audio format
+        ydl_opts['postprocessors'] = [{
+            'key': 'FFmpegExtractAudio',
+            'preferredcodec': output_format, # mp3, aac, etc.
+            'preferredquality': '192', # Standard quality
+        }]
+    elif download_type == 'video':
+        ydl_opts['format'] = quality
+        ydl_opts['postprocessors'] = [{
+            'key': 'FFmpegVideoConvertor',
+            'preferedformat': output_format, # mp4, mkv, etc.
+        }] if output_format != 'mp4' else [] # Only convert if necessary
+
+    # ====== TRANSCODE-PLAN ======
+    if plan is not None:
+        ydl_opts['postprocessors'] = plan.postprocessors
+        if plan.merge_output_format:
+            ydl_opts['merge_output_format'] = plan.merge_output_format
+    return ydl_opts
+
+# ====== HOCHDURCHSATZ-DOWNLOADS ======
+# Globales Bandbreitenbudget (BANDWIDTH_LIMIT) und adaptive Fragment-Parallelität je Host
+bandwidth_budget = BandwidthBudget.from_env()
+fragment_concurrency = ConcurrencyController.from_env()
+
+def create_downloader(options):
+    """YoutubeDL für Jobs; im Modus FAST_DOWNLOADS mit parallelen Spuren und Fragmenten."""
+    if fast_downloads_enabled():
+        # Erst hier importiert: das Modul zieht yt-dlp nach sich
+        from src.services.parallel_download import ParallelYoutubeDL
+        return ParallelYoutubeDL(options, controller=fragment_concurrency)
+    return yt_dlp.YoutubeDL(options)
+
+def job_result_key(params):
+    """Schlüssel des Ergebnisses im Result-Store: Video, Format-ID, Zielformat und Nachbearbeitung.
+
+    Bewusst ohne Transcode-Plan: Remux und Neukodierung liefern dasselbe Zielformat, der
+    Schlüssel bleibt damit unabhängig davon, ob die Metadaten gerade im Cache liegen.
+    """
+    postprocessors = build_ydl_opts(params['type'], params['quality'], params['format']).get('postprocessors')
+    return result_key(normalize_video_key(params['url']), params['quality'], params['format'], postprocessors)
+
+def result_url(stored_name, filename):
+    """Download-Link für eine Datei im Result-Store unter dem Wunschnamen des Clients."""
+    download_name = filename + os.path.splitext(stored_name)[1]
+    return f"/api/download_file/{stored_name}?{urlencode({'name': download_name})}"
+
+def result_event_for(event, filename):
+    """Passt den Download-Link im Abschlussereignis an den Dateinamen eines Abonnenten an.
+
+    An einen laufenden Job angehängte Anfragen (dedup_key) bekommen so ihren eigenen Namen
+    statt den des ersten Auftraggebers.
+    """
+    if not filename or event.get('status') != 'complete' or not event.get('stored_name'):
+        return event
+    return {**event, 'file_url': result_url(event['stored_name'], filename)}
+
+def publish_result(job, file_path):
+    """Meldet den fertigen Job inklusive Download-Link an die Abonnenten."""
+    job.file_path = file_path
+    stored_name = os.path.basename(file_path)
+    # Erstelle einen Download-Link für die Datei (Name je Abonnent, siehe result_event_for)
+    job.publish({
+        'status': 'complete',
+        'message': 'Prozess abgeschlossen.',
+        'stored_name': stored_name,
+        'file_url': result_url(stored_name, job.params['filename']),
+    })
+
+def plan_job_transcode(job, metadata):
+    """Entscheidet anhand der gecachten Analyse-Metadaten, ob kopiert, umgepackt oder neu kodiert wird.
+
+    Ohne Metadaten im Cache (oder ohne Codec-Angaben) bleibt es beim bisherigen Verhalten;
+    extra extrahiert wird dafür nicht. Die Entscheidung wird dem Client als Ereignis gemeldet.
+    """
+    params = job.params
+    formats = resolve_formats(params['quality'], metadata)
+    plan = plan_transcode(params['type'], params['format'], formats)
+    job.transcode = plan.to_dict()
+    transcode_decisions.inc(action=plan.action)
+    print(f"🎛️ Transcode plan for job {job.id}: {plan.action} ({plan.reason})")
+    job.publish({'status': 'plan', 'message': f"Nachbearbeitung: {plan.reason}", 'transcode': job.transcode})
+    return plan
+
+def admit_work_dir(job, plan, metadata):
+    """Reserviert den geschätzten Platzbedarf des Jobs und legt seinen Arbeitsordner an.
+
+    Ist gerade nicht genug Platz frei, wartet der Job (Ereignis 'waiting'); passt er nie,
+    schlägt er mit InsufficientSpace fehl.
+    """
+    params = job.params
+    formats = lookup_formats(params['quality'], metadata)
+    merging = '+' in params['quality']
+    overhead = postprocess_overhead(bool(plan.postprocessors) or merging, plan.reencode)
+    work_dir = work_dirs.admit(
+        job.id, projected_bytes(formats, overhead), overhead,
+        cancel_event=job.cancel_requested,
+        on_wait=lambda: job.publish({'status': 'waiting', 'message': 'Warte auf freien Speicherplatz...'}),
+    )
+    if work_dir is None:
+        raise JobCancelled()
+    return work_dir
+
+# pp_key() der Postprozessoren, die ffmpeg ausführen (yt-dlp lässt das Präfix 'FFmpeg' weg)
+FFMPEG_POSTPROCESSORS = frozenset({
+    'Merger', 'ExtractAudio', 'VideoConvertor', 'VideoRemuxer', 'Metadata', 'EmbedThumbnail',
+    'EmbedSubtitle', 'SubtitlesConvertor', 'ThumbnailsConvertor', 'Concat', 'SplitChapters',
+    'ModifyChapters', 'FixupM3u8', 'FixupM4a', 'FixupStretched', 'FixupTimestamp',
+    'FixupDuration', 'FixupDuplicateMoov',
+})
+
+def download_to_work_dir(job, scheduler, work_dir, plan, trace):
+    """Lädt und bearbeitet den Download im Arbeitsordner; liefert den Pfad der fertigen Datei."""
+    params = job.params
+    filename = params['filename']
     cookie_path = None
+    holds_postprocess_slot = False
+    # Anteil am globalen Bandbreitenbudget
+    bandwidth = bandwidth_budget.lease()
+    # Gedrosselter, numerisch berechneter Fortschritt inkl. ffmpeg-Phase
+    aggregator = ProgressAggregator(job.publish, progress_file=os.path.join(work_dir.path, FFMPEG_PROGRESS_FILE))
+
+    def progress_hook(d):
+        if job.cancel_requested.is_set():
+            raise yt_dlp.utils.DownloadCancelled()
+        trace.download_hook(d)
+        aggregator.download_hook(d)
+        work_dir.progress_hook(d)
+        bandwidth.progress_hook(d)
+
+    def postprocessor_hook(d):
+        # ffmpeg-Schritte teilen sich ein eigenes, kleineres Kontingent
+        nonlocal holds_postprocess_slot
+        trace.postprocessor_hook(d)
+        if d.get('postprocessor') not in FFMPEG_POSTPROCESSORS:
+            return
+        if d['status'] == 'started' and not holds_postprocess_slot:
+            scheduler.postprocess_slots.acquire()
+            holds_postprocess_slot = True
+        elif d['status'] == 'finished' and holds_postprocess_slot:
+            scheduler.postprocess_slots.release()
+            holds_postprocess_slot = False
+        aggregator.postprocessor_hook(d)
+        if job.cancel_requested.is_set():
+            raise yt_dlp.utils.DownloadCancelled()
+
     try:
         # ====== COOKIES EINBINDEN ======
         cookie_path = setup_cookies()
-        
-        ydl_opts = {'quiet': True}
+        options = build_ydl_opts(params['type'], params['quality'], params['format'], cookie_path, plan)
+        options['outtmpl'] = os.path.join(work_dir.path, f'{filename}.%(ext)s')
+        options['progress_hooks'] = [progress_hook]
+        options['postprocessor_hooks'] = [postprocessor_hook]
+        options['postprocessor_args'] = aggregator.ffmpeg_args()
+
+        trace.begin('extract')
+        with create_downloader(options) as ydl:
+            ydl.download([params['url']])
+    except yt_dlp.utils.DownloadCancelled:
+        raise JobCancelled()
+    finally:
+        aggregator.stop()
+        trace.close()
+        bandwidth.close()
+        if holds_postprocess_slot:
+            scheduler.postprocess_slots.release()
+        # ====== COOKIES AUFRÄUMEN ======
+        cleanup_cookies(cookie_path)
+
+    # Finde die heruntergeladene Datei (ohne Besitzmarke und ffmpeg-Fortschrittsdatei)
+    downloaded_file = None
+    for f in os.listdir(work_dir.path):
+        if f.startswith(filename) and f not in (OWNER_FILE, FFMPEG_PROGRESS_FILE):
+            downloaded_file = os.path.join(work_dir.path, f)
+            break
+    if not downloaded_file:
+        raise RuntimeError('Download completed but file not found')
+    return downloaded_file
+
+def run_download_job(job, scheduler):
+    """Führt einen Download-Job im Worker-Thread aus und veröffentlicht den Fortschritt."""
+    params = job.params
+    key = job.dedup_key or job_result_key(params)
+    # Zeitmessung je Phase (im Job-Datensatz und in /metrics)
+    trace = JobTrace(job.trace, on_span=observe_span)
+    trace.record('queue', job.created_at, job.started_at or time.time())
+
+    # ====== ERGEBNIS BEREITS VORHANDEN? ======
+    cached_path = result_store.lookup(key)
+    if cached_path:
+        print(f"♻️ Serving cached result for job {job.id}: {cached_path}")
+        publish_result(job, cached_path)
+        return
+
+    metadata = metadata_cache.peek(params['url'])
+    plan = plan_job_transcode(job, metadata)
+
+    # ====== ARBEITSORDNER MIT PLATZRESERVIERUNG ======
+    work_dir = admit_work_dir(job, plan, metadata)
+    job.work_dir = work_dir.path
+    try:
+        downloaded_file = download_to_work_dir(job, scheduler, work_dir, plan, trace)
+        # ====== DATEI IST FERTIG GELADEN ======
+        # In den Result-Store übernehmen, damit identische Anfragen sie wiederverwenden
+        with trace.phase('store'):
+            stored_path = result_store.put(key, downloaded_file)
+    finally:
+        # Auch nach Fehler oder Abbruch sofort aufräumen und die Reservierung freigeben
+        work_dir.release()
+    publish_result(job, stored_path)
+
+# Begrenzter Worker-Pool für alle Downloads (statt eines Threads pro Anfrage)
+job_scheduler = JobScheduler.from_env(run_download_job, backend=state_backend)
+
+# Verteilt Fortschritt an asynchrone SSE-Verbindungen (ASGI-Modus, siehe src/asgi.py)
+progress_broker = ProgressBroker()
+progress_broker.attach(job_scheduler)
+
+def record_job_outcome(job, index, event):
+    """Zählt beendete Jobs und ihre Gesamtdauer, sobald das letzte Ereignis veröffentlicht wird."""
+    # Gespiegelte Jobs zählt die Instanz, die sie ausführt
+    if event.get('status') in FINISHED_STATES and not job.remote:
+        jobs_finished.inc(status=event['status'])
+        job_seconds.observe(time.time() - job.created_at, status=event['status'])
+
+job_scheduler.add_listener(record_job_outcome)
+
+def parse_job_params(source):
+    """Liest die Download-Parameter aus Query-String oder JSON-Body; liefert (params, priority, error)."""
+    for name in ('url', 'type', 'quality', 'format', 'filename'):
+        if source.get(name) is not None and not isinstance(source.get(name), str):
+            return None, 0, f'{name} must be a string'
+    params = {
+        'url': source.get('url'),
+        'type': source.get('type'), # 'audio' or 'video'
+        'quality': source.get('quality'), # format_id
+        'format': source.get('format'), # e.g., 'mp3', 'mp4'
+        'filename': source.get('filename') or str(uuid.uuid4()),
+    }
+    if not all([params['url'], params['type'], params['quality'], params['format']]):
+        return None, 0, 'Missing required parameters'
+    if params['type'] not in ('audio', 'video'):
+        return None, 0, "type must be 'audio' or 'video'"
+    try:
+        priority = int(source.get('priority', 0))
+    except (TypeError, ValueError):
+        return None, 0, 'priority must be an integer'
+    return params, priority, None
+
+def client_id():
+    """Identifiziert den Client für die faire Verteilung der Worker."""
+    return request.headers.get('X-Client-Id') or request.remote_addr
+
+def stream_job_events(job, cursor=0, filename=None):
+    """SSE-Generator, der die Fortschrittsereignisse eines Jobs ab `cursor` an einen Client weiterreicht."""
+    job_scheduler.subscribe(job)
+    try:
+        while True:
+            events = job.wait_events(cursor, timeout=heartbeat_interval())
+            if not events and not job.finished:
+                # Keepalive hält Proxys offen und erkennt getrennte Clients
+                yield ": keepalive\n\n"
+                continue
+            for event in events:
+                yield format_sse(cursor, result_event_for(event, filename))
+                cursor += 1
+            if job.finished and cursor >= len(job.events):
+                break
+    finally:
+        # Ohne Wiederverbinden (AUTO_CANCEL_GRACE) bricht ein getrennter Client Jobs mit auto_cancel ab
+        job_scheduler.unsubscribe(job)
+
+# SSE-Header: kein Caching, kein Puffern in nginx
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+def sse_response(job, filename=None):
+    """SSE-Antwort für einen Job; setzt nach einem Reconnect bei Last-Event-ID fort."""
+    cursor = resume_cursor(request.headers.get('Last-Event-ID') or request.args.get('last_event_id'))
+    return Response(stream_with_context(stream_job_events(job, cursor, filename)), mimetype='text/event-stream',
+                    headers=SSE_HEADERS)
+
+# Begrenzung für gleichzeitige Direkt-Streams (?stream=1)
+stream_slots = StreamSlots.from_env()
+
+def count_served(chunks, mode):
+    """Zählt die ausgelieferten Bytes eines Antwort-Iterators; `close()` wird weitergereicht."""
+    try:
+        for chunk in chunks:
+            served_bytes.inc(len(chunk), mode=mode)
+            yield chunk
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close:
+            close()
+
+def stream_download(params):
+    """Streamt das Medium direkt in die HTTP-Antwort, ohne es im Temp-Ordner abzulegen."""
+    if not stream_slots.try_acquire():
+        return Response(json.dumps({'error': 'Too many concurrent streams'}), status=503,
+                        mimetype='application/json', headers={'Retry-After': '5'})
+
+    cookie_path = None
+    try:
+        # ====== COOKIES EINBINDEN ======
+        cookie_path = setup_cookies()
+        ydl_opts = {'quiet': True, 'noplaylist': True, 'format': params['quality'], **extractor_options()}
         if cookie_path:
             ydl_opts['cookiefile'] = cookie_path
-            
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(video_url, download=False)
-            
-            video_formats = []
-            audio_formats = []
-            
-            # Regulärer Ausdruck, um die Qualität (z.B. 1080p) aus dem format_note zu extrahieren
-            quality_re = re.compile(r'(\d{3,4}p)')
-
-            for f in info.get('formats', []):
-                # Ignoriere Formate ohne Audio und Video (z.B. nur Storyboards)
-                if f.get('acodec') == 'none' and f.get('vcodec') == 'none':
-                    continue
-
-                filesize = f.get('filesize') or f.get('filesize_approx')
-                filesize_str = f"{filesize / (1024*1024):.2f} MB" if filesize else "N/A"
-
-                # Für Videoformate (mit Video-Codec)
-                if f.get('vcodec') != 'none':
-                    # Extrahiere Qualität aus format_note, sonst Fallback
-                    quality_match = quality_re.search(f.get('format_note', ''))
-                    quality = quality_match.group(1) if quality_match else f.get('resolution', 'N/A')
-                    
-                    video_formats.append({
-                        'format_id': f['format_id'],
-                        'quality': quality,
-                        'ext': f.get('ext'),
-                        'filesize': filesize_str,
-                        'has_audio': f.get('acodec') != 'none'
-                    })
-                
-                # Für reine Audioformate (kein Video-Codec)
-                elif f.get('vcodec') == 'none' and f.get('acodec') != 'none':
-                    audio_formats.append({
-                        'format_id': f['format_id'],
-                        'quality': f"{f.get('abr')}k" if f.get('abr') else "Beste",
-                        'ext': f.get('ext'),
-                        'filesize': filesize_str
-                    })
-
-            # Sortiere Formate
-            video_formats.sort(key=lambda x: int(x['quality'].replace('p', '')) if x['quality'][:-1].isdigit() else 0, reverse=True)
-            audio_formats.sort(key=lambda x: int(x['quality'].replace('k', '')) if x['quality'][:-1].isdigit() else 0, reverse=True)
-
-            response_data = {
-                'title': info.get('title'),
-                'duration': parse_duration(info.get('duration')),
-                'thumbnail': info.get('thumbnail'),
-                'video_formats': video_formats,
-                'audio_formats': audio_formats
-            }
-            return Response(json.dumps(response_data), status=200, mimetype='application/json')
+            info = ydl.extract_info(params['url'], download=False)
 
+        plan = StreamPlan(selected_formats(info), params['type'], params['format'])
+        if plan.passthrough:
+            body = iter_passthrough(plan.formats[0])
+        else:
+            body = iter_ffmpeg(plan.ffmpeg_command())
+        started = time.monotonic()
+    except StreamingUnsupported as e:
+        stream_slots.release()
+        return Response(json.dumps({'error': str(e)}), status=422, mimetype='application/json')
     except Exception as e:
+        stream_slots.release()
         return Response(json.dumps({'error': str(e)}), status=500, mimetype='application/json')
     finally:
         # ====== COOKIES AUFRÄUMEN ======
         cleanup_cookies(cookie_path)
 
+    headers = {
+        'Content-Disposition': content_disposition(f"{params['filename']}.{params['format']}"),
+        'X-Stream-Mode': 'passthrough' if plan.passthrough else 'ffmpeg',
+        'Cache-Control': 'no-store',
+    }
+    def finished():
+        stream_slots.release()
+        phase_seconds.observe(time.monotonic() - started, phase='stream')
+
+    # Slot wird frei, sobald der Client fertig ist oder die Verbindung abbricht
+    return Response(ClosingIterator(count_served(body, 'stream'), finished), mimetype=plan.mimetype, headers=headers)
+
 @youtube_bp.route('/download')
 def download_video():
-    """Handles the video download request via SSE with selectable options."""
-    video_url = request.args.get('url')
-    download_type = request.args.get('type') # 'audio' or 'video'
-    quality = request.args.get('quality') # format_id
-    output_format = request.args.get('format') # e.g., 'mp3', 'mp4'
-    filename = request.args.get('filename', str(uuid.uuid4()))
+    """Handles the video download request via SSE with selectable options.
 
-    if not all([video_url, download_type, quality, output_format]):
-        return Response(json.dumps({'error': 'Missing required parameters'}), status=400, mimetype='application/json')
+    Mit `stream=1` werden die Mediendaten direkt ausgeliefert statt per SSE-Fortschritt.
+    """
+    params, priority, error = parse_job_params(request.args)
+    if error:
+        return Response(json.dumps({'error': error}), status=400, mimetype='application/json')
 
-    # ====== TEMPORÄRER ORDNER FÜR DOWLOADS ======
-    temp_dir = tempfile.mkdtemp()
-    print(f"📁 Created temporary directory: {temp_dir}")
-    
-    def cleanup_temp_dir():
-        """Löscht den temporären Ordner nach dem Download"""
-        try:
-            if os.path.exists(temp_dir):
-                shutil.rmtree(temp_dir)
-                print(f"🧹 Deleted temporary directory: {temp_dir}")
-        except Exception as e:
-            print(f"⚠️ Error deleting temporary directory: {e}")
-
-    @after_this_request
-    def remove_temp_dir(response):
-        """Stellt sicher, dass der temporäre Ordner nach der Antwort gelöscht wird"""
-        cleanup_temp_dir()
-        return response
-
-    def generate_stream():
-        q = Queue()
-        downloaded_file = None
-        cookie_path = None
-        
-        try:
-            # ====== COOKIES EINBINDEN ======
-            cookie_path = setup_cookies()
-
-            def download_thread(options):
-                nonlocal downloaded_file
-                try:
-                    options['outtmpl'] = os.path.join(temp_dir, f'{filename}.%(ext)s')
-                    
-                    with yt_dlp.YoutubeDL(options) as ydl:
-                        ydl.download([video_url])
-                        # Finde die heruntergeladene Datei
-                        for f in os.listdir(temp_dir):
-                            if f.startswith(filename):
-                                downloaded_file = os.path.join(temp_dir, f)
-                                break
-                except Exception as e:
-                    q.put({'status': 'error', 'message': str(e)})
-                finally:
-                    q.put({'status': 'done'}) # Signal completion
-
-            def progress_hook(d):
-                q.put(d)
-
-            # Bestimme den Pfad zu ffmpeg – funktioniert auf allen Systemen
-            ffmpeg_path = os.path.abspath('ffmpeg')
-            if os.name == 'nt':  # Wenn Windows
-                ffmpeg_path += '.exe'
-            
-            # Build yt-dlp options dynamically
-            ydl_opts = {
-                'format': 'bestvideo+bestaudio/best',
-                'noplaylist': True,
-                'ffmpeg_location': ffmpeg_path,
-                'cookiefile': cookie_path,  # falls du Cookies nutzt
-                # Optional: Falls du nur Audio willst
-                # 'postprocessors': [{
-                #     'key': 'FFmpegExtractAudio',
-                #     'preferredcodec': 'mp3',
-                # }],
-            }
-            
-            # ====== COOKIES EINBINDEN ======
-            if cookie_path:
-                ydl_opts['cookiefile'] = cookie_path
-
-            if download_type == 'audio':
-                ydl_opts['format'] = quality # Select best audio format
-                ydl_opts['postprocessors'] = [{
-                    'key': 'FFmpegExtractAudio',
-                    'preferredcodec': output_format, # mp3, aac, etc.
-                    'preferredquality': '192', # Standard quality
-                }]
-            elif download_type == 'video':
-                ydl_opts['format'] = quality
-                ydl_opts['postprocessors'] = [{
-                    'key': 'FFmpegVideoConvertor',
-                    'preferedformat': output_format, # mp4, mkv, etc.
-                }] if output_format != 'mp4' else [] # Only convert if necessary
-            
-            # Start download in background
-            thread = Thread(target=download_thread, args=(ydl_opts,))
-            thread.start()
-
-            # Stream progress updates from queue
-            while True:
-                data_dict = q.get()
-
-                if data_dict['status'] == 'done':
-                    break
-                
-                if data_dict['status'] == 'error':
-                    yield f"data: {json.dumps(data_dict)}\n\n"
-                    break
-
-                progress = {}
-                if data_dict['status'] == 'downloading':
-                    percent_str = data_dict.get('_percent_str', '0%').strip().replace('%', '')
-                    progress = {
-                        'percent': float(ansi_escape.sub('', percent_str).strip()),
-                        'status': 'downloading',
-                        'message': f"Downloading: {data_dict.get('_percent_str', '')} of {data_dict.get('_total_bytes_str', '')} at {data_dict.get('_speed_str', '')} ETA {data_dict.get('_eta_str', '')}"
-                    }
-                elif data_dict['status'] == 'finished':
-                    progress = {
-                        'percent': 100.0,
-                        'status': 'finished',
-                        'message': "Download abgeschlossen, Konvertierung läuft..."
-                    }
-
-                if progress:
-                    yield f"data: {json.dumps(progress)}\n\n"
-            
-            # ====== DATEI IST FERTIG GELADEN ======
-            if downloaded_file:
-                # Erstelle einen Download-Link für die Datei
-                file_url = f"/download_file/{os.path.basename(downloaded_file)}"
-                final_message = {
-                    'status': 'complete', 
-                    'message': 'Prozess abgeschlossen.',
-                    'file_url': file_url
-                }
-                yield f"data: {json.dumps(final_message)}\n\n"
-            else:
-                yield f"data: {json.dumps({'status': 'error', 'message': 'Download completed but file not found'})}\n\n"
-                
-        except Exception as e:
-            yield f"data: {json.dumps({'status': 'error', 'message': str(e)})}\n\n"
-        finally:
-            # ====== COOKIES AUFRÄUMEN ======
-            cleanup_cookies(cookie_path)
+    if request.args.get('stream') in ('1', 'true'):
+        return stream_download(params)
+
+    job = job_scheduler.submit(
+        params, priority=priority, client_id=client_id(), auto_cancel=True, dedup_key=job_result_key(params)
+    )
+    return sse_response(job, params['filename'])
+
+@youtube_bp.route('/jobs', methods=['POST'])
+def create_job():
+    """Legt einen Download-Job an, ohne auf dessen Fortschritt zu warten."""
+    body = request.get_json(silent=True)
+    if body is not None and not isinstance(body, dict):
+        return Response(json.dumps({'error': 'JSON object expected'}), status=400, mimetype='application/json')
+    params, priority, error = parse_job_params(body or {})
+    if error:
+        return Response(json.dumps({'error': error}), status=400, mimetype='application/json')
+
+    job = job_scheduler.submit(params, priority=priority, client_id=client_id(), dedup_key=job_result_key(params))
+    return Response(json.dumps(job_view(job, params['filename'])), status=202, mimetype='application/json')
+
+def job_view(job, filename=None):
+    """Job als JSON-Dict; der Download-Link trägt den Dateinamen des Anfragenden (`filename`)."""
+    data = job.to_dict()
+    if data['progress'] is not None:
+        data['progress'] = result_event_for(data['progress'], filename)
+    return data
 
-    return Response(stream_with_context(generate_stream()), mimetype='text/event-stream')
+@youtube_bp.route('/jobs/<job_id>')
+def get_job(job_id):
+    """Liefert Status und letzten Fortschritt eines Jobs."""
+    job = job_scheduler.get(job_id)
+    if job is None:
+        return Response(json.dumps({'error': 'Job not found'}), status=404, mimetype='application/json')
+    data = job_view(job, request.args.get('filename'))
+    data['queue_position'] = job_scheduler.queue_position(job)
+    return Response(json.dumps(data), status=200, mimetype='application/json')
+
+@youtube_bp.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Bricht einen wartenden oder laufenden Job ab."""
+    job = job_scheduler.cancel(job_id)
+    if job is None:
+        return Response(json.dumps({'error': 'Job not found'}), status=404, mimetype='application/json')
+    return Response(json.dumps(job.to_dict()), status=200, mimetype='application/json')
+
+@youtube_bp.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """Streamt den Fortschritt eines bestehenden Jobs per SSE."""
+    job = job_scheduler.get(job_id)
+    if job is None:
+        return Response(json.dumps({'error': 'Job not found'}), status=404, mimetype='application/json')
+    return sse_response(job, request.args.get('filename'))
 
 # ====== NEUER ENDPOINT: DATEI HERUNTERLADEN ======
 @youtube_bp.route('/download_file/<filename>')
 def serve_downloaded_file(filename):
-    """Liefert die heruntergeladene Datei und löscht sie danach"""
-    # Finde die Datei im temporären Ordner
-    temp_dir = tempfile.gettempdir()
-    file_path = os.path.join(temp_dir, filename)
-    
-    if not os.path.exists(file_path):
+    """Liefert eine Datei aus dem Result-Store (Range, ETag); während der Auslieferung ist sie vor Verdrängung geschützt"""
+    key = filename.split('.', 1)[0]
+    file_path = result_store.acquire(key)
+    if not file_path or os.path.basename(file_path) != filename:
+        if file_path:
+            result_store.release(key)
         return Response(json.dumps({'error': 'File not found'}), status=404, mimetype='application/json')
-    
-    # Lösche die Datei nach dem Senden
-    @after_this_request
-    def remove_file(response):
-        try:
-            os.remove(file_path)
-            print(f"🧹 Deleted file after download: {file_path}")
-            # Leere den temporären Ordner, falls leer
-            if not os.listdir(temp_dir):
-                os.rmdir(temp_dir)
-        except Exception as error:
-            print(f"⚠️ Error removing file: {error}")
-        return response
-    
-    return send_file(file_path, as_attachment=True, download_name=filename)
+
+    started = time.monotonic()
+
+    def finished(sent_bytes):
+        result_store.release(key)
+        phase_seconds.observe(time.monotonic() - started, phase='delivery')
+        served_bytes.inc(sent_bytes, mode='file')
+
+    # Referenz wird freigegeben, sobald die Antwort vollständig gesendet (oder abgebrochen) wurde
+    return file_response(file_path, request.args.get('name') or filename, on_close=finished)
+
+# ====== METRIKEN MIT WERT ZUM ABRUFZEITPUNKT ======
+def temp_disk_usage():
+    return {('results',): result_store.stats()['bytes'], ('work',): work_dirs.stats()['used_bytes']}
+
+def work_dir_events():
+    stats = work_dirs.stats()
+    return {(event,): stats[event] for event in ('admitted', 'waited', 'rejected', 'swept', 'recovered')}
+
+def cache_lookups():
+    metadata, results = metadata_cache.stats(), result_store.stats()
+    return {
+        ('metadata', 'hit'): metadata['hits'],
+        ('metadata', 'disk_hit'): metadata['disk_hits'],
+        ('metadata', 'coalesced'): metadata['coalesced'],
+        ('metadata', 'miss'): metadata['misses'],
+        ('results', 'hit'): results['hits'],
+        ('results', 'miss'): results['misses'],
+    }
+
+def cache_hit_ratio():
+    results = result_store.stats()
+    lookups = results['hits'] + results['misses']
+    return {
+        ('metadata',): metadata_cache.stats()['hit_rate'],
+        ('results',): results['hits'] / lookups if lookups else 0.0,
+    }
+
+metrics_registry.callback('jobs_active', 'Laufende Download-Jobs', job_scheduler.active_jobs)
+metrics_registry.callback('queue_depth', 'Wartende Download-Jobs', job_scheduler.queue_depth)
+metrics_registry.callback('sse_connections', 'Offene asynchrone SSE-Verbindungen', progress_broker.connection_count)
+metrics_registry.callback('streams_active', 'Laufende Direkt-Streams (?stream=1)', lambda: stream_slots.in_use())
+metrics_registry.callback('bandwidth_limit_bytes', 'Globales Bandbreitenbudget in Bytes/s (0 = unbegrenzt)', lambda: bandwidth_budget.limit or 0)
+metrics_registry.callback('bandwidth_active_transfers', 'Transfers, die sich das Budget gerade teilen', bandwidth_budget.active_count)
+metrics_registry.callback('fragment_workers', 'Aktuelle Fragment-Parallelität je Host', lambda: {(host,): level for host, level in fragment_concurrency.levels().items()}, ['host'])
+metrics_registry.callback('temp_disk_bytes', 'Belegter Speicher in Result-Store und Arbeitsordnern', temp_disk_usage, ['area'])
+metrics_registry.callback('work_dir_reserved_bytes', 'Reservierter Platz der laufenden Jobs im Arbeitsverzeichnis', lambda: work_dirs.stats()['reserved_bytes'])
+metrics_registry.callback('work_dir_free_bytes', 'Freier Platz auf dem Datenträger des Arbeitsverzeichnisses', lambda: work_dirs.stats()['free_bytes'])
+metrics_registry.callback('work_dir_events_total', 'Zulassung und Aufräumen von Arbeitsordnern', work_dir_events, ['event'], kind='counter')
+metrics_registry.callback('startup_seconds', 'Sekunden ab Prozessstart bis App bereit (app) bzw. yt-dlp vorgewärmt (warm)', lambda: {('app',): warmup.app_seconds, ('warm',): warmup.warm_seconds}, ['stage'])
+metrics_registry.callback('ytdlp_warm', 'yt-dlp vorgewärmt (1) oder kalt (0)', lambda: int(warmup.warm))
+metrics_registry.callback('cache_lookups_total', 'Cache-Zugriffe nach Ergebnis', cache_lookups, ['cache', 'result'], kind='counter')
+metrics_registry.callback('cache_hit_ratio', 'Trefferquote der Caches', cache_hit_ratio, ['cache'])
+
+def ready_endpoint():
+    """Readiness (wird in main.py unter /ready registriert): Warm-/Kaltzustand und Startzeiten.
+
+    Antwortet immer 200, sobald die App läuft; mit `?warm=1` nur im vorgewärmten Zustand (sonst 503).
+    """
+    status = warmup.status()
+    code = 503 if request.args.get('warm') in ('1', 'true') and not warmup.warm else 200
+    return Response(json.dumps(status), status=code, mimetype='application/json', headers={'Cache-Control': 'no-store'})
+
+def metrics_endpoint():
+    """Prometheus-Endpunkt (wird in main.py unter /metrics registriert)."""
+    return Response(metrics_registry.render(), status=200, content_type=MetricsRegistry.CONTENT_TYPE)
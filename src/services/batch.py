@@ -0,0 +1,94 @@
+import os
+import threading
+from urllib.parse import urlparse, parse_qs
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+def looks_like_playlist(url):
+    """Erkennt reine Playlist-URLs (z.B. youtube.com/playlist?list=...), die zuerst flach aufgelöst werden."""
+    parsed = urlparse(url)
+    query = parse_qs(parsed.query)
+    return ('list' in query and 'v' not in query) or parsed.path.rstrip('/').endswith('/playlist')
+
+
+class BatchAnalyzer:
+    """Analysiert viele URLs parallel auf einem begrenzten Pool.
+
+    Jeder Worker-Thread hält seine eigene YoutubeDL-Instanz (`create_ydl(flat)`) und
+    verwendet sie für alle URLs wieder. `analyze(url, ydl)` liefert die reduzierten Metadaten.
+    """
+
+    def __init__(self, analyze, create_ydl, workers=4, max_urls=200):
+        self.analyze = analyze
+        self.create_ydl = create_ydl
+        self.max_urls = max_urls
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='batch-analyze')
+        self._local = threading.local()
+
+    @classmethod
+    def from_env(cls, analyze, create_ydl):
+        """Erstellt den Analyzer aus BATCH_WORKERS und BATCH_MAX_URLS."""
+        return cls(
+            analyze,
+            create_ydl,
+            workers=int(os.environ.get('BATCH_WORKERS', 4)),
+            max_urls=int(os.environ.get('BATCH_MAX_URLS', 200)),
+        )
+
+    def _ydl(self, flat=False):
+        """YoutubeDL-Instanz des aktuellen Worker-Threads (wird einmal angelegt)."""
+        attr = 'flat_ydl' if flat else 'ydl'
+        ydl = getattr(self._local, attr, None)
+        if ydl is None:
+            ydl = self.create_ydl(flat)
+            setattr(self._local, attr, ydl)
+        return ydl
+
+    def _expand_playlist(self, url):
+        """Löst eine Playlist flach auf (ohne die einzelnen Videos zu laden)."""
+        info = self._ydl(flat=True).extract_info(url, download=False)
+        entries = []
+        for entry in info.get('entries') or []:
+            if not entry:
+                continue
+            entry_url = entry.get('url') or entry.get('webpage_url')
+            if entry_url:
+                entries.append({'url': entry_url, 'title': entry.get('title'), 'playlist': info.get('title')})
+        return entries
+
+    def expand(self, urls, playlists=()):
+        """Liefert (entries, errors): Einzel-URLs plus aufgelöste Playlist-Einträge in Eingabereihenfolge."""
+        sources = [(url, looks_like_playlist(url)) for url in urls] + [(url, True) for url in playlists]
+        futures = {
+            index: self._pool.submit(self._expand_playlist, url)
+            for index, (url, is_playlist) in enumerate(sources) if is_playlist
+        }
+        entries, errors = [], []
+        for index, (url, is_playlist) in enumerate(sources):
+            if not is_playlist:
+                entries.append({'url': url})
+                continue
+            try:
+                entries.extend(futures[index].result())
+            except Exception as e:
+                errors.append({'type': 'error', 'url': url, 'error': str(e)})
+        return entries[:self.max_urls], errors
+
+    def _analyze_one(self, url):
+        return self.analyze(url, self._ydl())
+
+    def iter_results(self, entries):
+        """Liefert die Ergebnisse in der Reihenfolge, in der sie fertig werden."""
+        futures = {self._pool.submit(self._analyze_one, entry['url']): index for index, entry in enumerate(entries)}
+        try:
+            for future in as_completed(futures):
+                index = futures[future]
+                entry = entries[index]
+                try:
+                    yield {'type': 'result', 'index': index, 'url': entry['url'], 'data': future.result()}
+                except Exception as e:
+                    yield {'type': 'error', 'index': index, 'url': entry['url'], 'error': str(e)}
+        finally:
+            # Client getrennt: noch nicht gestartete Extraktionen verwerfen
+            for future in futures:
+                future.cancel()
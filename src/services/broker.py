@@ -0,0 +1,103 @@
+import os
+import json
+import asyncio
+import threading
+
+# Ereignis-Status, nach denen ein Job keine weiteren Ereignisse mehr sendet
+TERMINAL_STATUSES = ('complete', 'error', 'cancelled')
+
+
+def heartbeat_interval():
+    """Sekunden zwischen SSE-Keepalive-Kommentaren (SSE_HEARTBEAT)."""
+    return float(os.environ.get('SSE_HEARTBEAT', 15))
+
+
+def format_sse(event_id, event):
+    """Formatiert ein Ereignis als SSE-Nachricht mit ID für Last-Event-ID."""
+    return f"id: {event_id}\ndata: {json.dumps(event)}\n\n"
+
+
+def resume_cursor(last_event_id):
+    """Liefert den Index des ersten noch nicht gesendeten Ereignisses nach einem Reconnect."""
+    try:
+        return int(last_event_id) + 1 if last_event_id not in (None, '') else 0
+    except ValueError:
+        return 0
+
+
+class ProgressBroker:
+    """Verteilt Job-Ereignisse aus den Worker-Threads an viele asyncio-SSE-Verbindungen.
+
+    Jede Verbindung bekommt eine eigene `asyncio.Queue`; wartende Verbindungen belegen
+    keinen Thread.
+    """
+
+    def __init__(self):
+        self._subscribers = {}  # job_id -> {queue: loop}
+        self._lock = threading.Lock()
+
+    def attach(self, scheduler):
+        scheduler.add_listener(self.publish)
+
+    def publish(self, job, index, event):
+        """Wird im Worker-Thread aufgerufen; reicht das Ereignis thread-sicher an alle Loops weiter."""
+        with self._lock:
+            subscribers = list(self._subscribers.get(job.id, {}).items())
+        for queue, loop in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, (index, event))
+            except RuntimeError:
+                # Event-Loop wurde bereits beendet
+                pass
+
+    def subscribe(self, job):
+        queue = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._subscribers.setdefault(job.id, {})[queue] = loop
+        return queue
+
+    def unsubscribe(self, job, queue):
+        with self._lock:
+            subscribers = self._subscribers.get(job.id)
+            if subscribers is not None:
+                subscribers.pop(queue, None)
+                if not subscribers:
+                    del self._subscribers[job.id]
+
+    def connection_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    async def stream(self, job, cursor=0, is_disconnected=None, transform=None):
+        """Asynchroner Generator mit SSE-Nachrichten ab `cursor`, inklusive Heartbeats.
+
+        `transform(event)` passt Ereignisse für diesen Abonnenten an (z.B. den Download-Link).
+        """
+        transform = transform or (lambda event: event)
+        queue = self.subscribe(job)
+        try:
+            # Erst abonnieren, dann nachholen – so geht kein Ereignis verloren
+            for index, event in enumerate(list(job.events)[cursor:], start=cursor):
+                yield format_sse(index, transform(event))
+                cursor = index + 1
+                if event.get('status') in TERMINAL_STATUSES:
+                    return
+            if job.finished and cursor >= len(job.events):
+                return
+            while True:
+                try:
+                    index, event = await asyncio.wait_for(queue.get(), timeout=heartbeat_interval())
+                except asyncio.TimeoutError:
+                    if is_disconnected is not None and await is_disconnected():
+                        return
+                    yield ": keepalive\n\n"
+                    continue
+                if index < cursor:
+                    continue
+                cursor = index + 1
+                yield format_sse(index, transform(event))
+                if event.get('status') in TERMINAL_STATUSES:
+                    return
+        finally:
+            self.unsubscribe(job, queue)
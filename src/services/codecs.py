@@ -0,0 +1,62 @@
+# Zuordnung von yt-dlp-Codec-Strings (z.B. 'avc1.640028', 'mp4a.40.2') zu Codec-Familien
+_CODEC_PREFIXES = (
+    ('avc', 'h264'), ('h264', 'h264'),
+    ('hev', 'h265'), ('hvc', 'h265'), ('h265', 'h265'),
+    ('vp09', 'vp9'), ('vp9', 'vp9'), ('vp8', 'vp8'),
+    ('av01', 'av1'), ('av1', 'av1'),
+    ('mp4a', 'aac'), ('aac', 'aac'),
+    ('opus', 'opus'), ('vorbis', 'vorbis'),
+    ('mp3', 'mp3'), ('mp4a.6b', 'mp3'), ('flac', 'flac'),
+    ('ac-3', 'ac3'), ('ac3', 'ac3'), ('ec-3', 'eac3'), ('eac3', 'eac3'),
+)
+
+# Welche Codecs ein Video-Container ohne Neukodierung aufnehmen kann (None = alle)
+VIDEO_CONTAINER_CODECS = {
+    'mp4': ({'h264', 'h265', 'av1', 'vp9'}, {'aac', 'mp3', 'opus', 'ac3', 'eac3', 'flac'}),
+    'mov': ({'h264', 'h265'}, {'aac', 'mp3', 'ac3'}),
+    'mkv': (None, None),
+    'webm': ({'vp8', 'vp9', 'av1'}, {'opus', 'vorbis'}),
+}
+
+# Audio-Zielformate: Codec-Familie, ffmpeg-Encoder und Muxer für Pipe-Ausgabe
+AUDIO_TARGETS = {
+    'mp3': {'codec': 'mp3', 'encoder': 'libmp3lame', 'muxer': 'mp3', 'mimetype': 'audio/mpeg'},
+    'm4a': {'codec': 'aac', 'encoder': 'aac', 'muxer': 'mp4', 'mimetype': 'audio/mp4'},
+    'aac': {'codec': 'aac', 'encoder': 'aac', 'muxer': 'adts', 'mimetype': 'audio/aac'},
+    'opus': {'codec': 'opus', 'encoder': 'libopus', 'muxer': 'opus', 'mimetype': 'audio/ogg'},
+    'ogg': {'codec': 'vorbis', 'encoder': 'libvorbis', 'muxer': 'ogg', 'mimetype': 'audio/ogg'},
+    'vorbis': {'codec': 'vorbis', 'encoder': 'libvorbis', 'muxer': 'ogg', 'mimetype': 'audio/ogg'},
+    'flac': {'codec': 'flac', 'encoder': 'flac', 'muxer': 'flac', 'mimetype': 'audio/flac'},
+    'wav': {'codec': 'pcm', 'encoder': 'pcm_s16le', 'muxer': 'wav', 'mimetype': 'audio/wav'},
+}
+
+# Video-Zielformate: Muxer, Standard-Encoder bei Neukodierung und MIME-Typ
+VIDEO_TARGETS = {
+    'mp4': {'muxer': 'mp4', 'vencoder': 'libx264', 'aencoder': 'aac', 'mimetype': 'video/mp4'},
+    'mov': {'muxer': 'mov', 'vencoder': 'libx264', 'aencoder': 'aac', 'mimetype': 'video/quicktime'},
+    'mkv': {'muxer': 'matroska', 'vencoder': 'libx264', 'aencoder': 'aac', 'mimetype': 'video/x-matroska'},
+    'webm': {'muxer': 'webm', 'vencoder': 'libvpx-vp9', 'aencoder': 'libopus', 'mimetype': 'video/webm'},
+}
+
+
+def codec_family(codec):
+    """Normalisiert einen Codec-String; None für fehlende oder 'none', unbekannte Codecs als Präfix vor dem ersten Punkt."""
+    if not codec or codec == 'none':
+        return None
+    codec = codec.lower()
+    for prefix, family in sorted(_CODEC_PREFIXES, key=lambda item: -len(item[0])):
+        if codec.startswith(prefix):
+            return family
+    return codec.split('.', 1)[0]
+
+
+def container_accepts(container, vcodec=None, acodec=None):
+    """Prüft, ob ein Container die (normalisierten) Codecs ohne Neukodierung aufnehmen kann."""
+    if container not in VIDEO_CONTAINER_CODECS:
+        return False
+    video_ok, audio_ok = VIDEO_CONTAINER_CODECS[container]
+    if vcodec and video_ok is not None and vcodec not in video_ok:
+        return False
+    if acodec and audio_ok is not None and acodec not in audio_ok:
+        return False
+    return True
@@ -0,0 +1,184 @@
+import io
+import os
+import re
+import mimetypes
+from urllib.parse import quote
+from flask import request, Response
+from werkzeug.http import http_date, parse_date
+
+# Größe der Blöcke, wenn der Server kein sendfile anbietet
+CHUNK_SIZE = 256 * 1024
+
+_range_re = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class _TrackedFile(io.FileIO):
+    """Datei, die beim Schließen `on_close(sent_bytes)` auslöst (z.B. Referenz im Result-Store freigeben).
+
+    Als gesendet gilt, was ab `start` gelesen wurde (höchstens `length` Bytes). Bei sendfile setzt
+    `socket.sendfile` die Position per `seek` hinter die gesendeten Bytes (gunicorn setzt sie danach
+    wieder zurück), daher zählt die weiteste Position.
+    """
+
+    def __init__(self, path, on_close=None, start=0, length=0):
+        super().__init__(path, 'rb')
+        self._on_close = on_close
+        self._start = start
+        self._length = length
+        self._furthest = start
+        self.seek(start)
+
+    def seek(self, pos, whence=os.SEEK_SET):
+        position = super().seek(pos, whence)
+        self._furthest = max(self._furthest, position)
+        return position
+
+    def close(self):
+        if self.closed:
+            return
+        sent = min(max(max(self.tell(), self._furthest) - self._start, 0), self._length)
+        super().close()
+        if self._on_close:
+            self._on_close(sent)
+
+
+class _RangeIterator:
+    """Liest genau `length` Bytes ab der aktuellen Dateiposition in Blöcken."""
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def __iter__(self):
+        while self.remaining > 0:
+            chunk = self.file.read(min(CHUNK_SIZE, self.remaining))
+            if not chunk:
+                break
+            self.remaining -= len(chunk)
+            yield chunk
+
+    def close(self):
+        self.file.close()
+
+
+def make_etag(stat):
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def parse_range(header, size):
+    """Liefert (start, end) für einen einzelnen Byte-Bereich, None ohne Range oder 'invalid'."""
+    if not header:
+        return None
+    match = _range_re.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        # Mehrere Bereiche werden nicht unterstützt -> komplette Datei senden
+        return None if ',' in header else 'invalid'
+    first, last = match.groups()
+    if first == '':
+        length = int(last)
+        if length == 0:
+            return 'invalid'
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return 'invalid'
+    return start, end
+
+
+def _not_modified(etag, stat):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        return if_none_match.strip() == '*' or etag in [tag.strip() for tag in if_none_match.split(',')]
+    since = parse_date(request.headers.get('If-Modified-Since'))
+    return since is not None and int(stat.st_mtime) <= since.timestamp()
+
+
+def _mimetype(download_name):
+    return mimetypes.guess_type(download_name)[0] or 'application/octet-stream'
+
+
+def content_disposition(download_name):
+    ascii_name = download_name.encode('ascii', 'ignore').decode('ascii').replace('"', '') or 'download'
+    return f'attachment; filename="{ascii_name}"; filename*=UTF-8\'\'{quote(download_name)}'
+
+
+def file_response(file_path, download_name, on_close=None, mode=None):
+    """Liefert eine Datei mit Range/206, ETag und Last-Modified aus.
+
+    `mode` (bzw. DELIVERY_MODE) wählt die Übertragung: 'direct' nutzt `wsgi.file_wrapper`
+    (sendfile nur unter gunicorn, siehe src/gunicorn.conf.py; uvicorn und der Flask-Server senden
+    in Blöcken), 'x-accel' und 'x-sendfile' übergeben an einen Proxy. Dabei endet die Referenz
+    mit der Übergabe, bevor der Proxy liest: die Datei schützt dann nur RESULT_MIN_RETENTION
+    (ab dem letzten Zugriff), das länger sein muss als die langsamste Übertragung.
+    `on_close(sent_bytes)` wird aufgerufen, sobald die Datei nicht mehr gebraucht wird – mit der
+    Anzahl gesendeter Body-Bytes (0 bei 304, 416, HEAD und Übergabe an den Proxy). Das kann noch
+    innerhalb dieses Aufrufs passieren.
+    """
+    mode = mode or os.environ.get('DELIVERY_MODE', 'direct')
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        if on_close:
+            on_close(0)
+        raise
+
+    etag = make_etag(stat)
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(stat.st_mtime),
+        'Accept-Ranges': 'bytes',
+        'Cache-Control': 'private, max-age=0, must-revalidate',
+        'Content-Disposition': content_disposition(download_name),
+    }
+
+    # ====== ÜBERGABE AN DEN FRONT-PROXY ======
+    if mode in ('x-accel', 'x-sendfile'):
+        if on_close:
+            on_close(0)
+        if mode == 'x-accel':
+            prefix = os.environ.get('DELIVERY_ACCEL_PREFIX', '/protected/').rstrip('/')
+            headers['X-Accel-Redirect'] = f'{prefix}/{quote(os.path.basename(file_path))}'
+        else:
+            headers['X-Sendfile'] = os.path.abspath(file_path)
+        return Response(status=200, headers=headers, mimetype=_mimetype(download_name))
+
+    if _not_modified(etag, stat):
+        if on_close:
+            on_close(0)
+        return Response(status=304, headers=headers)
+
+    size = stat.st_size
+    byte_range = parse_range(request.headers.get('Range'), size)
+    if_range = request.headers.get('If-Range')
+    if byte_range and if_range and if_range.strip() != etag:
+        # Datei hat sich geändert -> komplette Datei statt Teilbereich
+        byte_range = None
+    if byte_range == 'invalid':
+        if on_close:
+            on_close(0)
+        headers['Content-Range'] = f'bytes */{size}'
+        return Response(status=416, headers=headers)
+
+    if request.method == 'HEAD':
+        if on_close:
+            on_close(0)
+        headers['Content-Length'] = str(size)
+        return Response(status=200, headers=headers, mimetype=_mimetype(download_name))
+
+    start, end = byte_range or (0, size - 1)
+    length = max(end - start + 1, 0)
+    status = 206 if byte_range else 200
+    if byte_range:
+        headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+    headers['Content-Length'] = str(length)
+
+    file = _TrackedFile(file_path, on_close, start, length)
+    file_wrapper = request.environ.get('wsgi.file_wrapper')
+    if file_wrapper and end == size - 1:
+        # Zero-Copy: der WSGI-Server überträgt die Datei per sendfile ab der aktuellen Position
+        body = file_wrapper(file, CHUNK_SIZE)
+    else:
+        body = _RangeIterator(file, length)
+    return Response(body, status=status, headers=headers, mimetype=_mimetype(download_name),
+                    direct_passthrough=True)
@@ -0,0 +1,555 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import socket
+import sqlite3
+import itertools
+import threading
+from threading import Thread
+
+# Status-Werte eines Jobs
+QUEUED = 'queued'
+RUNNING = 'running'
+COMPLETE = 'complete'
+ERROR = 'error'
+CANCELLED = 'cancelled'
+FINISHED_STATES = (COMPLETE, ERROR, CANCELLED)
+
+# Gültigkeit einer Job-Übernahme im gemeinsamen Backend; ohne Erneuerung übernimmt eine andere Instanz
+LEASE_SECONDS = 30
+# Abstand zwischen dem Löschen abgelaufener Jobs aus dem Job-Speicher bzw. gemeinsamen Backend
+PURGE_INTERVAL = 60
+
+
+class JobCancelled(Exception):
+    """Wird im Worker ausgelöst, wenn ein laufender Job abgebrochen wurde."""
+
+
+class Job:
+    """Ein Download-Auftrag inklusive Fortschrittsereignissen für die Abonnenten."""
+
+    _PERSISTED_FIELDS = (
+        'id', 'params', 'priority', 'client_id', 'status', 'created_at', 'started_at',
+        'finished_at', 'work_dir', 'file_path', 'error', 'auto_cancel', 'dedup_key', 'trace',
+        'transcode',
+    )
+
+    def __init__(self, params, priority=0, client_id=None, auto_cancel=False, job_id=None, dedup_key=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.params = params
+        self.dedup_key = dedup_key
+        self.priority = priority
+        self.client_id = client_id or 'anonymous'
+        self.auto_cancel = auto_cancel
+        self.status = QUEUED
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.work_dir = None
+        self.file_path = None
+        self.error = None
+        self.trace = []  # Zeitmessung der einzelnen Phasen (siehe metrics.JobTrace)
+        self.transcode = None  # Entscheidung des Transcode-Planers (siehe transcode.TranscodePlan)
+        self.events = []
+        self.synced = 0  # Anzahl der Ereignisse, die bereits im gemeinsamen Backend liegen
+        self.remote = False  # Läuft auf einer anderen Instanz; Zustand wird aus dem Backend gespiegelt
+        self.mirror_lock = threading.Lock()  # Nur ein Thread spiegelt gleichzeitig (Sync-Thread, Worker)
+        self.subscribers = 0
+        self.orphaned_at = None  # Seit wann ohne Abonnenten (für auto_cancel)
+        self.cancel_requested = threading.Event()
+        self.seq = None
+        self.listeners = []
+        self._cond = threading.Condition()
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATES
+
+    @property
+    def final_event_published(self):
+        """True, sobald das letzte Ereignis (complete/error/cancelled) veröffentlicht wurde."""
+        return bool(self.events) and self.events[-1].get('status') in FINISHED_STATES
+
+    def publish(self, event):
+        """Hängt ein Fortschrittsereignis an und weckt wartende Abonnenten.
+
+        Die Position in `events` dient als SSE-Event-ID (Last-Event-ID).
+        """
+        with self._cond:
+            index = len(self.events)
+            self.events.append(event)
+            self._cond.notify_all()
+            for listener in self.listeners:
+                listener(self, index, event)
+
+    def wait_events(self, cursor, timeout=None):
+        """Liefert alle Ereignisse ab `cursor`; blockiert bis neue vorliegen oder der Job endet."""
+        with self._cond:
+            if cursor >= len(self.events) and not self.finished:
+                self._cond.wait(timeout)
+            return self.events[cursor:]
+
+    def set_status(self, status, **fields):
+        with self._cond:
+            self.status = status
+            for name, value in fields.items():
+                setattr(self, name, value)
+            self._cond.notify_all()
+
+    def to_dict(self):
+        data = {name: getattr(self, name) for name in self._PERSISTED_FIELDS}
+        data['progress'] = self.events[-1] if self.events else None
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        job = cls(data['params'], data['priority'], data['client_id'], data['auto_cancel'], data['id'], data.get('dedup_key'))
+        for name in cls._PERSISTED_FIELDS:
+            setattr(job, name, data.get(name))
+        job.trace = job.trace or []
+        return job
+
+
+class JobStore:
+    """Speichert Jobdatensätze optional in SQLite, damit die Warteschlange Neustarts übersteht.
+
+    Nur für einen Prozess; für mehrere Instanzen siehe state.StateBackend.
+    """
+
+    shared = False
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path
+        if self.db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            with self._connect() as conn:
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS jobs '
+                    '(id TEXT PRIMARY KEY, status TEXT NOT NULL, record TEXT NOT NULL, updated_at REAL NOT NULL)'
+                )
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=5)
+
+    def save(self, job):
+        if not self.db_path:
+            return
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO jobs (id, status, record, updated_at) VALUES (?, ?, ?, ?)',
+                    (job.id, job.status, json.dumps(job.to_dict()), time.time()),
+                )
+        except sqlite3.Error as e:
+            print(f"⚠️ Job store write failed: {e}")
+
+    def purge(self, finished_before):
+        """Löscht abgeschlossene Jobs, deren letzte Änderung vor `finished_before` liegt."""
+        if not self.db_path:
+            return
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    f'DELETE FROM jobs WHERE status IN ({",".join("?" * len(FINISHED_STATES))}) AND updated_at < ?',
+                    (*FINISHED_STATES, finished_before),
+                )
+        except sqlite3.Error as e:
+            print(f"⚠️ Job store write failed: {e}")
+
+    def load_unfinished(self):
+        """Liefert alle Jobs, die beim letzten Beenden noch nicht fertig waren."""
+        if not self.db_path:
+            return []
+        with self._connect() as conn:
+            rows = conn.execute(
+                'SELECT record FROM jobs WHERE status IN (?, ?) ORDER BY updated_at', (QUEUED, RUNNING)
+            ).fetchall()
+        return [Job.from_dict(json.loads(row[0])) for row in rows]
+
+
+class JobScheduler:
+    """Begrenzter Worker-Pool mit Prioritäten und fairer Verteilung zwischen Clients.
+
+    `runner(job, scheduler)` führt einen Job aus. Netzwerk-Downloads werden durch die
+    Anzahl der Worker begrenzt, ffmpeg-Nachbearbeitung zusätzlich durch `postprocess_slots`.
+
+    Mit einem gemeinsamen `store` (state.StateBackend) holen die Worker aller Instanzen ihre Jobs
+    aus derselben Warteschlange; Jobs anderer Instanzen werden samt Fortschritt gespiegelt, damit
+    jede Instanz SSE-Streams und Status bedienen kann.
+    """
+
+    def __init__(self, runner, download_workers=2, postprocess_workers=1, retention=3600, store=None,
+                 poll_interval=0.5, cancel_grace=15):
+        self.runner = runner
+        self.download_workers = download_workers
+        self.retention = retention
+        # Jobs mit auto_cancel überstehen einen kurzen Verbindungsabbruch (Wiederverbinden per Last-Event-ID)
+        self.cancel_grace = cancel_grace
+        self.store = store or JobStore()
+        self.postprocess_slots = threading.BoundedSemaphore(postprocess_workers)
+        self._jobs = {}
+        self._active_by_key = {}
+        self._pending = []
+        self._running_per_client = {}
+        self._last_served = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._workers = []
+        self._listeners = []
+        self._started = False
+        # Gemeinsamer Betrieb: Kennung dieser Instanz für die Leases
+        self.poll_interval = poll_interval
+        self.owner = f'{socket.gethostname()}:{os.getpid()}'
+        self._last_renew = 0.0
+        self._last_purge = 0.0
+        if self.store.shared:
+            self._listeners.append(self._persist_event)
+
+    @classmethod
+    def from_env(cls, runner, backend=None):
+        """Erstellt den Scheduler aus den Umgebungsvariablen DOWNLOAD_WORKERS, POSTPROCESS_WORKERS usw.
+
+        Mit `backend` (siehe state.state_backend_from_env) teilen sich mehrere Instanzen die Jobs.
+        """
+        return cls(
+            runner,
+            download_workers=int(os.environ.get('DOWNLOAD_WORKERS', 2)),
+            postprocess_workers=int(os.environ.get('POSTPROCESS_WORKERS', 1)),
+            retention=float(os.environ.get('JOB_RETENTION', 3600)),
+            store=backend or JobStore(os.environ.get('JOBS_DB') or None),
+            poll_interval=float(os.environ.get('STATE_POLL_INTERVAL', 0.5)),
+            cancel_grace=float(os.environ.get('AUTO_CANCEL_GRACE', 15)),
+        )
+
+    def add_listener(self, listener):
+        """Registriert `listener(job, index, event)` für alle neuen Fortschrittsereignisse."""
+        self._listeners.append(listener)
+
+    def start(self):
+        """Startet die Worker-Threads und übernimmt unfertige Jobs aus dem Speicher."""
+        with self._cond:
+            if self._started:
+                return
+            self._started = True
+            for job in self.store.load_unfinished():
+                # Unterbrochene Jobs beginnen von vorne
+                job.set_status(QUEUED, started_at=None)
+                job.auto_cancel = False
+                self._enqueue(job)
+                print(f"♻️ Requeued job {job.id} after restart")
+        for i in range(self.download_workers):
+            worker = Thread(target=self._worker_loop, name=f'download-worker-{i}', daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        if self.store.shared:
+            Thread(target=self._sync_loop, name='state-sync', daemon=True).start()
+
+    # ====== WARTESCHLANGE ======
+    def _register(self, job):
+        """Muss mit gehaltenem Lock aufgerufen werden."""
+        job.seq = next(self._seq)
+        job.listeners = self._listeners
+        self._jobs[job.id] = job
+        if job.dedup_key and not job.finished:
+            self._active_by_key[job.dedup_key] = job
+
+    def _enqueue(self, job):
+        """Muss mit gehaltenem Lock aufgerufen werden."""
+        self._register(job)
+        if self.store.shared:
+            # Die Warteschlange liegt im Backend (store.save); bis ein Worker dieser Instanz den Job
+            # übernimmt, wird er wie ein fremder gespiegelt. Lokale Worker nur wecken.
+            job.remote = True
+            self._cond.notify()
+            return
+        self._pending.append(job)
+        self._cond.notify()
+
+    def _release_key(self, job):
+        """Muss mit gehaltenem Lock aufgerufen werden."""
+        if job.dedup_key and self._active_by_key.get(job.dedup_key) is job:
+            del self._active_by_key[job.dedup_key]
+
+    def submit(self, params, priority=0, client_id=None, auto_cancel=False, dedup_key=None):
+        """Legt einen neuen Job an und reiht ihn in die Warteschlange ein.
+
+        Läuft bereits ein Job mit demselben `dedup_key`, wird stattdessen dieser geliefert.
+        """
+        self.start()
+        existing = None
+        if dedup_key and self.store.shared:
+            # Läuft derselbe Download bereits auf dieser oder einer anderen Instanz?
+            active_id = self.store.active_job(dedup_key)
+            existing = self.get(active_id) if active_id else None
+        with self._cond:
+            existing = existing or (self._active_by_key.get(dedup_key) if dedup_key else None)
+            if existing is not None and not existing.finished and not existing.cancel_requested.is_set():
+                # Nur abbrechen, wenn keiner der Auftraggeber den Job unabhängig behalten will
+                existing.auto_cancel = existing.auto_cancel and auto_cancel
+                existing.priority = max(existing.priority, priority)
+                print(f"🔗 Attached request to running job {existing.id}")
+                return existing
+        job = Job(params, priority=priority, client_id=client_id, auto_cancel=auto_cancel, dedup_key=dedup_key)
+        queued = self.store.queue_depth() if self.store.shared else None
+        self._purge_store()
+        with self._cond:
+            self._purge_expired()
+            self._enqueue(job)
+            job.publish({
+                'status': QUEUED,
+                'message': 'Download in Warteschlange...',
+                'job_id': job.id,
+                # Lokal ist der Job bereits in `_pending` enthalten
+                'position': queued + 1 if self.store.shared else len(self._pending),
+            })
+        self.store.save(job)
+        return job
+
+    def _pick_next(self):
+        """Höchste Priorität zuerst; bei Gleichstand der Client mit den wenigsten laufenden Jobs."""
+        return min(
+            self._pending,
+            key=lambda job: (
+                -job.priority,
+                self._running_per_client.get(job.client_id, 0),
+                self._last_served.get(job.client_id, 0.0),
+                job.seq,
+            ),
+        )
+
+    def queue_position(self, job):
+        if self.store.shared:
+            return self.store.queue_position(job.id)
+        with self._cond:
+            if job not in self._pending:
+                return 0
+            return sorted(self._pending, key=lambda j: (-j.priority, j.seq)).index(job) + 1
+
+    def queue_depth(self):
+        if self.store.shared:
+            return self.store.queue_depth()
+        with self._cond:
+            return len(self._pending)
+
+    def active_jobs(self):
+        with self._cond:
+            return sum(self._running_per_client.values())
+
+    def get(self, job_id):
+        """Liefert einen Job; im gemeinsamen Betrieb auch Jobs anderer Instanzen (gespiegelt)."""
+        with self._cond:
+            job = self._jobs.get(job_id)
+        if job is not None or not self.store.shared:
+            return job
+        record = self.store.load(job_id)
+        if record is None:
+            return None
+        job = Job.from_dict(record)
+        job.remote = True
+        job.events = self.store.events_since(job_id)
+        job.synced = len(job.events)
+        with self._cond:
+            # Ein anderer Thread kann den Job inzwischen angelegt haben
+            if job_id in self._jobs:
+                return self._jobs[job_id]
+            self._register(job)
+        return job
+
+    def _purge_expired(self):
+        """Entfernt abgeschlossene Jobs nach Ablauf der Aufbewahrungszeit. Muss mit Lock aufgerufen werden."""
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            if job.finished and job.finished_at and now - job.finished_at > self.retention:
+                del self._jobs[job_id]
+                if job.work_dir and os.path.exists(job.work_dir):
+                    shutil.rmtree(job.work_dir, ignore_errors=True)
+                    print(f"🧹 Deleted temporary directory: {job.work_dir}")
+
+    def _purge_store(self):
+        """Löscht abgelaufene Jobs auch aus dem Speicher (höchstens alle PURGE_INTERVAL Sekunden)."""
+        now = time.monotonic()
+        if now - self._last_purge < PURGE_INTERVAL:
+            return
+        self._last_purge = now
+        self.store.purge(time.time() - self.retention)
+
+    # ====== ABONNIEREN & ABBRECHEN ======
+    def subscribe(self, job):
+        with self._cond:
+            job.subscribers += 1
+            job.orphaned_at = None
+
+    def unsubscribe(self, job):
+        """Meldet einen Abonnenten ab; Jobs mit `auto_cancel` werden abgebrochen, wenn sich
+        innerhalb von `cancel_grace` Sekunden niemand neu anmeldet."""
+        with self._cond:
+            job.subscribers -= 1
+            if job.subscribers > 0 or not job.auto_cancel:
+                return
+            job.orphaned_at = time.monotonic()
+        if self.cancel_grace > 0:
+            timer = threading.Timer(self.cancel_grace, self._cancel_orphaned, args=(job,))
+            timer.daemon = True
+            timer.start()
+        else:
+            self._cancel_orphaned(job)
+
+    def _cancel_orphaned(self, job):
+        with self._cond:
+            orphaned = (
+                job.subscribers <= 0 and job.orphaned_at is not None
+                # Eine spätere Abmeldung hat einen eigenen Timer gestartet
+                and time.monotonic() - job.orphaned_at >= self.cancel_grace - 0.01
+                and not (job.finished or job.final_event_published)
+            )
+        if orphaned:
+            print(f"🛑 Client disconnected, cancelling job {job.id}")
+            self.cancel(job.id)
+
+    def cancel(self, job_id):
+        """Bricht einen wartenden oder laufenden Job ab."""
+        if self.store.shared:
+            return self._cancel_shared(job_id)
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished:
+                return job
+            job.cancel_requested.set()
+            if job in self._pending:
+                self._pending.remove(job)
+                self._release_key(job)
+                job.publish({'status': CANCELLED, 'message': 'Download abgebrochen.'})
+                job.set_status(CANCELLED, finished_at=time.time())
+                self.store.save(job)
+        return job
+
+    def _cancel_shared(self, job_id):
+        """Wartende Jobs verlassen die gemeinsame Warteschlange sofort; laufende bricht ihr Besitzer ab."""
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return job
+        job.cancel_requested.set()
+        if self.store.dequeue(job.id):
+            with self._cond:
+                self._release_key(job)
+                job.publish({'status': CANCELLED, 'message': 'Download abgebrochen.'})
+                job.set_status(CANCELLED, finished_at=time.time())
+            self.store.save(job)
+        else:
+            self.store.request_cancel(job.id)
+        return job
+
+    # ====== WORKER ======
+    def _next_local(self):
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            job = self._pick_next()
+            self._pending.remove(job)
+            self._start_running(job)
+        return job
+
+    def _next_shared(self):
+        """Übernimmt den nächsten Job aus der gemeinsamen Warteschlange (blockierend)."""
+        while True:
+            job_id = self.store.claim(self.owner, LEASE_SECONDS)
+            job = self.get(job_id) if job_id else None
+            if job is not None:
+                break
+            with self._cond:
+                self._cond.wait(self.poll_interval)
+        if job.remote:
+            # Bisher gespiegelt (z.B. nach Absturz der vorherigen Instanz): Ereignisse nachholen
+            self._mirror_events(job)
+        with self._cond:
+            job.remote = False
+            self._start_running(job)
+        print(f"📥 Claimed job {job.id} from shared queue")
+        return job
+
+    def _start_running(self, job):
+        """Muss mit gehaltenem Lock aufgerufen werden."""
+        self._running_per_client[job.client_id] = self._running_per_client.get(job.client_id, 0) + 1
+        self._last_served[job.client_id] = time.time()
+        job.set_status(RUNNING, started_at=time.time())
+
+    def _worker_loop(self):
+        while True:
+            job = self._next_shared() if self.store.shared else self._next_local()
+            self.store.save(job)
+            try:
+                self.runner(job, self)
+                job.set_status(COMPLETE, finished_at=time.time())
+            except JobCancelled:
+                job.publish({'status': CANCELLED, 'message': 'Download abgebrochen.'})
+                job.set_status(CANCELLED, finished_at=time.time())
+            except Exception as e:
+                job.publish({'status': ERROR, 'message': str(e)})
+                job.set_status(ERROR, error=str(e), finished_at=time.time())
+            finally:
+                with self._cond:
+                    self._release_key(job)
+                    self._running_per_client[job.client_id] -= 1
+                    if not self._running_per_client[job.client_id]:
+                        del self._running_per_client[job.client_id]
+                self.store.save(job)
+
+    # ====== GEMEINSAMES BACKEND ======
+    def _persist_event(self, job, index, event):
+        """Listener: schreibt eigene Ereignisse ins Backend (gespiegelte sind dort schon)."""
+        if index < job.synced:
+            return
+        try:
+            self.store.append_event(job.id, index, event)
+            job.synced = index + 1
+        except Exception as e:
+            print(f"⚠️ State backend write failed: {e}")
+
+    def _mirror_events(self, job):
+        """Übernimmt neue Ereignisse eines fremden Jobs aus dem Backend und verteilt sie lokal."""
+        with job.mirror_lock:
+            new_events = self.store.events_since(job.id, len(job.events))
+            job.synced = len(job.events) + len(new_events)
+            for event in new_events:
+                job.publish(event)
+
+    def _sync(self):
+        with self._cond:
+            jobs = list(self._jobs.values())
+        own = [job for job in jobs if not job.remote and job.status == RUNNING]
+
+        # Abbruchwünsche anderer Instanzen für die eigenen laufenden Jobs
+        cancelled = self.store.cancel_requested([job.id for job in own])
+        for job in own:
+            if job.id in cancelled:
+                job.cancel_requested.set()
+
+        now = time.monotonic()
+        if now - self._last_renew >= LEASE_SECONDS / 3:
+            self.store.renew(self.owner, [job.id for job in own], LEASE_SECONDS)
+            self._last_renew = now
+        self._purge_store()
+
+        # Fortschritt und Status fremder Jobs spiegeln (erst Ereignisse, dann Status)
+        for job in jobs:
+            if not job.remote or job.finished:
+                continue
+            record = self.store.load(job.id)
+            if record is None:
+                continue
+            self._mirror_events(job)
+            fields = {name: record.get(name) for name in ('started_at', 'finished_at', 'file_path', 'error', 'trace', 'transcode')}
+            job.set_status(record['status'], **fields)
+            if job.finished:
+                with self._cond:
+                    self._release_key(job)
+
+    def _sync_loop(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                self._sync()
+            except Exception as e:
+                print(f"⚠️ State sync failed: {e}")
@@ -0,0 +1,218 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+# Erkennt die 11-stellige Video-ID in den gängigen YouTube-URL-Varianten
+_youtube_id_re = re.compile(
+    r'(?:youtube(?:-nocookie)?\.com/(?:watch\?(?:.*&)?v=|embed/|shorts/|live/|v/)|youtu\.be/)'
+    r'([0-9A-Za-z_-]{11})'
+)
+
+
+def normalize_video_key(video_url):
+    """Liefert einen stabilen Cache-Schlüssel (bevorzugt die Video-ID) für eine URL."""
+    video_url = (video_url or '').strip()
+    match = _youtube_id_re.search(video_url)
+    if match:
+        return f"youtube:{match.group(1)}"
+    return f"url:{video_url}"
+
+
+class _InFlight:
+    """Eine laufende Extraktion, auf die gleichzeitige Anfragen warten."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MetadataCache:
+    """LRU-Cache mit TTL für die reduzierten Metadaten aus /api/analyze."""
+
+    def __init__(self, max_entries=512, ttl=3600, db_path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_path = db_path
+        self._entries = OrderedDict()  # key -> (expires_at, payload)
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'coalesced': 0,
+            'errors': 0,
+            'evictions': 0,
+            'extractions': 0,
+            'extraction_seconds_total': 0.0,
+            'extraction_seconds_max': 0.0,
+        }
+        if self.db_path:
+            self._init_db()
+
+    @classmethod
+    def from_env(cls):
+        """Erstellt den Cache aus den Umgebungsvariablen METADATA_CACHE_*."""
+        return cls(
+            max_entries=int(os.environ.get('METADATA_CACHE_SIZE', 512)),
+            ttl=float(os.environ.get('METADATA_CACHE_TTL', 3600)),
+            db_path=os.environ.get('METADATA_CACHE_DB') or None,
+        )
+
+    # ====== PERSISTENZ (OPTIONAL) ======
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=5)
+
+    def _init_db(self):
+        directory = os.path.dirname(os.path.abspath(self.db_path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS metadata '
+                '(key TEXT PRIMARY KEY, payload TEXT NOT NULL, expires_at REAL NOT NULL)'
+            )
+            conn.execute('DELETE FROM metadata WHERE expires_at < ?', (time.time(),))
+
+    def _load_from_disk(self, key):
+        if not self.db_path:
+            return None
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    'SELECT payload, expires_at FROM metadata WHERE key = ?', (key,)
+                ).fetchone()
+        except sqlite3.Error as e:
+            print(f"⚠️ Metadata cache read failed: {e}")
+            return None
+        if not row or row[1] < time.time():
+            return None
+        return row[1], json.loads(row[0])
+
+    def _store_on_disk(self, key, expires_at, payload):
+        if not self.db_path:
+            return
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO metadata (key, payload, expires_at) VALUES (?, ?, ?)',
+                    (key, json.dumps(payload), expires_at),
+                )
+        except sqlite3.Error as e:
+            print(f"⚠️ Metadata cache write failed: {e}")
+
+    # ====== CACHE-ZUGRIFF ======
+    def _get_memory(self, key):
+        """Muss mit gehaltenem Lock aufgerufen werden."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def _put_memory(self, key, expires_at, payload):
+        """Muss mit gehaltenem Lock aufgerufen werden."""
+        self._entries[key] = (expires_at, payload)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def peek(self, video_url):
+        """Liefert die gecachten Metadaten ohne Extraktion (oder None).
+
+        Mit METADATA_CACHE_DB wird auch die Datenbank gefragt, damit Analysen anderer Instanzen zählen.
+        """
+        key = normalize_video_key(video_url)
+        with self._lock:
+            payload = self._get_memory(key)
+        if payload is not None:
+            return payload
+        stored = self._load_from_disk(key)
+        if stored is None:
+            return None
+        expires_at, payload = stored
+        with self._lock:
+            self._put_memory(key, expires_at, payload)
+        return payload
+
+    def get_or_extract(self, video_url, extract):
+        """Liefert die Metadaten aus dem Cache oder ruft `extract(video_url)` genau einmal auf.
+
+        Gleichzeitige Anfragen für dasselbe Video warten auf dieselbe Extraktion.
+        """
+        key = normalize_video_key(video_url)
+        with self._lock:
+            payload = self._get_memory(key)
+            if payload is not None:
+                self._stats['hits'] += 1
+                return payload
+            in_flight = self._in_flight.get(key)
+            leader = in_flight is None
+            if leader:
+                in_flight = self._in_flight[key] = _InFlight()
+            else:
+                self._stats['coalesced'] += 1
+
+        if not leader:
+            in_flight.event.wait()
+            if in_flight.error is not None:
+                raise in_flight.error
+            return in_flight.result
+
+        try:
+            stored = self._load_from_disk(key)
+            if stored is not None:
+                expires_at, payload = stored
+                with self._lock:
+                    self._stats['disk_hits'] += 1
+                    self._put_memory(key, expires_at, payload)
+            else:
+                start = time.monotonic()
+                try:
+                    payload = extract(video_url)
+                finally:
+                    elapsed = time.monotonic() - start
+                    with self._lock:
+                        self._stats['misses'] += 1
+                        self._stats['extractions'] += 1
+                        self._stats['extraction_seconds_total'] += elapsed
+                        self._stats['extraction_seconds_max'] = max(self._stats['extraction_seconds_max'], elapsed)
+                expires_at = time.time() + self.ttl
+                with self._lock:
+                    self._put_memory(key, expires_at, payload)
+                self._store_on_disk(key, expires_at, payload)
+            in_flight.result = payload
+            return payload
+        except Exception as e:
+            with self._lock:
+                self._stats['errors'] += 1
+            in_flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            in_flight.event.set()
+
+    def stats(self):
+        """Liefert Treffer-/Fehlzugriffszähler und Extraktionslatenzen."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['in_flight'] = len(self._in_flight)
+        lookups = stats['hits'] + stats['disk_hits'] + stats['misses'] + stats['coalesced']
+        stats['hit_rate'] = round((lookups - stats['misses']) / lookups, 4) if lookups else 0.0
+        stats['extraction_seconds_avg'] = (
+            round(stats['extraction_seconds_total'] / stats['extractions'], 4) if stats['extractions'] else 0.0
+        )
+        stats['max_entries'] = self.max_entries
+        stats['ttl'] = self.ttl
+        stats['persistent'] = bool(self.db_path)
+        return stats
@@ -0,0 +1,243 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+# Bucket-Grenzen in Sekunden: von schnellen Cache-Treffern bis zu langen Konvertierungen
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+def directory_size(path):
+    """Summe aller Dateigrößen unterhalb von `path`; verschwundene Dateien werden übersprungen."""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                continue
+    return total
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}' for key, value in values]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # Labels -> [Zähler je Bucket, Summe, Anzahl]
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Misst die Dauer des `with`-Blocks (auch wenn er mit einer Ausnahme endet)."""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - started, **labels)
+
+    def _samples(self):
+        with self._lock:
+            series = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._series.items())
+        lines = []
+        for key, (counts, total, count) in series:
+            for bound, bucket_count in zip(self.buckets, counts):
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+                lines.append(f'{self.name}_bucket{labels} {bucket_count}')
+            lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, [("le", "+Inf")])} {count}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, key)} {count}')
+        return lines
+
+
+class CallbackMetric(_Metric):
+    """Wert wird erst beim Abruf von /metrics ermittelt, z.B. Warteschlangenlänge oder Cache-Statistik.
+
+    `collect()` liefert eine Zahl oder ein Dict {Label-Werte (Tupel): Zahl}.
+    """
+
+    def __init__(self, name, help_text, collect, labelnames=(), kind='gauge'):
+        super().__init__(name, help_text, labelnames)
+        self.collect = collect
+        self.kind = kind
+
+    def _samples(self):
+        try:
+            values = self.collect()
+        except Exception as e:
+            print(f"⚠️ Metric {self.name} failed: {e}")
+            return []
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [
+            f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+            for key, value in sorted(values.items()) if value is not None
+        ]
+
+
+class MetricsRegistry:
+    """Sammelt Metriken und rendert sie im Prometheus-Textformat (Version 0.0.4)."""
+
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self, prefix='stream_dl_'):
+        self.prefix = prefix
+        self._metrics = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._add(Counter(self.prefix + name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(self.prefix + name, help_text, labelnames, buckets))
+
+    def callback(self, name, help_text, collect, labelnames=(), kind='gauge'):
+        return self._add(CallbackMetric(self.prefix + name, help_text, collect, labelnames, kind))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class JobTrace:
+    """Strukturierte Zeitmessung eines Jobs, gespeist aus den yt-dlp-Hooks.
+
+    Jede abgeschlossene Phase wird als Span {'phase', 'start', 'end', 'duration', ...} an
+    `spans` (die Liste im Job-Datensatz) angehängt und an `on_span` gemeldet.
+    Phasen: queue, extract, download (je Datei), die Postprozessoren unter ihrem pp_key() (z.B. Merger, ExtractAudio), store.
+    """
+
+    def __init__(self, spans, on_span=None, clock=time.time):
+        self.spans = spans
+        self.on_span = on_span
+        self.clock = clock
+        self._open = {}  # Phase -> (Start, Attribute)
+        self._files = {}  # Dateiname -> Start
+        self._lock = threading.Lock()
+
+    def record(self, phase, start, end, **attrs):
+        span = {'phase': phase, 'start': start, 'end': end, 'duration': round(end - start, 3)}
+        span.update({key: value for key, value in attrs.items() if value is not None})
+        with self._lock:
+            self.spans.append(span)
+        if self.on_span:
+            self.on_span(span)
+        return span
+
+    def begin(self, phase, **attrs):
+        with self._lock:
+            self._open[phase] = (self.clock(), attrs)
+
+    def end(self, phase, **attrs):
+        """Schließt eine offene Phase; ohne vorheriges `begin` passiert nichts."""
+        with self._lock:
+            opened = self._open.pop(phase, None)
+        if opened is None:
+            return None
+        start, begin_attrs = opened
+        return self.record(phase, start, self.clock(), **{**begin_attrs, **attrs})
+
+    @contextmanager
+    def phase(self, phase, **attrs):
+        self.begin(phase, **attrs)
+        try:
+            yield
+        finally:
+            self.end(phase)
+
+    def download_hook(self, d):
+        """Progress-Hook: Extraktion endet mit dem ersten Download; ein Span pro heruntergeladener Datei."""
+        self.end('extract')
+        key = d.get('filename') or d.get('tmpfilename') or ''
+        # Spuren können parallel geladen werden (mehrere Threads)
+        with self._lock:
+            start = self._files.setdefault(key, self.clock())
+            if d['status'] != 'finished' or start is None:
+                return
+            self._files[key] = None
+        self.record(
+            'download', start, self.clock(),
+            file=os.path.basename(key),
+            bytes=d.get('total_bytes') or d.get('downloaded_bytes'),
+            fragments=d.get('fragment_count'),
+        )
+
+    def postprocessor_hook(self, d):
+        """Postprocessor-Hook: ein Span pro Nachbearbeitungsschritt (Merger, ExtractAudio, ...)."""
+        name = d.get('postprocessor') or 'postprocessor'
+        if d['status'] == 'started':
+            self.begin(name)
+        elif d['status'] == 'finished':
+            self.end(name)
+
+    def close(self):
+        """Verwirft offene Phasen (z.B. nach Abbruch), damit sie nicht als Dauer zählen."""
+        self._open.clear()
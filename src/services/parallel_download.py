@@ -0,0 +1,86 @@
+import os
+import time
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import yt_dlp
+from yt_dlp.downloader import get_suitable_downloader
+from src.services.transfer import FRAGMENT_PROTOCOLS
+
+
+class ParallelYoutubeDL(yt_dlp.YoutubeDL):
+    """YoutubeDL, das getrennte Video- und Audiospuren gleichzeitig lädt und die Fragment-
+    Parallelität pro Download vom `ConcurrencyController` bestimmen lässt.
+
+    yt-dlp ruft `dl()` für `bestvideo+bestaudio` nacheinander pro Spur auf; hier laufen alle
+    Spuren außer der letzten im Hintergrund, der Aufruf für die letzte Spur wartet auf alle.
+    """
+
+    def __init__(self, params=None, controller=None, parallel_tracks=True, **kwargs):
+        super().__init__(params, **kwargs)
+        self.controller = controller
+        self.parallel_tracks = parallel_tracks
+        self._tracks_left = 0
+        self._pending = []
+        self._pool = None
+
+    def process_info(self, info_dict):
+        formats = info_dict.get('requested_formats') or ()
+        self._tracks_left = len(formats) if self.parallel_tracks and len(formats) > 1 else 0
+        try:
+            return super().process_info(info_dict)
+        finally:
+            # Hintergrund-Spuren nie weiterschreiben lassen, während der Job aufräumt
+            wait(self._pending)
+            self._pending = []
+            self._tracks_left = 0
+            if self._pool is not None:
+                self._pool.shutdown(wait=False)
+                self._pool = None
+
+    def dl(self, name, info, subtitle=False, test=False):
+        # Gemeinsamer Aufruf für alle Spuren (z.B. ffmpeg-Downloader) oder Sonderfälle: unverändert
+        if test or subtitle or 'requested_formats' in info or not self._tracks_left:
+            return self._download(name, info, subtitle, test)
+
+        self._tracks_left -= 1
+        if self._tracks_left:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix='track-download')
+            self._pending.append(self._pool.submit(self._download, name, info))
+            return True, True
+
+        # Letzte Spur: im aktuellen Thread laden, dann auf die übrigen warten
+        results = [self._download(name, info)]
+        pending, self._pending = self._pending, []
+        results += [future.result() for future in pending]
+        return all(success for success, _ in results), any(real for _, real in results)
+
+    def _download(self, name, info, subtitle=False, test=False):
+        protocol = info.get('protocol')
+        if test or subtitle or self.controller is None or protocol not in FRAGMENT_PROTOCOLS:
+            return super().dl(name, info, subtitle, test)
+
+        host = urlparse(info.get('manifest_url') or info.get('url') or '').hostname or ''
+        workers = self.controller.choose(host)
+        # Eigene Parameter-Kopie: parallele Spuren dürfen unterschiedliche Werte nutzen
+        params = {**self.params, 'concurrent_fragment_downloads': workers}
+        started = time.monotonic()
+        success, real_download = self._run_downloader(name, info, params)
+        if success and real_download and os.path.exists(name):
+            self.controller.report(host, workers, os.path.getsize(name), time.monotonic() - started)
+        return success, real_download
+
+    def _run_downloader(self, name, info, params):
+        """Entspricht `YoutubeDL.dl`, aber mit eigenen Downloader-Parametern."""
+        if not info.get('url'):
+            self.raise_no_formats(info, True)
+        fd = get_suitable_downloader(info, params, to_stdout=(name == '-'))(self, params)
+        for hook in self._progress_hooks:
+            fd.add_progress_hook(hook)
+        self.write_debug(f'Invoking {fd.FD_NAME} downloader on "{info.get("url")}" '
+                         f'with {params["concurrent_fragment_downloads"]} fragment workers')
+        new_info = self._copy_infodict(info)
+        if new_info.get('http_headers') is None:
+            new_info['http_headers'] = self._calc_headers(new_info)
+        return fd.download(name, new_info)
@@ -0,0 +1,177 @@
+import os
+import time
+import threading
+
+# Glättungsfaktor für die Geschwindigkeit (exponentieller gleitender Mittelwert)
+SPEED_SMOOTHING = 0.3
+# Mindestabstand zwischen zwei Geschwindigkeitsmessungen in Sekunden
+SPEED_SAMPLE_INTERVAL = 0.25
+# Wie oft die ffmpeg-Fortschrittsdatei gelesen wird
+FFMPEG_POLL_INTERVAL = 0.5
+# Name der ffmpeg-Fortschrittsdatei im Arbeitsordner (versteckt, damit sie nie als Ergebnis gilt)
+FFMPEG_PROGRESS_FILE = '.ffmpeg-progress'
+
+
+def progress_rate():
+    """Maximale Anzahl Fortschrittsereignisse pro Sekunde und Job (PROGRESS_RATE_HZ)."""
+    return float(os.environ.get('PROGRESS_RATE_HZ', 4))
+
+
+class ProgressAggregator:
+    """Fasst yt-dlp- und ffmpeg-Fortschritt zu kompakten, gedrosselten Ereignissen zusammen.
+
+    Prozent, Geschwindigkeit und ETA werden aus `downloaded_bytes`/`total_bytes` berechnet
+    (nicht aus den formatierten Strings). Bei Video+Audio zählen beide Dateien zusammen.
+    Ereignisse: {'status', 'phase', 'percent', 'downloaded', 'total', 'speed', 'eta'}.
+    """
+
+    def __init__(self, publish, progress_file=None, rate_hz=None, clock=time.monotonic):
+        self.publish = publish
+        self.progress_file = progress_file
+        self.min_interval = 1.0 / (rate_hz or progress_rate())
+        self.clock = clock
+        self._files = {}  # Dateiname -> [heruntergeladen, gesamt, fertig]
+        self._expected_sizes = []
+        self._last_emit = None
+        self._last_sample = None  # (Zeitpunkt, Bytes)
+        self._speed = None
+        self._download_finished = False
+        self._lock = threading.Lock()
+        self._ffmpeg_stop = None
+
+    # ====== DOWNLOAD ======
+    def download_hook(self, d):
+        """Progress-Hook für yt-dlp."""
+        with self._lock:
+            if not self._files:
+                info = d.get('info_dict') or {}
+                requested = info.get('requested_formats') or [info]
+                self._expected_sizes = [f.get('filesize') or f.get('filesize_approx') for f in requested]
+            key = d.get('filename') or d.get('tmpfilename') or ''
+            state = self._files.setdefault(key, [0, None, False])
+            state[0] = d.get('downloaded_bytes') or state[0]
+            state[1] = d.get('total_bytes') or d.get('total_bytes_estimate') or state[1]
+            if d['status'] == 'finished':
+                state[2] = True
+                state[1] = state[1] or state[0]
+                state[0] = state[1]
+            downloaded, total = self._totals()
+            now = self.clock()
+            self._update_speed(now, downloaded)
+
+            all_done = (
+                d['status'] == 'finished'
+                and len(self._files) >= len(self._expected_sizes)
+                and all(done for _, _, done in self._files.values())
+            )
+            if all_done and not self._download_finished:
+                self._download_finished = True
+                self._emit({
+                    'status': 'finished', 'phase': 'download', 'percent': 100.0,
+                    'downloaded': downloaded, 'total': total,
+                    'message': 'Download abgeschlossen.',
+                }, now, force=True)
+            elif d['status'] == 'downloading':
+                percent = round(100.0 * downloaded / total, 1) if total else None
+                eta = round((total - downloaded) / self._speed) if total and self._speed else None
+                self._emit({
+                    'status': 'downloading', 'phase': 'download', 'percent': percent,
+                    'downloaded': downloaded, 'total': total,
+                    'speed': round(self._speed) if self._speed else None, 'eta': eta,
+                }, now)
+
+    def _totals(self):
+        """Muss mit gehaltenem Lock aufgerufen werden."""
+        downloaded = sum(state[0] for state in self._files.values())
+        totals = [state[1] for state in self._files.values()]
+        # Noch nicht begonnene Formate mit ihrer erwarteten Größe einrechnen
+        totals += self._expected_sizes[len(self._files):]
+        if any(size is None for size in totals):
+            return downloaded, None
+        return downloaded, max(sum(totals), downloaded)
+
+    def _update_speed(self, now, downloaded):
+        if self._last_sample is None:
+            self._last_sample = (now, downloaded)
+            return
+        elapsed = now - self._last_sample[0]
+        if elapsed < SPEED_SAMPLE_INTERVAL:
+            return
+        current = max(downloaded - self._last_sample[1], 0) / elapsed
+        self._speed = current if self._speed is None else (
+            SPEED_SMOOTHING * current + (1 - SPEED_SMOOTHING) * self._speed
+        )
+        self._last_sample = (now, downloaded)
+
+    def _emit(self, event, now, force=False):
+        """Veröffentlicht höchstens `rate_hz` Ereignisse pro Sekunde; Phasenwechsel immer."""
+        if not force and self._last_emit is not None and now - self._last_emit < self.min_interval:
+            return
+        self._last_emit = now
+        self.publish({key: value for key, value in event.items() if value is not None})
+
+    # ====== NACHBEARBEITUNG (FFMPEG) ======
+    def ffmpeg_args(self):
+        """postprocessor_args, mit denen ffmpeg seinen Fortschritt in `progress_file` schreibt."""
+        if not self.progress_file:
+            return {}
+        return {'ffmpeg': ['-progress', self.progress_file, '-nostats']}
+
+    def postprocessor_hook(self, d):
+        """Postprocessor-Hook für yt-dlp; verfolgt ffmpeg-Schritte mit echtem Fortschritt.
+
+        Nur für Postprozessoren aufrufen, die ffmpeg ausführen. Die Phase ist der pp_key()
+        von yt-dlp (z.B. 'Merger', 'ExtractAudio', 'VideoConvertor').
+        """
+        phase = d.get('postprocessor') or 'postprocessor'
+        if d['status'] == 'started':
+            with self._lock:
+                self._emit({'status': 'processing', 'phase': phase, 'percent': 0.0}, self.clock(), force=True)
+            duration = (d.get('info_dict') or {}).get('duration')
+            self._start_ffmpeg_watch(phase, duration)
+        elif d['status'] == 'finished':
+            self.stop()
+            with self._lock:
+                self._emit({'status': 'processing', 'phase': phase, 'percent': 100.0}, self.clock(), force=True)
+
+    def _start_ffmpeg_watch(self, phase, duration):
+        self.stop()
+        if not self.progress_file or not duration:
+            return
+        stop = self._ffmpeg_stop = threading.Event()
+
+        def watch():
+            last_percent = None
+            while not stop.wait(FFMPEG_POLL_INTERVAL):
+                out_time = self._read_ffmpeg_out_time()
+                if out_time is None:
+                    continue
+                percent = round(min(100.0 * out_time / duration, 99.9), 1)
+                if percent == last_percent:
+                    continue
+                last_percent = percent
+                with self._lock:
+                    self._emit({'status': 'processing', 'phase': phase, 'percent': percent}, self.clock())
+
+        threading.Thread(target=watch, name='ffmpeg-progress', daemon=True).start()
+
+    def _read_ffmpeg_out_time(self):
+        """Liest die zuletzt gemeldete Ausgabezeit (Sekunden) aus der ffmpeg-Fortschrittsdatei."""
+        try:
+            with open(self.progress_file, 'r', encoding='utf-8', errors='replace') as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return None
+        for line in reversed(lines):
+            if line.startswith('out_time_us='):
+                try:
+                    return int(line.split('=', 1)[1]) / 1_000_000
+                except ValueError:
+                    return None
+        return None
+
+    def stop(self):
+        """Beendet eine laufende ffmpeg-Beobachtung."""
+        if self._ffmpeg_stop is not None:
+            self._ffmpeg_stop.set()
+            self._ffmpeg_stop = None
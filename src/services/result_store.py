@@ -0,0 +1,268 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+# Gemeinsame Referenzen, die so lange nicht mehr benutzt wurden, stammen von abgestürzten Instanzen
+STALE_REF_SECONDS = 6 * 3600
+
+
+def result_key(video_key, format_id, output_format, postprocessors):
+    """Bildet den inhaltsadressierten Schlüssel für ein fertiges Download-Ergebnis."""
+    material = json.dumps(
+        [video_key, format_id, output_format, postprocessors or []], sort_keys=True, separators=(',', ':')
+    )
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()[:32]
+
+
+class _Entry:
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        self.refcount = 0
+        self.last_access = time.time()
+
+
+class ResultStore:
+    """Größenbegrenzter LRU-Speicher für fertige Dateien mit Referenzzählung.
+
+    Dateien mit `refcount > 0` werden gerade ausgeliefert und nie verdrängt; zuletzt
+    benutzte Dateien bleiben mindestens `min_retention` Sekunden erhalten (Resume, Proxy-Auslieferung).
+
+    Mit `index` (state.StateBackend) werden Ergebnisse instanzübergreifend registriert, sodass
+    jede Instanz Dateien ausliefern kann, die eine andere in `root` abgelegt hat. Referenzen,
+    letzte Nutzung und Gesamtgröße zählen dann im Index: verdrängt wird nur, was keine Instanz
+    ausliefert oder kürzlich benutzt hat, und `max_bytes` gilt für alle Instanzen zusammen.
+    """
+
+    def __init__(self, root, max_bytes=10 * 1024 ** 3, min_retention=600, index=None):
+        self.root = root
+        self.index = index
+        self.max_bytes = max_bytes
+        self.min_retention = min_retention
+        self._entries = OrderedDict()  # key -> _Entry, älteste zuerst
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stored': 0, 'evictions': 0}
+        os.makedirs(self.root, exist_ok=True)
+        self._scan()
+        if self.index is not None:
+            self._register_scanned()
+
+    @classmethod
+    def from_env(cls, index=None):
+        """Erstellt den Speicher aus RESULT_STORE_DIR, RESULT_STORE_MAX_BYTES und RESULT_MIN_RETENTION."""
+        return cls(
+            root=os.environ.get('RESULT_STORE_DIR') or os.path.join(tempfile.gettempdir(), 'stream-dl-results'),
+            max_bytes=int(os.environ.get('RESULT_STORE_MAX_BYTES', 10 * 1024 ** 3)),
+            min_retention=float(os.environ.get('RESULT_MIN_RETENTION', 600)),
+            index=index,
+        )
+
+    def _scan(self):
+        """Übernimmt vorhandene Ergebnisse nach einem Neustart (älteste zuerst)."""
+        found = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            key = name.split('.', 1)[0]
+            if os.path.isfile(path) and not name.endswith('.part'):
+                stat = os.stat(path)
+                found.append((stat.st_atime, key, path, stat.st_size))
+        for atime, key, path, size in sorted(found):
+            entry = _Entry(path, size)
+            entry.last_access = atime
+            self._entries[key] = entry
+            self._total_bytes += size
+
+    def _register_scanned(self):
+        """Trägt vorgefundene Dateien, die der Index nicht kennt, dort ein (sonst würden sie nie verdrängt)."""
+        for key, entry in list(self._entries.items()):
+            try:
+                if self.index.lookup_result(key) is None:
+                    self.index.put_result(key, entry.path, entry.size)
+            except Exception as e:
+                print(f"⚠️ Result index write failed: {e}")
+                return
+
+    def _adopt(self, key):
+        """Übernimmt ein Ergebnis, das eine andere Instanz im gemeinsamen Index registriert hat."""
+        if self.index is None:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+        try:
+            path = self.index.lookup_result(key)
+        except Exception as e:
+            print(f"⚠️ Result index read failed: {e}")
+            return
+        if not path or not os.path.exists(path):
+            return
+        size = os.path.getsize(path)
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = _Entry(path, size)
+                self._total_bytes += size
+
+    def lookup(self, key):
+        """Liefert den Pfad eines vorhandenen Ergebnisses (oder None) und markiert es als benutzt."""
+        self._adopt(key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or not os.path.exists(entry.path):
+                if entry is not None:
+                    self._forget(key)
+                self._stats['misses'] += 1
+                return None
+            entry.last_access = time.time()
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+        if self.index is not None:
+            try:
+                self.index.touch_result(key)
+            except Exception as e:
+                print(f"⚠️ Result index write failed: {e}")
+        return entry.path
+
+    def put(self, key, source_path):
+        """Verschiebt eine fertige Datei in den Speicher und liefert ihren neuen Pfad."""
+        ext = os.path.splitext(source_path)[1]
+        target = os.path.join(self.root, f'{key}{ext}')
+        partial = f'{target}.part'
+        shutil.move(source_path, partial)
+        os.replace(partial, target)
+        size = os.path.getsize(target)
+        previous = None
+        if self.index is not None:
+            try:
+                previous = self.index.lookup_result(key)
+            except Exception as e:
+                print(f"⚠️ Result index read failed: {e}")
+        with self._lock:
+            if key in self._entries:
+                previous = self._entries[key].path
+                self._forget(key, delete=False)
+            self._entries[key] = _Entry(target, size)
+            self._total_bytes += size
+            self._stats['stored'] += 1
+            if self.index is None:
+                self._evict(keep=key)
+        if previous and previous != target:
+            # Gleicher Schlüssel mit anderer Endung: die alte Datei gehört keinem Eintrag mehr
+            try:
+                os.remove(previous)
+            except OSError:
+                pass
+        if self.index is not None:
+            try:
+                self.index.put_result(key, target, size)
+            except Exception as e:
+                print(f"⚠️ Result index write failed: {e}")
+            self._evict_shared(keep=key)
+        return target
+
+    def acquire(self, key):
+        """Erhöht den Referenzzähler; liefert den Pfad oder None, falls nicht vorhanden."""
+        self._adopt(key)
+        shared_ref = False
+        if self.index is not None:
+            try:
+                shared_ref = self.index.acquire_result(key) is not None
+                if not shared_ref:
+                    # Von einer anderen Instanz verdrängt: die Datei gehört nicht mehr dem Speicher
+                    with self._lock:
+                        if key in self._entries:
+                            self._forget(key, delete=False)
+                    return None
+            except Exception as e:
+                print(f"⚠️ Result index write failed: {e}")
+        with self._lock:
+            entry = self._entries.get(key)
+            path = entry.path if entry is not None and os.path.exists(entry.path) else None
+            if path is not None:
+                entry.refcount += 1
+                entry.last_access = time.time()
+                self._entries.move_to_end(key)
+        if path is None and shared_ref:
+            try:
+                self.index.release_result(key)
+            except Exception as e:
+                print(f"⚠️ Result index write failed: {e}")
+        return path
+
+    def release(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.refcount > 0:
+                entry.refcount -= 1
+            if self.index is None:
+                self._evict()
+        if self.index is not None:
+            try:
+                self.index.release_result(key)
+            except Exception as e:
+                print(f"⚠️ Result index write failed: {e}")
+            self._evict_shared()
+
+    def _forget(self, key, delete=True):
+        """Muss mit gehaltenem Lock aufgerufen werden."""
+        entry = self._entries.pop(key)
+        self._total_bytes -= entry.size
+        if delete:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+            if self.index is not None:
+                try:
+                    self.index.forget_result(key, entry.path)
+                except Exception as e:
+                    print(f"⚠️ Result index write failed: {e}")
+
+    def _evict(self, keep=None):
+        """Verdrängt unbenutzte Ergebnisse, bis das Limit eingehalten wird. Muss mit Lock aufgerufen werden."""
+        retain_after = time.time() - self.min_retention
+        for key in list(self._entries):
+            if self._total_bytes <= self.max_bytes:
+                break
+            entry = self._entries[key]
+            if key == keep or entry.refcount > 0 or entry.last_access > retain_after:
+                continue
+            self._forget(key)
+            self._stats['evictions'] += 1
+            print(f"🧹 Evicted cached result: {entry.path}")
+
+    def _evict_shared(self, keep=None):
+        """Verdrängt instanzübergreifend anhand der Referenzen und Nutzung im Index."""
+        now = time.time()
+        try:
+            evicted = self.index.evict_results(
+                self.max_bytes, now - self.min_retention, now - STALE_REF_SECONDS, keep=keep
+            )
+        except Exception as e:
+            print(f"⚠️ Result index eviction failed: {e}")
+            return
+        for key, path in evicted:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry.path == path:
+                    self._forget(key, delete=False)
+                self._stats['evictions'] += 1
+            print(f"🧹 Evicted cached result: {path}")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._total_bytes
+            stats['in_use'] = sum(1 for entry in self._entries.values() if entry.refcount)
+        stats['max_bytes'] = self.max_bytes
+        return stats
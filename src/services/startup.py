@@ -0,0 +1,120 @@
+import os
+import time
+import importlib
+import threading
+
+# Beginn des App-Starts (main.py importiert dieses Modul vor allem anderen)
+PROCESS_STARTED = time.monotonic()
+
+# Beliebige URL, an der beim Vorwärmen die URL-Muster aller Extraktoren kompiliert werden
+_WARMUP_URL = 'https://example.com/watch?v=warmup'
+
+
+def allowed_extractors():
+    """Erlaubte yt-dlp-Extraktoren aus ALLOWED_EXTRACTORS (z.B. 'youtube.*,generic'); None = alle.
+
+    Weniger Extraktoren machen jede YoutubeDL-Instanz und die URL-Erkennung deutlich schneller.
+    Eingebettete Medien auf beliebigen Seiten brauchen neben 'generic' auch 'html5'.
+    """
+    names = [name.strip() for name in os.environ.get('ALLOWED_EXTRACTORS', '').split(',') if name.strip()]
+    return names or None
+
+
+def extractor_options():
+    """yt-dlp-Optionen für die Extraktor-Auswahl, zum Einmischen in jede Options-Dict."""
+    allowed = allowed_extractors()
+    return {'allowed_extractors': allowed} if allowed else {}
+
+
+def prewarm_enabled():
+    """Vorwärmen im Hintergrund (YTDLP_PREWARM, standardmäßig an)."""
+    return os.environ.get('YTDLP_PREWARM', '1') not in ('0', 'false', 'no')
+
+
+class LazyModule:
+    """Platzhalter für ein schweres Modul, das erst beim ersten Attributzugriff importiert wird."""
+
+    def __init__(self, name):
+        self.name = name
+        self.load_seconds = None
+        self._module = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._module is not None
+
+    def load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    started = time.monotonic()
+                    module = importlib.import_module(self.name)
+                    self.load_seconds = time.monotonic() - started
+                    self._module = module
+                    print(f"📦 Loaded {self.name} in {self.load_seconds:.2f}s")
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+
+class Warmup:
+    """Kaltstart-Zustand: Zeit bis die App Anfragen annimmt und bis yt-dlp vorgewärmt ist.
+
+    Vorgewärmt heißt: yt-dlp (und `modules`) sind importiert, eine YoutubeDL-Instanz wurde
+    erzeugt und die URL-Muster aller erlaubten Extraktoren sind kompiliert. Ohne Vorwärmen
+    passiert das bei der ersten Analyse.
+    """
+
+    def __init__(self, ytdlp, modules=()):
+        self.ytdlp = ytdlp
+        self.modules = modules
+        self.app_seconds = None
+        self.warm_seconds = None
+        self.extractors = None
+        self.error = None
+        self._thread = None
+
+    @property
+    def warm(self):
+        return self.warm_seconds is not None
+
+    def app_ready(self):
+        """Wird aufgerufen, sobald die App Anfragen annehmen kann."""
+        self.app_seconds = time.monotonic() - PROCESS_STARTED
+        print(f"🚀 App ready after {self.app_seconds:.2f}s")
+
+    def start(self):
+        """Startet das Vorwärmen im Hintergrund (YTDLP_PREWARM)."""
+        if self._thread is not None or not prewarm_enabled():
+            return
+        self._thread = threading.Thread(target=self.run, name='ytdlp-prewarm', daemon=True)
+        self._thread.start()
+
+    def run(self):
+        try:
+            yt_dlp = self.ytdlp.load()
+            for name in self.modules:
+                importlib.import_module(name)
+            with yt_dlp.YoutubeDL({'quiet': True, **extractor_options()}) as ydl:
+                extractors = list(ydl._ies.values())
+                for extractor in extractors:
+                    extractor.suitable(_WARMUP_URL)
+            self.extractors = len(extractors)
+            self.warm_seconds = time.monotonic() - PROCESS_STARTED
+            print(f"🔥 yt-dlp warm after {self.warm_seconds:.2f}s ({self.extractors} extractors)")
+        except Exception as e:
+            self.error = str(e)
+            print(f"⚠️ yt-dlp prewarm failed: {e}")
+
+    def status(self):
+        return {
+            'status': 'warm' if self.warm else 'cold',
+            'ytdlp_loaded': self.ytdlp.loaded,
+            'extractors': self.extractors,
+            'allowed_extractors': allowed_extractors(),
+            'app_seconds': round(self.app_seconds, 3) if self.app_seconds is not None else None,
+            'warm_seconds': round(self.warm_seconds, 3) if self.warm_seconds is not None else None,
+            'error': self.error,
+        }
@@ -0,0 +1,355 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from src.services.jobs import CANCELLED, QUEUED, RUNNING
+
+
+class StateBackend(ABC):
+    """Gemeinsamer Zustand mehrerer Instanzen: Jobdatensätze, Fortschritt, Warteschlange, Ergebnisse.
+
+    Die Schnittstelle ist eine Obermenge von `jobs.JobStore` (save/purge/load_unfinished), damit
+    der Scheduler beide gleich behandeln kann; mit `shared = True` holt er Jobs über `claim` aus
+    der gemeinsamen Warteschlange statt aus dem Speicher. Ein Job gehört der Instanz, die ihn
+    per `claim` übernommen hat, solange sie die Lease erneuert; sonst übernimmt ihn eine andere.
+
+    Eine Redis-Implementierung würde z.B. abbilden: Job als Hash `job:<id>`, Ereignisse als
+    Liste `events:<id>` (RPUSH/LRANGE), die Warteschlange als Sorted Set nach Priorität und
+    Einreihungszeit mit einem Lua-Skript für `claim`, Ergebnisse als Hash `result:<key>` (Pfad,
+    Größe, Referenzen) plus Sorted Set nach letzter Nutzung für `evict_results` (Lua-Skript).
+    """
+
+    shared = True
+
+    # ====== JOBDATENSÄTZE ======
+    @abstractmethod
+    def save(self, job):
+        """Legt den Datensatz an bzw. aktualisiert ihn (Status, Felder aus `job.to_dict()`)."""
+
+    @abstractmethod
+    def load(self, job_id):
+        """Liefert den Datensatz (wie `Job.to_dict()`) oder None."""
+
+    def load_unfinished(self):
+        """Im gemeinsamen Betrieb übernehmen Leases unterbrochene Jobs, nicht der Neustart."""
+        return []
+
+    @abstractmethod
+    def purge(self, finished_before):
+        """Löscht abgeschlossene Jobs samt Ereignissen, die vor `finished_before` endeten."""
+
+    # ====== FORTSCHRITT ======
+    @abstractmethod
+    def append_event(self, job_id, index, event):
+        """Speichert ein Ereignis des Jobs an Position `index`."""
+
+    @abstractmethod
+    def events_since(self, job_id, cursor=0):
+        """Liefert die Ereignisse eines Jobs ab Position `cursor` (Position = SSE-Event-ID)."""
+
+    # ====== WARTESCHLANGE ======
+    @abstractmethod
+    def claim(self, owner, lease):
+        """Übernimmt atomar den nächsten wartenden (oder verwaisten) Job; liefert seine ID oder None.
+
+        Reihenfolge: höchste Priorität, dann der Client mit den wenigsten laufenden Jobs, dann FIFO.
+        """
+
+    @abstractmethod
+    def renew(self, owner, job_ids, lease):
+        """Verlängert die Leases der eigenen laufenden Jobs."""
+
+    @abstractmethod
+    def dequeue(self, job_id):
+        """Entfernt einen noch wartenden Job aus der Warteschlange; True, wenn er noch wartete."""
+
+    @abstractmethod
+    def request_cancel(self, job_id):
+        """Merkt einen Abbruchwunsch für den Besitzer eines laufenden Jobs vor."""
+
+    @abstractmethod
+    def cancel_requested(self, job_ids):
+        """Liefert die IDs aus `job_ids`, für die ein Abbruch angefordert wurde."""
+
+    @abstractmethod
+    def active_job(self, dedup_key):
+        """ID eines wartenden oder laufenden Jobs mit diesem Schlüssel (oder None)."""
+
+    @abstractmethod
+    def queue_depth(self):
+        """Anzahl wartender Jobs aller Instanzen."""
+
+    @abstractmethod
+    def queue_position(self, job_id):
+        """Position eines wartenden Jobs (1 = als nächster), 0 wenn er nicht mehr wartet."""
+
+    # ====== ERGEBNISSE ======
+    @abstractmethod
+    def put_result(self, key, path, size):
+        """Registriert ein Ergebnis; Referenzen eines bestehenden Eintrags bleiben erhalten."""
+
+    @abstractmethod
+    def lookup_result(self, key):
+        """Liefert den Pfad eines fertigen Ergebnisses (oder None)."""
+
+    @abstractmethod
+    def forget_result(self, key, path):
+        """Entfernt den Eintrag, sofern er noch auf `path` zeigt."""
+
+    @abstractmethod
+    def acquire_result(self, key):
+        """Erhöht den instanzübergreifenden Referenzzähler und die letzte Nutzung; liefert den Pfad oder None."""
+
+    @abstractmethod
+    def release_result(self, key):
+        """Gibt eine mit `acquire_result` genommene Referenz frei."""
+
+    @abstractmethod
+    def touch_result(self, key):
+        """Markiert ein Ergebnis als benutzt (schützt es `min_retention` lang vor Verdrängung)."""
+
+    @abstractmethod
+    def evict_results(self, max_bytes, retain_after, stale_after, keep=None):
+        """Entfernt atomar die am längsten unbenutzten Einträge ohne Referenzen, bis alle Ergebnisse
+        zusammen höchstens `max_bytes` belegen; liefert [(key, path)], deren Dateien zu löschen sind.
+
+        Geschützt sind Einträge, die seit `retain_after` benutzt wurden. Referenzen gelten als verwaist
+        (abgestürzte Instanz), wenn die letzte Nutzung vor `stale_after` liegt.
+        """
+
+
+class SqliteStateBackend(StateBackend):
+    """StateBackend in einer SQLite-Datei (WAL) für mehrere Prozesse auf einem Host.
+
+    Für mehrere Hosts müssen Datenbank und RESULT_STORE_DIR auf gemeinsamem Speicher liegen.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        conn = self._connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, status TEXT NOT NULL, record TEXT NOT NULL, '
+            'priority INTEGER NOT NULL, client_id TEXT, dedup_key TEXT, created_at REAL NOT NULL, '
+            'finished_at REAL, owner TEXT, lease_until REAL, cancel INTEGER NOT NULL DEFAULT 0, '
+            'updated_at REAL NOT NULL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, priority, created_at)')
+        conn.execute('CREATE INDEX IF NOT EXISTS jobs_dedup ON jobs (dedup_key, status)')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS events '
+            '(job_id TEXT NOT NULL, idx INTEGER NOT NULL, event TEXT NOT NULL, PRIMARY KEY (job_id, idx))'
+        )
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, path TEXT NOT NULL, size INTEGER NOT NULL, '
+            'stored_at REAL NOT NULL, refs INTEGER NOT NULL DEFAULT 0, last_access REAL)'
+        )
+        # Datenbanken älterer Versionen ohne Referenzzähler
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(results)')}
+        if 'refs' not in columns:
+            conn.execute('ALTER TABLE results ADD COLUMN refs INTEGER NOT NULL DEFAULT 0')
+        if 'last_access' not in columns:
+            conn.execute('ALTER TABLE results ADD COLUMN last_access REAL')
+            conn.execute('UPDATE results SET last_access = stored_at')
+
+    def _connect(self):
+        """Eine Verbindung pro Thread; Autocommit, Transaktionen nur explizit (claim)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    # ====== JOBDATENSÄTZE ======
+    def save(self, job):
+        record = job.to_dict()
+        # Owner, Lease und Abbruchwunsch gehören der Warteschlange und bleiben unverändert
+        self._connect().execute(
+            'INSERT INTO jobs (id, status, record, priority, client_id, dedup_key, created_at, finished_at, updated_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (id) DO UPDATE SET status = excluded.status, '
+            'record = excluded.record, priority = excluded.priority, finished_at = excluded.finished_at, '
+            'updated_at = excluded.updated_at',
+            (job.id, job.status, json.dumps(record), job.priority, job.client_id, job.dedup_key,
+             job.created_at, job.finished_at, time.time()),
+        )
+
+    def load(self, job_id):
+        row = self._connect().execute('SELECT record, status FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        record = json.loads(row[0])
+        # Status aus der Warteschlange ist aktueller (z.B. per claim übernommen oder abgebrochen)
+        record['status'] = row[1]
+        return record
+
+    def purge(self, finished_before):
+        conn = self._connect()
+        conn.execute(
+            'DELETE FROM events WHERE job_id IN (SELECT id FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?)',
+            (finished_before,),
+        )
+        conn.execute('DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?', (finished_before,))
+
+    # ====== FORTSCHRITT ======
+    def append_event(self, job_id, index, event):
+        self._connect().execute(
+            'INSERT OR REPLACE INTO events (job_id, idx, event) VALUES (?, ?, ?)', (job_id, index, json.dumps(event))
+        )
+
+    def events_since(self, job_id, cursor=0):
+        rows = self._connect().execute(
+            'SELECT event FROM events WHERE job_id = ? AND idx >= ? ORDER BY idx', (job_id, cursor)
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    # ====== WARTESCHLANGE ======
+    def claim(self, owner, lease):
+        conn = self._connect()
+        now = time.time()
+        # IMMEDIATE sperrt für Schreiber sofort: zwei Prozesse können nicht denselben Job übernehmen
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT id FROM jobs AS j WHERE cancel = 0 AND '
+                '(status = ? OR (status = ? AND lease_until < ?)) '
+                'ORDER BY priority DESC, '
+                '(SELECT COUNT(*) FROM jobs AS r WHERE r.status = ? AND r.client_id = j.client_id '
+                ' AND r.lease_until >= ?), created_at '
+                'LIMIT 1',
+                (QUEUED, RUNNING, now, RUNNING, now),
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    'UPDATE jobs SET status = ?, owner = ?, lease_until = ? WHERE id = ?',
+                    (RUNNING, owner, now + lease, row[0]),
+                )
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return row[0] if row else None
+
+    def renew(self, owner, job_ids, lease):
+        if not job_ids:
+            return
+        self._connect().executemany(
+            'UPDATE jobs SET lease_until = ? WHERE id = ? AND owner = ?',
+            [(time.time() + lease, job_id, owner) for job_id in job_ids],
+        )
+
+    def dequeue(self, job_id):
+        cursor = self._connect().execute(
+            'UPDATE jobs SET status = ?, cancel = 1 WHERE id = ? AND status = ?', (CANCELLED, job_id, QUEUED)
+        )
+        return cursor.rowcount > 0
+
+    def request_cancel(self, job_id):
+        self._connect().execute('UPDATE jobs SET cancel = 1 WHERE id = ?', (job_id,))
+
+    def cancel_requested(self, job_ids):
+        if not job_ids:
+            return set()
+        placeholders = ','.join('?' * len(job_ids))
+        rows = self._connect().execute(
+            f'SELECT id FROM jobs WHERE cancel = 1 AND id IN ({placeholders})', list(job_ids)
+        ).fetchall()
+        return {row[0] for row in rows}
+
+    def active_job(self, dedup_key):
+        row = self._connect().execute(
+            'SELECT id FROM jobs WHERE dedup_key = ? AND status IN (?, ?) AND cancel = 0 ORDER BY created_at LIMIT 1',
+            (dedup_key, QUEUED, RUNNING),
+        ).fetchone()
+        return row[0] if row else None
+
+    def queue_depth(self):
+        return self._connect().execute('SELECT COUNT(*) FROM jobs WHERE status = ?', (QUEUED,)).fetchone()[0]
+
+    def queue_position(self, job_id):
+        conn = self._connect()
+        row = conn.execute('SELECT priority, created_at FROM jobs WHERE id = ? AND status = ?', (job_id, QUEUED)).fetchone()
+        if row is None:
+            return 0
+        ahead = conn.execute(
+            'SELECT COUNT(*) FROM jobs WHERE status = ? AND (priority > ? OR (priority = ? AND created_at < ?))',
+            (QUEUED, row[0], row[0], row[1]),
+        ).fetchone()[0]
+        return ahead + 1
+
+    # ====== ERGEBNISSE ======
+    def put_result(self, key, path, size):
+        now = time.time()
+        self._connect().execute(
+            'INSERT INTO results (key, path, size, stored_at, last_access) VALUES (?, ?, ?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET path = excluded.path, size = excluded.size, '
+            'stored_at = excluded.stored_at, last_access = excluded.last_access',
+            (key, path, size, now, now),
+        )
+
+    def lookup_result(self, key):
+        row = self._connect().execute('SELECT path FROM results WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def forget_result(self, key, path):
+        # Nur den eigenen Eintrag löschen, falls inzwischen ein neueres Ergebnis registriert wurde
+        self._connect().execute('DELETE FROM results WHERE key = ? AND path = ?', (key, path))
+
+    def acquire_result(self, key):
+        conn = self._connect()
+        # Erst zählen, dann lesen: ein referenzierter Eintrag wird von keiner Instanz mehr verdrängt
+        cursor = conn.execute('UPDATE results SET refs = refs + 1, last_access = ? WHERE key = ?', (time.time(), key))
+        if cursor.rowcount == 0:
+            return None
+        row = conn.execute('SELECT path FROM results WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def release_result(self, key):
+        self._connect().execute(
+            'UPDATE results SET refs = MAX(refs - 1, 0), last_access = ? WHERE key = ?', (time.time(), key)
+        )
+
+    def touch_result(self, key):
+        self._connect().execute('UPDATE results SET last_access = ? WHERE key = ?', (time.time(), key))
+
+    def evict_results(self, max_bytes, retain_after, stale_after, keep=None):
+        conn = self._connect()
+        evicted = []
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+            if total > max_bytes:
+                candidates = conn.execute(
+                    'SELECT key, path, size FROM results WHERE key IS NOT ? AND last_access < ? '
+                    'AND (refs = 0 OR last_access < ?) ORDER BY last_access',
+                    (keep, retain_after, stale_after),
+                ).fetchall()
+                for key, path, size in candidates:
+                    if total <= max_bytes:
+                        break
+                    conn.execute('DELETE FROM results WHERE key = ?', (key,))
+                    total -= size
+                    evicted.append((key, path))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return evicted
+
+
+def state_backend_from_env():
+    """Erstellt das gemeinsame Backend aus STATE_BACKEND (z.B. sqlite:///var/lib/stream-dl/state.db).
+
+    Ohne STATE_BACKEND bleibt alles im Prozess (nur ein Worker-Prozess möglich); None.
+    """
+    url = os.environ.get('STATE_BACKEND')
+    if not url:
+        return None
+    scheme, _, location = url.partition('://')
+    if scheme == 'sqlite' and location:
+        # sqlite:///pfad (absolut) bzw. sqlite://pfad (relativ)
+        return SqliteStateBackend(location)
+    raise ValueError(f'Unsupported STATE_BACKEND {url!r} (available: sqlite:///path/to/state.db)')
@@ -0,0 +1,209 @@
+import os
+import shutil
+import subprocess
+import threading
+import urllib.error
+import urllib.request
+from src.services.codecs import AUDIO_TARGETS, VIDEO_TARGETS, codec_family, container_accepts
+
+# Blockgröße beim Weiterreichen an den Client
+CHUNK_SIZE = 64 * 1024
+# Range-Blockgröße für Passthrough (YouTube drosselt große Einzelanfragen)
+PASSTHROUGH_RANGE_SIZE = 10 * 1024 * 1024
+
+# Protokolle, die ffmpeg bzw. der Passthrough direkt lesen können
+_DIRECT_PROTOCOLS = ('http', 'https', 'm3u8', 'm3u8_native')
+
+
+class StreamingUnsupported(Exception):
+    """Das gewählte Format kann nicht direkt gestreamt werden (Fallback: normaler Job)."""
+
+
+def ffmpeg_binary():
+    """Findet das ffmpeg-Binary (neben der App oder im PATH)."""
+    local = os.path.abspath('ffmpeg.exe' if os.name == 'nt' else 'ffmpeg')
+    if os.path.isfile(local):
+        return local
+    found = shutil.which('ffmpeg')
+    if not found:
+        raise StreamingUnsupported('ffmpeg not found')
+    return found
+
+
+def selected_formats(info):
+    """Liefert die von yt-dlp ausgewählten Formate (eins oder Video+Audio)."""
+    formats = info.get('requested_formats') or [info]
+    for f in formats:
+        if not f.get('url') or f.get('protocol', 'https') not in _DIRECT_PROTOCOLS:
+            raise StreamingUnsupported(f"Format {f.get('format_id')} ({f.get('protocol')}) cannot be streamed")
+    return formats
+
+
+def _request_headers(fmt):
+    headers = dict(fmt.get('http_headers') or {})
+    if fmt.get('cookies'):
+        headers['Cookie'] = fmt['cookies']
+    return headers
+
+
+class StreamPlan:
+    """Beschreibt, wie ein Format an den Client gestreamt wird: direkt oder über eine ffmpeg-Pipe."""
+
+    def __init__(self, formats, download_type, output_format):
+        self.formats = formats
+        self.download_type = download_type
+        self.output_format = output_format
+        self.passthrough = self._can_passthrough()
+        if download_type == 'audio':
+            target = AUDIO_TARGETS.get(output_format)
+        else:
+            target = VIDEO_TARGETS.get(output_format)
+        if target is None:
+            raise StreamingUnsupported(f'Output format {output_format} cannot be streamed')
+        self.target = target
+        self.mimetype = target['mimetype']
+
+    def _can_passthrough(self):
+        if len(self.formats) != 1:
+            return False
+        fmt = self.formats[0]
+        if fmt.get('protocol', 'https') not in ('http', 'https'):
+            return False
+        if self.download_type == 'audio':
+            return fmt.get('vcodec') in (None, 'none') and fmt.get('ext') == self.output_format
+        return fmt.get('ext') == self.output_format
+
+    def ffmpeg_command(self):
+        """Baut den ffmpeg-Aufruf, der das Ergebnis als nicht-suchbaren Stream nach stdout schreibt."""
+        cmd = [ffmpeg_binary(), '-hide_banner', '-loglevel', 'error', '-nostdin']
+        for fmt in self.formats:
+            headers = _request_headers(fmt)
+            if headers and fmt.get('protocol', 'https').startswith('http'):
+                cmd += ['-headers', ''.join(f'{k}: {v}\r\n' for k, v in headers.items())]
+            cmd += ['-i', fmt['url']]
+
+        vcodecs = [codec_family(f.get('vcodec')) for f in self.formats]
+        acodecs = [codec_family(f.get('acodec')) for f in self.formats]
+        vcodec = next((c for c in vcodecs if c), None)
+        acodec = next((c for c in acodecs if c), None)
+
+        if self.download_type == 'audio':
+            audio_index = next(i for i, c in enumerate(acodecs) if c) if acodec else 0
+            cmd += ['-map', f'{audio_index}:a:0', '-vn']
+            if acodec == self.target['codec']:
+                cmd += ['-c:a', 'copy']
+            else:
+                cmd += ['-c:a', self.target['encoder']]
+                if self.target['codec'] not in ('pcm', 'flac'):
+                    cmd += ['-b:a', '192k']
+        else:
+            video_index = next((i for i, c in enumerate(vcodecs) if c), 0)
+            cmd += ['-map', f'{video_index}:v:0']
+            if acodec:
+                audio_index = next(i for i, c in enumerate(acodecs) if c)
+                cmd += ['-map', f'{audio_index}:a:0']
+            copy_video = container_accepts(self.output_format, vcodec=vcodec)
+            copy_audio = container_accepts(self.output_format, acodec=acodec)
+            cmd += ['-c:v', 'copy' if copy_video else self.target['vencoder']]
+            if acodec:
+                cmd += ['-c:a', 'copy' if copy_audio else self.target['aencoder']]
+
+        muxer = self.target['muxer']
+        if muxer in ('mp4', 'mov'):
+            # Fragmentiertes MP4: moov vorne, damit ohne Suchen in eine Pipe geschrieben werden kann
+            cmd += ['-movflags', 'frag_keyframe+empty_moov+default_base_moof']
+        cmd += ['-f', muxer, 'pipe:1']
+        return cmd
+
+
+def _content_range_total(value):
+    """Gesamtgröße aus `Content-Range: bytes a-b/total`, None wenn unbekannt."""
+    total = (value or '').rpartition('/')[2].strip()
+    return int(total) if total.isdigit() else None
+
+
+def iter_passthrough(fmt):
+    """Reicht die Bytes eines einzelnen HTTP-Formats in Range-Blöcken durch."""
+    headers = _request_headers(fmt)
+    position = 0
+    while True:
+        request = urllib.request.Request(fmt['url'], headers={
+            **headers, 'Range': f'bytes={position}-{position + PASSTHROUGH_RANGE_SIZE - 1}',
+        })
+        try:
+            response = urllib.request.urlopen(request, timeout=30)
+        except urllib.error.HTTPError as e:
+            # Dateigröße exakt ein Vielfaches der Blockgröße: der nächste Bereich liegt hinter dem Ende
+            if e.code == 416 and position > 0:
+                return
+            raise
+        with response:
+            received = 0
+            while True:
+                chunk = response.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                received += len(chunk)
+                yield chunk
+            # Server ohne Range-Unterstützung liefert alles auf einmal
+            if response.status != 206 or received < PASSTHROUGH_RANGE_SIZE:
+                return
+            total = _content_range_total(response.headers.get('Content-Range'))
+        position += received
+        if total is not None and position >= total:
+            return
+
+
+def iter_ffmpeg(cmd):
+    """Startet ffmpeg und liefert dessen stdout blockweise; beendet den Prozess bei Abbruch."""
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.DEVNULL)
+    stderr_lines = []
+    # stderr parallel lesen, damit ffmpeg nicht an einer vollen Pipe hängen bleibt
+    reader = threading.Thread(target=lambda: stderr_lines.extend(process.stderr), daemon=True)
+    reader.start()
+    try:
+        while True:
+            # read1 gibt sofort zurück, was ffmpeg bereits geschrieben hat
+            chunk = process.stdout.read1(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+        if process.wait() != 0:
+            message = stderr_lines[-1].decode('utf-8', 'replace').strip() if stderr_lines else 'ffmpeg failed'
+            print(f"⚠️ Streaming ffmpeg exited with {process.returncode}: {message}")
+    finally:
+        if process.poll() is None:
+            process.kill()
+            print("🛑 Client disconnected, stopped streaming ffmpeg")
+        process.wait()
+        process.stdout.close()
+
+
+class StreamSlots:
+    """Begrenzt die Anzahl gleichzeitiger Direkt-Streams (STREAM_WORKERS)."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._semaphore = threading.BoundedSemaphore(limit)
+        self._in_use = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(int(os.environ.get('STREAM_WORKERS', 4)))
+
+    def try_acquire(self):
+        acquired = self._semaphore.acquire(blocking=False)
+        if acquired:
+            with self._lock:
+                self._in_use += 1
+        return acquired
+
+    def release(self):
+        with self._lock:
+            self._in_use -= 1
+        self._semaphore.release()
+
+    def in_use(self):
+        with self._lock:
+            return self._in_use
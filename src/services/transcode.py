@@ -0,0 +1,140 @@
+from src.services.codecs import AUDIO_TARGETS, codec_family, container_accepts
+
+# Entscheidungen des Planers
+NONE = 'none'          # Quelle hat bereits das Zielformat
+COPY = 'copy'          # Audiospur ohne Neukodierung übernehmen
+REMUX = 'remux'        # Streams unverändert in einen anderen Container kopieren
+REENCODE = 'reencode'  # Neukodierung nötig (teuer)
+
+# Standard-Bitrate der Audio-Konvertierung in kbit/s
+DEFAULT_AUDIO_QUALITY = 192
+# Zielformate, bei denen eine Bitrate keine Rolle spielt
+_LOSSLESS_AUDIO = ('flac', 'wav')
+# yt-dlp kennt 'ogg' nur als Codec 'vorbis'
+_EXTRACT_AUDIO_CODECS = {'ogg': 'vorbis'}
+
+
+class TranscodePlan:
+    """Ergebnis des Planers: Postprozessoren für yt-dlp plus eine Begründung für den Client."""
+
+    def __init__(self, action, reason, postprocessors=None, merge_output_format=None, source=None, bitrate=None):
+        self.action = action
+        self.reason = reason
+        self.postprocessors = postprocessors or []
+        self.merge_output_format = merge_output_format
+        self.source = source or {}
+        self.bitrate = bitrate
+
+    @property
+    def reencode(self):
+        return self.action == REENCODE
+
+    def to_dict(self):
+        data = {'action': self.action, 'reason': self.reason, 'source': self.source}
+        if self.bitrate:
+            data['bitrate'] = f'{self.bitrate}k'
+        return data
+
+
+def lookup_formats(quality, metadata):
+    """Sucht die Formate einer Format-Angabe (z.B. '137+140' oder '22/18') in den Analyse-Metadaten.
+
+    Liefert die Liste der Format-Dicts der ersten vollständig bekannten Alternative oder None
+    (z.B. bei 'bestaudio' oder ohne Metadaten).
+    """
+    if not metadata or not quality:
+        return None
+    known = {f['format_id']: f for f in metadata.get('video_formats', []) + metadata.get('audio_formats', [])}
+    for alternative in quality.split('/'):
+        ids = [part.strip() for part in alternative.split('+')]
+        if all(format_id in known for format_id in ids):
+            return [known[format_id] for format_id in ids]
+    return None
+
+
+def resolve_formats(quality, metadata):
+    """Wie `lookup_formats`, aber nur wenn die Codecs aller Formate bekannt sind (sonst None,
+    z.B. bei Metadaten aus einer älteren Cache-Version)."""
+    formats = lookup_formats(quality, metadata)
+    # None heißt "unbekannt" ('none' dagegen "keine Spur"): dann lieber konservativ planen
+    if formats and all(f.get('vcodec') is not None and f.get('acodec') is not None for f in formats):
+        return formats
+    return None
+
+
+def _source_codecs(formats):
+    vcodec = next((codec_family(f.get('vcodec')) for f in formats if codec_family(f.get('vcodec'))), None)
+    acodec = next((codec_family(f.get('acodec')) for f in formats if codec_family(f.get('acodec'))), None)
+    abr = next((f.get('abr') for f in formats if codec_family(f.get('acodec')) and f.get('abr')), None)
+    return vcodec, acodec, abr
+
+
+def _audio_plan(output_format, formats):
+    preferred = _EXTRACT_AUDIO_CODECS.get(output_format, output_format)
+    target = AUDIO_TARGETS.get(output_format)
+    if formats is None or target is None:
+        return TranscodePlan(
+            REENCODE, 'Quell-Codec unbekannt, konvertiere mit Standardqualität',
+            [{'key': 'FFmpegExtractAudio', 'preferredcodec': preferred,
+              'preferredquality': str(DEFAULT_AUDIO_QUALITY)}],
+            bitrate=DEFAULT_AUDIO_QUALITY,
+        )
+
+    _, acodec, abr = _source_codecs(formats)
+    source = {'acodec': acodec, 'abr': abr}
+    if acodec and acodec == target['codec']:
+        # FFmpegExtractAudio kopiert die Spur selbst, wenn der Codec bereits passt
+        return TranscodePlan(
+            COPY, f'Audiospur ist bereits {acodec}, wird nur kopiert',
+            [{'key': 'FFmpegExtractAudio', 'preferredcodec': preferred}], source=source,
+        )
+
+    bitrate = None
+    postprocessor = {'key': 'FFmpegExtractAudio', 'preferredcodec': preferred}
+    if output_format not in _LOSSLESS_AUDIO:
+        # Nicht höher kodieren als die Quelle hergibt (spart CPU und Speicher)
+        bitrate = min(DEFAULT_AUDIO_QUALITY, int(abr)) if abr else DEFAULT_AUDIO_QUALITY
+        postprocessor['preferredquality'] = str(bitrate)
+    return TranscodePlan(
+        REENCODE, f'{acodec or "unbekannt"} → {target["codec"]} erfordert Neukodierung',
+        [postprocessor], source=source, bitrate=bitrate,
+    )
+
+
+def _video_plan(output_format, formats):
+    if formats is None:
+        # Ohne Codec-Angaben wie bisher: nur für andere Container als mp4 konvertieren
+        if output_format == 'mp4':
+            return TranscodePlan(NONE, 'Quell-Codecs unbekannt, keine Nachbearbeitung')
+        return TranscodePlan(
+            REENCODE, 'Quell-Codecs unbekannt, konvertiere',
+            [{'key': 'FFmpegVideoConvertor', 'preferedformat': output_format}],
+        )
+
+    vcodec, acodec, _ = _source_codecs(formats)
+    source = {'vcodec': vcodec, 'acodec': acodec, 'ext': formats[0].get('ext')}
+    merge_output_format = output_format if len(formats) > 1 else None
+    if len(formats) == 1 and formats[0].get('ext') == output_format:
+        return TranscodePlan(NONE, f'Quelle ist bereits {output_format}', source=source)
+    if container_accepts(output_format, vcodec=vcodec, acodec=acodec):
+        # Beim Zusammenführen direkt in den Zielcontainer schreiben, sonst Streams umkopieren
+        return TranscodePlan(
+            REMUX, f'{output_format} nimmt {vcodec or "-"}/{acodec or "-"} ohne Neukodierung auf',
+            [{'key': 'FFmpegVideoRemuxer', 'preferedformat': output_format}],
+            merge_output_format=merge_output_format, source=source,
+        )
+    return TranscodePlan(
+        REENCODE, f'{output_format} unterstützt {vcodec or "-"}/{acodec or "-"} nicht, Neukodierung nötig',
+        [{'key': 'FFmpegVideoConvertor', 'preferedformat': output_format}], source=source,
+    )
+
+
+def plan_transcode(download_type, output_format, formats):
+    """Wählt Kopieren/Remux, wann immer der Zielcontainer die Quell-Codecs aufnehmen kann.
+
+    `formats` sind die ausgewählten Formate aus den Analyse-Metadaten (mit vcodec/acodec/abr)
+    oder None, wenn sie unbekannt sind – dann wird wie bisher konvertiert.
+    """
+    if download_type == 'audio':
+        return _audio_plan(output_format, formats)
+    return _video_plan(output_format, formats)
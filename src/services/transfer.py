@@ -0,0 +1,180 @@
+import os
+import re
+import time
+import threading
+
+# Protokolle, die yt-dlp fragmentweise lädt (nur dort wirkt concurrent_fragment_downloads)
+FRAGMENT_PROTOCOLS = ('m3u8_native', 'http_dash_segments', 'http_dash_segments_generator', 'ism', 'f4m')
+# Zeitraum, in dem ein Transfer ohne neue Bytes noch als aktiv gilt
+ACTIVE_WINDOW = 1.0
+# Maximaler Vorlauf, den ein Transfer nach einer Pause ungebremst nachholen darf
+BURST_SECONDS = 0.5
+
+
+_size_re = re.compile(r'^(\d+(?:\.\d+)?)([kmgt]?)i?b?$', re.IGNORECASE)
+_SIZE_UNITS = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3, 't': 1024 ** 4}
+
+
+def parse_size(value):
+    """Wandelt Größenangaben wie '50M', '1.5G' oder '800k' (Basis 1024) in Bytes um; None wenn leer/ungültig."""
+    match = _size_re.match((value or '').strip())
+    if not match:
+        return None
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2).lower()])
+
+
+def fast_downloads_enabled():
+    """Hochdurchsatz-Modus (FAST_DOWNLOADS=1, standardmäßig aus): parallele Spuren und Fragmente.
+
+    Opt-in, weil ParallelYoutubeDL interne yt-dlp-Methoden nachbildet.
+    """
+    return os.environ.get('FAST_DOWNLOADS', '0') in ('1', 'true', 'yes')
+
+
+class BandwidthBudget:
+    """Globales Bandbreitenbudget, fair aufgeteilt auf alle gerade aktiven Transfers.
+
+    Jeder Transfer (`lease()`) bekommt `limit / aktive Transfers` Bytes pro Sekunde, egal wie
+    viele Verbindungen er nutzt. Gebremst wird im Progress-Hook des Downloads, der bei jedem
+    gelesenen Block (auch in den Fragment-Threads) aufgerufen wird.
+    """
+
+    def __init__(self, limit=None, clock=time.monotonic, sleep=time.sleep):
+        self.limit = limit
+        self.clock = clock
+        self.sleep = sleep
+        self._leases = set()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Erstellt das Budget aus BANDWIDTH_LIMIT (z.B. 50M für 50 MiB/s; leer = unbegrenzt)."""
+        return cls(parse_size(os.environ.get('BANDWIDTH_LIMIT')) or None)
+
+    def lease(self):
+        return _Lease(self)
+
+    def active_count(self):
+        now = self.clock()
+        with self._lock:
+            return sum(1 for lease in self._leases if now - lease.last_activity <= ACTIVE_WINDOW)
+
+    def share(self):
+        """Aktuelle Bandbreite pro aktivem Transfer in Bytes pro Sekunde (None = unbegrenzt)."""
+        if not self.limit:
+            return None
+        return self.limit / max(self.active_count(), 1)
+
+
+class _Lease:
+    """Anteil eines Jobs am Budget; pro Datei werden die neu gelesenen Bytes gezählt."""
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.last_activity = budget.clock()
+        self._next_send = None
+        self._seen = {}  # Dateiname -> bereits verbuchte Bytes
+        self._lock = threading.Lock()
+        with budget._lock:
+            budget._leases.add(self)
+
+    def consume(self, nbytes):
+        """Verbucht `nbytes` und wartet, bis der Transfer wieder innerhalb seines Anteils liegt."""
+        if nbytes <= 0:
+            return
+        now = self.budget.clock()
+        self.last_activity = now
+        rate = self.budget.share()
+        if not rate:
+            return
+        with self._lock:
+            start = max(self._next_send or now, now - BURST_SECONDS)
+            self._next_send = start + nbytes / rate
+            delay = self._next_send - now
+        if delay > 0:
+            self.budget.sleep(delay)
+
+    def progress_hook(self, d):
+        """Progress-Hook für yt-dlp: `downloaded_bytes` ist kumuliert, gebremst wird nur der Zuwachs."""
+        if d.get('status') != 'downloading' or not self.budget.limit:
+            return
+        key = d.get('tmpfilename') or d.get('filename') or ''
+        downloaded = d.get('downloaded_bytes') or 0
+        with self._lock:
+            delta = downloaded - self._seen.get(key, 0)
+            if delta > 0:
+                self._seen[key] = downloaded
+        self.consume(delta)
+
+    def close(self):
+        with self.budget._lock:
+            self.budget._leases.discard(self)
+
+
+class ConcurrencyController:
+    """Passt die Anzahl paralleler Fragment-Verbindungen je Host an den gemessenen Durchsatz an.
+
+    Hill-Climbing: nach einer Messung wird die doppelte Parallelität ausprobiert; bringt sie
+    mindestens `gain` mehr Gesamtdurchsatz, wird sie übernommen, sonst geht es zurück.
+    Alle `reprobe_after` stabilen Downloads wird erneut nach oben getestet.
+    """
+
+    def __init__(self, minimum=1, maximum=8, gain=0.1, reprobe_after=5):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.gain = gain
+        self.reprobe_after = reprobe_after
+        self._hosts = {}  # Host -> {'level', 'baseline': (n, Durchsatz), 'stable'}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Erstellt den Regler aus FRAGMENT_WORKERS_MIN und FRAGMENT_WORKERS_MAX."""
+        return cls(
+            minimum=int(os.environ.get('FRAGMENT_WORKERS_MIN', 1)),
+            maximum=int(os.environ.get('FRAGMENT_WORKERS_MAX', 8)),
+        )
+
+    def _state(self, host):
+        return self._hosts.setdefault(host, {'level': self.minimum, 'baseline': None, 'stable': 0})
+
+    def choose(self, host):
+        with self._lock:
+            return self._state(host)['level']
+
+    def report(self, host, workers, nbytes, seconds):
+        """Meldet einen abgeschlossenen Fragment-Download mit `workers` Verbindungen."""
+        if seconds <= 0 or nbytes <= 0:
+            return
+        throughput = nbytes / seconds
+        with self._lock:
+            state = self._state(host)
+            baseline = state['baseline']
+            probe = lambda n: min(max(n * 2, n + 1), self.maximum)
+            if baseline is None:
+                state['baseline'] = (workers, throughput)
+                state['level'] = probe(workers)
+            elif workers > baseline[0]:
+                # Ergebnis einer Erhöhung
+                if throughput >= baseline[1] * (1 + self.gain):
+                    state['baseline'] = (workers, throughput)
+                    state['level'] = probe(workers)
+                else:
+                    state['level'] = baseline[0]
+                state['stable'] = 0
+            else:
+                # Normalbetrieb: Referenzdurchsatz nachführen, regelmäßig wieder nach oben testen
+                state['baseline'] = (workers, 0.5 * baseline[1] + 0.5 * throughput)
+                state['stable'] += 1
+                if throughput < baseline[1] * (1 - self.gain) and workers > self.minimum:
+                    # Durchsatz eingebrochen (z.B. Origin überlastet): Parallelität halbieren
+                    state['level'] = max(workers // 2, self.minimum)
+                    state['baseline'] = (state['level'], throughput)
+                    state['stable'] = 0
+                elif state['stable'] >= self.reprobe_after:
+                    state['level'] = probe(workers)
+                    state['stable'] = 0
+
+    def levels(self):
+        with self._lock:
+            return {host: state['level'] for host, state in self._hosts.items()}
@@ -0,0 +1,282 @@
+import os
+import json
+import time
+import shutil
+import tempfile
+import threading
+from src.services.metrics import directory_size
+
+# Datei im Arbeitsordner, über die der besitzende Prozess seine Ordner als lebendig markiert
+OWNER_FILE = '.owner'
+# Angenommene Ausgabegröße, wenn die Metadaten keine Dateigröße liefern
+DEFAULT_ESTIMATE = 256 * 1024 ** 2
+
+
+class InsufficientSpace(RuntimeError):
+    """Für den Job ist (auch nach Warten) nicht genug Platz im Arbeitsverzeichnis."""
+
+
+def postprocess_overhead(postprocess=True, reencode=False):
+    """Faktor zwischen Quellgröße und Spitzenbelegung im Arbeitsordner.
+
+    Während der Nachbearbeitung liegen Quelle und Ergebnis gleichzeitig im Ordner; eine
+    Neukodierung kann zudem größer als die Quelle werden.
+    """
+    if not postprocess:
+        return 1.0
+    return 2.5 if reencode else 2.0
+
+
+def projected_bytes(formats, overhead=1.0):
+    """Schätzt den Platzbedarf eines Jobs aus `filesize`/`filesize_approx` der gewählten Formate
+    (ohne Größenangaben: DEFAULT_ESTIMATE)."""
+    sizes = [f.get('filesize_bytes') for f in formats or ()]
+    source = sum(sizes) if sizes and all(sizes) else DEFAULT_ESTIMATE
+    return int(source * overhead)
+
+
+class WorkDir:
+    """Reservierter Arbeitsordner eines Jobs; `release()` löscht ihn und gibt die Reservierung frei."""
+
+    def __init__(self, manager, path, reserved, overhead=1.0):
+        self.manager = manager
+        self.path = path
+        self.reserved = reserved
+        self.overhead = overhead
+        self.created_at = time.time()
+        self._totals = {}  # Dateiname -> erwartete Größe laut yt-dlp
+        self._released = False
+
+    def progress_hook(self, d):
+        """Vergrößert die Reservierung, wenn yt-dlp größere Dateien meldet als geschätzt.
+
+        Passt das nicht mehr in die Quota, wird der Download mit InsufficientSpace abgebrochen.
+        """
+        total = d.get('total_bytes') or d.get('total_bytes_estimate')
+        if d.get('status') != 'downloading' or not total:
+            return
+        self._totals[d.get('filename') or ''] = total
+        expected = int(sum(self._totals.values()) * self.overhead)
+        if expected > self.reserved:
+            self.manager.grow(self, expected)
+
+    def usage(self):
+        return directory_size(self.path)
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        shutil.rmtree(self.path, ignore_errors=True)
+        print(f"🧹 Deleted temporary directory: {self.path}")
+        self.manager._forget(self)
+
+
+class WorkDirManager:
+    """Verwaltet die Arbeitsordner der Downloads unter einem gemeinsamen Wurzelverzeichnis.
+
+    Jobs reservieren vorab ihren geschätzten Platzbedarf (`admit`). Überschreitet die Summe
+    der Reservierungen die Quota oder bliebe auf dem Datenträger weniger als `min_free` frei,
+    wartet der Job bis zu `admission_timeout` Sekunden auf frei werdenden Platz; kann er
+    nie passen, wird er sofort abgelehnt.
+
+    Ein Hintergrund-Thread erneuert die Besitzmarke (OWNER_FILE) der eigenen Ordner und löscht
+    verwaiste Ordner (Marke älter als `stale_after`, z.B. nach einem Absturz) sowie fremde
+    Dateien, die älter als `max_age` sind. Beim Start werden Reste früherer Läufe entfernt.
+    """
+
+    def __init__(self, root, quota=0, min_free=1024 ** 3, admission_timeout=120,
+                 max_age=6 * 3600, sweep_interval=60):
+        self.root = root
+        self.quota = quota
+        self.min_free = min_free
+        self.admission_timeout = admission_timeout
+        self.max_age = max_age
+        self.sweep_interval = sweep_interval
+        # Drei verpasste Erneuerungen: der Besitzer lebt nicht mehr
+        self.stale_after = 3 * sweep_interval
+        self._dirs = {}  # Pfad -> WorkDir
+        self._cond = threading.Condition()
+        self._stats = {'admitted': 0, 'waited': 0, 'rejected': 0, 'swept': 0, 'recovered': 0}
+        self._sweeper = None
+        os.makedirs(self.root, exist_ok=True)
+        self._recover()
+
+    @classmethod
+    def from_env(cls):
+        """Erstellt den Manager aus WORK_DIR, WORK_DIR_QUOTA, WORK_DIR_MIN_FREE, WORK_ADMISSION_TIMEOUT,
+        WORK_DIR_MAX_AGE und WORK_SWEEP_INTERVAL (Größen in Bytes, Zeiten in Sekunden)."""
+        return cls(
+            root=os.environ.get('WORK_DIR') or os.path.join(tempfile.gettempdir(), 'stream-dl-work'),
+            quota=int(os.environ.get('WORK_DIR_QUOTA', 0)),
+            min_free=int(os.environ.get('WORK_DIR_MIN_FREE', 1024 ** 3)),
+            admission_timeout=float(os.environ.get('WORK_ADMISSION_TIMEOUT', 120)),
+            max_age=float(os.environ.get('WORK_DIR_MAX_AGE', 6 * 3600)),
+            sweep_interval=float(os.environ.get('WORK_SWEEP_INTERVAL', 60)),
+        )
+
+    def start(self):
+        """Startet den Sweeper-Thread (einmalig)."""
+        with self._cond:
+            if self._sweeper is not None:
+                return
+            self._sweeper = threading.Thread(target=self._sweep_loop, name='workdir-sweeper', daemon=True)
+        self._sweeper.start()
+
+    # ====== RESERVIERUNG ======
+    def _outstanding(self):
+        """Noch nicht geschriebener Teil aller Reservierungen. Muss mit gehaltenem Lock aufgerufen werden."""
+        return sum(max(work_dir.reserved - work_dir.usage(), 0) for work_dir in self._dirs.values())
+
+    def _reserved(self):
+        return sum(work_dir.reserved for work_dir in self._dirs.values())
+
+    def _fits(self, nbytes):
+        """Muss mit gehaltenem Lock aufgerufen werden."""
+        if self.quota and self._reserved() + nbytes > self.quota:
+            return False
+        free = shutil.disk_usage(self.root).free
+        return free - self._outstanding() - nbytes >= self.min_free
+
+    def _never_fits(self, nbytes):
+        if self.quota and nbytes > self.quota:
+            return True
+        return nbytes > shutil.disk_usage(self.root).total - self.min_free
+
+    def admit(self, name, nbytes, overhead=1.0, cancel_event=None, on_wait=None):
+        """Reserviert `nbytes` und legt einen Arbeitsordner an (`overhead` siehe postprocess_overhead).
+
+        Wartet, solange andere Jobs Platz belegen, ruft dabei einmal `on_wait()` auf und liefert
+        None, falls währenddessen `cancel_event` gesetzt wird. Raises InsufficientSpace.
+        """
+        deadline = time.monotonic() + self.admission_timeout
+        waited = False
+        with self._cond:
+            if self._never_fits(nbytes):
+                self._stats['rejected'] += 1
+                raise InsufficientSpace(f'Job needs ~{nbytes // 1024 ** 2} MB, more than the work dir can hold')
+            while not self._fits(nbytes):
+                remaining = deadline - time.monotonic()
+                # Ohne andere Reservierungen wird in diesem Prozess nichts frei
+                if not self._dirs or remaining <= 0:
+                    self._stats['rejected'] += 1
+                    raise InsufficientSpace(f'Not enough disk space for ~{nbytes // 1024 ** 2} MB, try again later')
+                if not waited:
+                    waited = True
+                    self._stats['waited'] += 1
+                    if on_wait:
+                        on_wait()
+                self._cond.wait(min(remaining, 1.0))
+                if cancel_event is not None and cancel_event.is_set():
+                    return None
+            path = tempfile.mkdtemp(prefix=f'{name}-', dir=self.root)
+            work_dir = WorkDir(self, path, nbytes, overhead)
+            self._dirs[path] = work_dir
+            self._stats['admitted'] += 1
+        self._touch(path)
+        print(f"📁 Created temporary directory: {path} (reserved {nbytes // 1024 ** 2} MB)")
+        return work_dir
+
+    def grow(self, work_dir, nbytes):
+        """Erhöht die Reservierung eines laufenden Jobs ohne Warten. Raises InsufficientSpace."""
+        with self._cond:
+            if not self._fits(nbytes - work_dir.reserved):
+                raise InsufficientSpace(f'Download grew to ~{nbytes // 1024 ** 2} MB, work dir quota exceeded')
+            work_dir.reserved = nbytes
+
+    def _forget(self, work_dir):
+        with self._cond:
+            self._dirs.pop(work_dir.path, None)
+            self._cond.notify_all()
+
+    # ====== AUFRÄUMEN ======
+    def _touch(self, path):
+        """Schreibt bzw. erneuert die Besitzmarke eines eigenen Ordners."""
+        try:
+            with open(os.path.join(path, OWNER_FILE), 'w', encoding='utf-8') as f:
+                json.dump({'pid': os.getpid()}, f)
+        except OSError:
+            pass
+
+    def _owner(self, path):
+        """Liefert (pid, Alter der Besitzmarke in Sekunden) oder (None, None) ohne Marke."""
+        marker = os.path.join(path, OWNER_FILE)
+        try:
+            with open(marker, encoding='utf-8') as f:
+                pid = json.load(f).get('pid')
+            return pid, time.time() - os.path.getmtime(marker)
+        except (OSError, ValueError):
+            return None, None
+
+    def _remove(self, path):
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _orphaned(self, path, startup=False):
+        """Entscheidet, ob ein Eintrag im Wurzelverzeichnis keinem lebenden Job mehr gehört."""
+        try:
+            age = time.time() - os.path.getmtime(path)
+        except OSError:
+            return False
+        if not os.path.isdir(path):
+            return age > self.max_age
+        pid, heartbeat_age = self._owner(path)
+        if pid is None:
+            # Ordner ohne Marke (z.B. gerade angelegt oder von Hand erstellt)
+            return age > self.stale_after
+        # Beim Start gehört kein Ordner zu diesem Prozess (im Container ist die PID oft wieder 1)
+        if startup and pid == os.getpid():
+            return True
+        return heartbeat_age > self.stale_after
+
+    def _recover(self):
+        """Entfernt beim Start Arbeitsordner abgestürzter oder beendeter Prozesse."""
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if self._orphaned(path, startup=True):
+                self._remove(path)
+                self._stats['recovered'] += 1
+        if self._stats['recovered']:
+            print(f"♻️ Removed {self._stats['recovered']} leftover work dir(s) in {self.root}")
+
+    def sweep(self):
+        """Erneuert die eigenen Besitzmarken und löscht verwaiste oder abgelaufene Einträge."""
+        with self._cond:
+            own = set(self._dirs)
+        for path in own:
+            self._touch(path)
+        removed = 0
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if path not in own and self._orphaned(path):
+                self._remove(path)
+                removed += 1
+                print(f"🧹 Swept orphaned work dir: {path}")
+        with self._cond:
+            self._stats['swept'] += removed
+            # Freier Platz kann wartende Jobs zulassen
+            self._cond.notify_all()
+        return removed
+
+    def _sweep_loop(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"⚠️ Work dir sweep failed: {e}")
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats['active'] = len(self._dirs)
+            stats['reserved_bytes'] = self._reserved()
+        stats['used_bytes'] = directory_size(self.root)
+        stats['free_bytes'] = shutil.disk_usage(self.root).free
+        stats['quota'] = self.quota
+        return stats
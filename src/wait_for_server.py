@@ -2,17 +2,20 @@ import time
 import requests
 
 url = "http://127.0.0.1:5000"
-timeout = 10  # Sekunden warten
+ready_url = url + "/ready"
+timeout = 30  # Sekunden warten
 start_time = time.time()
 
 while time.time() - start_time < timeout:
     try:
-        requests.get(url)
-        print("Server is up!")
-        import os
-        os.startfile(url)  # Öffnet den Standardbrowser
-        break
-    except requests.ConnectionError:
-        time.sleep(1)
+        # /ready antwortet, sobald die App Anfragen annimmt (yt-dlp wärmt im Hintergrund vor)
+        if requests.get(ready_url, timeout=2).ok:
+            print("Server is up!")
+            import os
+            os.startfile(url)  # Öffnet den Standardbrowser
+            break
+    except requests.RequestException:
+        pass
+    time.sleep(0.2)
 else:
     print("Server did not start within timeout period.")
\ No newline at end of file
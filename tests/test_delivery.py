@@ -0,0 +1,108 @@
+import pytest
+from flask import Flask
+
+from src.services.delivery import file_response, parse_range
+
+DATA = bytes(range(256)) * 4
+
+
+@pytest.fixture
+def client(tmp_path):
+    path = tmp_path / 'result.mp4'
+    path.write_bytes(DATA)
+    app = Flask(__name__)
+    closed = []
+
+    @app.route('/file')
+    def serve():
+        return file_response(str(path), 'Ergebnis äöü.mp4', on_close=lambda *args: closed.append(args))
+
+    client = app.test_client()
+    client.closed = closed
+    return client
+
+
+def fetch(client, method='GET', **headers):
+    response = client.open('/file', method=method, headers=headers)
+    body = response.get_data()
+    response.close()
+    return response, body
+
+
+def test_full_response(client):
+    response, body = fetch(client)
+    assert response.status_code == 200
+    assert body == DATA
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    assert response.headers['Content-Length'] == str(len(DATA))
+    assert "filename*=UTF-8''Ergebnis%20%C3%A4%C3%B6%C3%BC.mp4" in response.headers['Content-Disposition']
+    assert response.headers['ETag']
+    assert len(client.closed) == 1
+
+
+def test_range_returns_206(client):
+    response, body = fetch(client, Range='bytes=10-19')
+    assert response.status_code == 206
+    assert body == DATA[10:20]
+    assert response.headers['Content-Range'] == f'bytes 10-19/{len(DATA)}'
+    assert response.headers['Content-Length'] == '10'
+
+    response, body = fetch(client, Range='bytes=-24')
+    assert response.status_code == 206
+    assert body == DATA[-24:]
+    assert len(client.closed) == 2
+
+
+def test_unsatisfiable_range_returns_416(client):
+    response, body = fetch(client, Range=f'bytes={len(DATA)}-')
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == f'bytes */{len(DATA)}'
+    assert len(client.closed) == 1
+
+
+def test_matching_etag_returns_304(client):
+    etag = fetch(client)[0].headers['ETag']
+    response, body = fetch(client, **{'If-None-Match': etag})
+    assert response.status_code == 304
+    assert body == b''
+    assert len(client.closed) == 2
+
+
+def test_stale_if_range_returns_full_file(client):
+    response, body = fetch(client, Range='bytes=0-9', **{'If-Range': '"stale"'})
+    assert response.status_code == 200
+    assert body == DATA
+
+
+def test_head_sends_headers_only(client):
+    response, body = fetch(client, method='HEAD')
+    assert response.status_code == 200
+    assert body == b''
+    assert response.headers['Content-Length'] == str(len(DATA))
+    assert len(client.closed) == 1
+
+
+def test_sent_bytes_are_reported_on_close(client):
+    fetch(client)
+    fetch(client, Range='bytes=10-19')
+    fetch(client, Range=f'bytes={len(DATA)}-')
+    fetch(client, method='HEAD')
+    assert client.closed == [(len(DATA),), (10,), (0,), (0,)]
+
+
+def test_parse_range():
+    assert parse_range(None, 100) is None
+    assert parse_range('bytes=0-9', 100) == (0, 9)
+    assert parse_range('bytes=90-', 100) == (90, 99)
+    assert parse_range('bytes=50-500', 100) == (50, 99)
+    assert parse_range('bytes=-10', 100) == (90, 99)
+    assert parse_range('bytes=-500', 100) == (0, 99)
+
+
+def test_parse_range_invalid_and_multiple():
+    assert parse_range('bytes=100-', 100) == 'invalid'
+    assert parse_range('bytes=9-5', 100) == 'invalid'
+    assert parse_range('bytes=-0', 100) == 'invalid'
+    assert parse_range('bytes=-', 100) == 'invalid'
+    # Mehrere Bereiche werden nicht unterstützt: komplette Datei
+    assert parse_range('bytes=0-1,5-6', 100) is None
@@ -0,0 +1,159 @@
+import sqlite3
+import threading
+import time
+
+from src.services.jobs import CANCELLED, COMPLETE, QUEUED, Job, JobCancelled, JobScheduler, JobStore
+
+
+def wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+class GatedRunner:
+    """Protokolliert die Startreihenfolge; Jobs laufen, bis `gate` gesetzt oder der Job abgebrochen wird."""
+
+    def __init__(self, open_gate=False):
+        self.gate = threading.Event()
+        if open_gate:
+            self.gate.set()
+        self.order = []
+
+    def __call__(self, job, scheduler):
+        self.order.append(job.params['name'])
+        while not self.gate.wait(0.01):
+            if job.cancel_requested.is_set():
+                raise JobCancelled()
+
+
+def test_priority_first_then_least_recently_served_client():
+    runner = GatedRunner()
+    scheduler = JobScheduler(runner, download_workers=1)
+    first = scheduler.submit({'name': 'a1'}, client_id='a')
+    wait_until(lambda: runner.order == ['a1'])
+    jobs = [
+        scheduler.submit({'name': 'a2'}, client_id='a'),
+        scheduler.submit({'name': 'a3'}, client_id='a'),
+        scheduler.submit({'name': 'b1'}, client_id='b'),
+        scheduler.submit({'name': 'c1'}, client_id='c', priority=5),
+    ]
+    assert scheduler.queue_depth() == 4
+    runner.gate.set()
+    wait_until(lambda: all(job.finished for job in [first, *jobs]))
+    # Client b wurde noch nie bedient und zieht an den älteren Jobs von a vorbei
+    assert runner.order == ['a1', 'c1', 'b1', 'a2', 'a3']
+    assert all(job.status == COMPLETE for job in jobs)
+
+
+def test_workers_bound_parallel_downloads():
+    runner = GatedRunner()
+    scheduler = JobScheduler(runner, download_workers=2)
+    jobs = [scheduler.submit({'name': str(i)}) for i in range(4)]
+    wait_until(lambda: len(runner.order) == 2)
+    time.sleep(0.05)
+    assert scheduler.active_jobs() == 2
+    assert scheduler.queue_depth() == 2
+    runner.gate.set()
+    wait_until(lambda: all(job.finished for job in jobs))
+    assert scheduler.active_jobs() == 0
+
+
+def test_cancel_queued_and_running_jobs():
+    runner = GatedRunner()
+    scheduler = JobScheduler(runner, download_workers=1)
+    running = scheduler.submit({'name': 'running'})
+    wait_until(lambda: runner.order == ['running'])
+    queued = scheduler.submit({'name': 'queued'})
+    assert queued.events[-1]['status'] == QUEUED
+
+    scheduler.cancel(queued.id)
+    assert queued.status == CANCELLED
+    assert queued.events[-1]['status'] == CANCELLED
+    scheduler.cancel(running.id)
+    wait_until(lambda: running.finished)
+    assert running.status == CANCELLED
+    assert runner.order == ['running']
+
+
+def test_same_dedup_key_attaches_to_active_job():
+    runner = GatedRunner()
+    scheduler = JobScheduler(runner, download_workers=1)
+    job = scheduler.submit({'name': 'a'}, auto_cancel=True, dedup_key='key')
+    same = scheduler.submit({'name': 'a'}, priority=3, auto_cancel=False, dedup_key='key')
+    other = scheduler.submit({'name': 'b'}, dedup_key='other')
+    assert same is job and other is not job
+    # Ein Auftraggeber ohne auto_cancel behält den gemeinsamen Job
+    assert job.auto_cancel is False
+    assert job.priority == 3
+
+    runner.gate.set()
+    wait_until(lambda: job.finished and other.finished)
+    assert scheduler.submit({'name': 'a'}, dedup_key='key') is not job
+
+
+def test_auto_cancel_when_last_subscriber_leaves():
+    scheduler = JobScheduler(GatedRunner(), download_workers=1, cancel_grace=0)
+    job = scheduler.submit({'name': 'a'}, auto_cancel=True)
+    scheduler.subscribe(job)
+    scheduler.subscribe(job)
+    scheduler.unsubscribe(job)
+    assert not job.cancel_requested.is_set()
+    scheduler.unsubscribe(job)
+    wait_until(lambda: job.finished)
+    assert job.status == CANCELLED
+
+
+def test_auto_cancel_waits_for_reconnect():
+    scheduler = JobScheduler(GatedRunner(), download_workers=1, cancel_grace=0.2)
+    job = scheduler.submit({'name': 'a'}, auto_cancel=True)
+    scheduler.subscribe(job)
+    scheduler.unsubscribe(job)
+    time.sleep(0.1)
+    # Wiederverbinden innerhalb der Schonfrist hält den Job am Leben
+    scheduler.subscribe(job)
+    time.sleep(0.3)
+    assert not job.cancel_requested.is_set()
+
+    scheduler.unsubscribe(job)
+    time.sleep(0.1)
+    assert not job.cancel_requested.is_set()
+    wait_until(lambda: job.finished)
+    assert job.status == CANCELLED
+
+
+def test_unfinished_jobs_are_requeued_after_restart(tmp_path):
+    db_path = str(tmp_path / 'jobs.db')
+    crashed = GatedRunner()
+    before = JobScheduler(crashed, download_workers=1, store=JobStore(db_path))
+    running = before.submit({'name': 'running'}, auto_cancel=True)
+    queued = before.submit({'name': 'queued'})
+    wait_until(lambda: crashed.order == ['running'])
+
+    runner = GatedRunner(open_gate=True)
+    after = JobScheduler(runner, download_workers=1, store=JobStore(db_path))
+    after.start()
+    wait_until(lambda: sorted(runner.order) == ['queued', 'running'])
+    restarted = after.get(running.id)
+    assert restarted.auto_cancel is False
+    wait_until(lambda: restarted.finished and after.get(queued.id).finished)
+    assert JobStore(db_path).load_unfinished() == []
+
+
+def test_store_purges_old_finished_jobs(tmp_path):
+    db_path = str(tmp_path / 'jobs.db')
+    store = JobStore(db_path)
+    finished, queued = Job({'name': 'finished'}), Job({'name': 'queued'})
+    finished.set_status(COMPLETE, finished_at=time.time())
+    store.save(finished)
+    store.save(queued)
+
+    def stored_ids():
+        with sqlite3.connect(db_path) as conn:
+            return sorted(row[0] for row in conn.execute('SELECT id FROM jobs'))
+
+    store.purge(time.time() - 60)
+    assert stored_ids() == sorted([finished.id, queued.id])
+    store.purge(time.time() + 60)
+    assert stored_ids() == [queued.id]
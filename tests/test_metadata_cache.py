@@ -0,0 +1,123 @@
+import threading
+import time
+
+import pytest
+
+from src.services.metadata_cache import MetadataCache, normalize_video_key
+
+URL = 'https://www.youtube.com/watch?v=dQw4w9WgXcQ'
+
+
+def wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+class Extractor:
+    """Zählt Extraktionen; mit `gate` blockiert jede Extraktion, bis es gesetzt wird."""
+
+    def __init__(self, gate=None, error=None):
+        self.gate = gate
+        self.error = error
+        self.calls = []
+
+    def __call__(self, url):
+        self.calls.append(url)
+        if self.gate is not None:
+            self.gate.wait(5)
+        if self.error is not None:
+            raise self.error
+        return {'title': 'Video', 'call': len(self.calls)}
+
+
+def test_normalize_video_key():
+    key = 'youtube:dQw4w9WgXcQ'
+    assert normalize_video_key(URL + '&t=42') == key
+    assert normalize_video_key('https://youtu.be/dQw4w9WgXcQ') == key
+    assert normalize_video_key('https://www.youtube.com/shorts/dQw4w9WgXcQ') == key
+    assert normalize_video_key(' https://example.com/clip ') == 'url:https://example.com/clip'
+
+
+def test_concurrent_requests_share_one_extraction():
+    cache = MetadataCache()
+    extract = Extractor(gate=threading.Event())
+    urls = [URL, URL + '&t=1', 'https://youtu.be/dQw4w9WgXcQ', 'https://www.youtube.com/embed/dQw4w9WgXcQ']
+    results = []
+    threads = [threading.Thread(target=lambda url=url: results.append(cache.get_or_extract(url, extract)))
+               for url in urls]
+    for thread in threads:
+        thread.start()
+    wait_until(lambda: cache.stats()['coalesced'] == 3)
+    extract.gate.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(extract.calls) == 1
+    assert results == [{'title': 'Video', 'call': 1}] * 4
+    assert cache.get_or_extract(URL, extract) == {'title': 'Video', 'call': 1}
+    stats = cache.stats()
+    assert (stats['misses'], stats['coalesced'], stats['hits'], stats['in_flight']) == (1, 3, 1, 0)
+
+
+def test_errors_reach_waiting_requests_and_are_not_cached():
+    cache = MetadataCache()
+    extract = Extractor(gate=threading.Event(), error=ValueError('unavailable'))
+    errors = []
+
+    def request():
+        try:
+            cache.get_or_extract(URL, extract)
+        except ValueError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=request) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    wait_until(lambda: cache.stats()['coalesced'] == 1)
+    extract.gate.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(errors) == 2
+
+    extract.error = None
+    assert cache.get_or_extract(URL, extract)['call'] == 2
+
+
+def test_entries_expire_after_ttl():
+    cache = MetadataCache(ttl=0.05)
+    extract = Extractor()
+    cache.get_or_extract(URL, extract)
+    assert cache.peek(URL) is not None
+    time.sleep(0.1)
+    assert cache.peek(URL) is None
+    assert cache.get_or_extract(URL, extract)['call'] == 2
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = MetadataCache(max_entries=2)
+    extract = Extractor()
+    first, second, third = (f'https://example.com/{name}' for name in ('a', 'b', 'c'))
+    cache.get_or_extract(first, extract)
+    cache.get_or_extract(second, extract)
+    cache.get_or_extract(first, extract)
+    cache.get_or_extract(third, extract)
+    assert cache.peek(second) is None
+    assert cache.peek(first) is not None and cache.peek(third) is not None
+    assert cache.stats()['evictions'] == 1
+
+
+def test_disk_cache_survives_restart(tmp_path):
+    db_path = str(tmp_path / 'metadata.db')
+    MetadataCache(db_path=db_path).get_or_extract(URL, Extractor())
+    cache = MetadataCache(db_path=db_path)
+    assert cache.get_or_extract(URL, Extractor(error=AssertionError('not cached'))) == {'title': 'Video', 'call': 1}
+    assert cache.stats()['disk_hits'] == 1
+
+
+def test_expired_disk_entries_are_ignored(tmp_path):
+    db_path = str(tmp_path / 'metadata.db')
+    MetadataCache(ttl=-1, db_path=db_path).get_or_extract(URL, Extractor())
+    with pytest.raises(LookupError):
+        MetadataCache(db_path=db_path).get_or_extract(URL, Extractor(error=LookupError('extracted')))
@@ -0,0 +1,87 @@
+import pytest
+from yt_dlp.postprocessor import (
+    FFmpegExtractAudioPP, FFmpegFixupM4aPP, FFmpegMergerPP, FFmpegMetadataPP,
+    FFmpegVideoConvertorPP, FFmpegVideoRemuxerPP,
+)
+
+from src.services.progress import ProgressAggregator
+
+FFMPEG_PPS = [
+    FFmpegMergerPP, FFmpegExtractAudioPP, FFmpegVideoConvertorPP, FFmpegVideoRemuxerPP,
+    FFmpegMetadataPP, FFmpegFixupM4aPP,
+]
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_aggregator(rate_hz=1000):
+    events = []
+    clock = Clock()
+    return ProgressAggregator(events.append, rate_hz=rate_hz, clock=clock), events, clock
+
+
+def test_video_and_audio_downloads_are_summed():
+    aggregator, events, clock = make_aggregator()
+    info = {'requested_formats': [{'filesize': 300}, {'filesize': 100}]}
+    aggregator.download_hook({'status': 'downloading', 'filename': 'video', 'downloaded_bytes': 150,
+                              'total_bytes': 300, 'info_dict': info})
+    assert events[-1]['percent'] == 37.5
+    assert events[-1]['total'] == 400
+
+    clock.now = 1.0
+    aggregator.download_hook({'status': 'finished', 'filename': 'video', 'total_bytes': 300, 'info_dict': info})
+    assert events[-1]['status'] == 'downloading'
+    clock.now = 2.0
+    aggregator.download_hook({'status': 'finished', 'filename': 'audio', 'total_bytes': 100, 'info_dict': info})
+    assert events[-1] == {'status': 'finished', 'phase': 'download', 'percent': 100.0,
+                          'downloaded': 400, 'total': 400, 'message': 'Download abgeschlossen.'}
+
+
+def test_speed_and_eta_from_byte_counts():
+    aggregator, events, clock = make_aggregator()
+    info = {'filesize': 1000}
+    aggregator.download_hook({'status': 'downloading', 'filename': 'f', 'downloaded_bytes': 0,
+                              'total_bytes': 1000, 'info_dict': info})
+    clock.now = 1.0
+    aggregator.download_hook({'status': 'downloading', 'filename': 'f', 'downloaded_bytes': 100,
+                              'total_bytes': 1000, 'info_dict': info})
+    assert events[-1]['speed'] == 100
+    assert events[-1]['eta'] == 9
+
+
+def test_events_are_throttled_but_finish_is_not():
+    aggregator, events, clock = make_aggregator(rate_hz=2)
+    info = {'filesize': 1000}
+    for step in range(10):
+        clock.now = step * 0.1
+        aggregator.download_hook({'status': 'downloading', 'filename': 'f', 'downloaded_bytes': step * 100,
+                                  'total_bytes': 1000, 'info_dict': info})
+    assert [event['downloaded'] for event in events] == [0, 500]
+    clock.now = 0.95
+    aggregator.download_hook({'status': 'finished', 'filename': 'f', 'total_bytes': 1000, 'info_dict': info})
+    assert events[-1]['status'] == 'finished'
+
+
+@pytest.mark.parametrize('pp', FFMPEG_PPS, ids=lambda pp: pp.__name__)
+def test_processing_events_use_yt_dlp_pp_keys(pp):
+    aggregator, events, _ = make_aggregator()
+    for status in ('started', 'finished'):
+        aggregator.postprocessor_hook({'status': status, 'postprocessor': pp.pp_key(), 'info_dict': {}})
+    assert events == [
+        {'status': 'processing', 'phase': pp.pp_key(), 'percent': 0.0},
+        {'status': 'processing', 'phase': pp.pp_key(), 'percent': 100.0},
+    ]
+
+
+def test_ffmpeg_progress_file_drives_percent(tmp_path):
+    progress_file = tmp_path / '.ffmpeg-progress'
+    aggregator = ProgressAggregator(lambda event: None, progress_file=str(progress_file))
+    assert aggregator.ffmpeg_args() == {'ffmpeg': ['-progress', str(progress_file), '-nostats']}
+    progress_file.write_text('out_time_us=1000000\nprogress=continue\nout_time_us=2500000\n')
+    assert aggregator._read_ffmpeg_out_time() == 2.5
@@ -0,0 +1,111 @@
+import os
+import time
+
+from src.services.result_store import ResultStore, result_key
+from src.services.state import SqliteStateBackend
+
+
+def make_file(tmp_path, name, size=100):
+    path = tmp_path / name
+    path.write_bytes(b'x' * size)
+    return str(path)
+
+
+def test_result_key_depends_on_all_inputs():
+    key = result_key('youtube:abc', '137+140', 'mp4', [])
+    assert key == result_key('youtube:abc', '137+140', 'mp4', None)
+    assert key != result_key('youtube:abc', '137+140', 'mkv', [])
+    assert key != result_key('youtube:abc', '22', 'mp4', [])
+
+
+def test_put_moves_file_and_lookup_finds_it(tmp_path):
+    store = ResultStore(str(tmp_path / 'store'), min_retention=0)
+    source = make_file(tmp_path, 'download.mp4')
+    path = store.put('a', source)
+    assert path == os.path.join(store.root, 'a.mp4')
+    assert not os.path.exists(source)
+    assert store.lookup('a') == path
+    assert store.lookup('missing') is None
+    assert store.stats()['hits'] == 1 and store.stats()['misses'] == 1
+
+
+def test_least_recently_used_result_is_evicted(tmp_path):
+    store = ResultStore(str(tmp_path / 'store'), max_bytes=250, min_retention=0)
+    first = store.put('a', make_file(tmp_path, 'a.mp4'))
+    second = store.put('b', make_file(tmp_path, 'b.mp4'))
+    store.lookup('a')
+    store.put('c', make_file(tmp_path, 'c.mp4'))
+    assert store.lookup('b') is None and not os.path.exists(second)
+    assert store.lookup('a') == first
+    assert store.stats()['evictions'] == 1
+    assert store.stats()['bytes'] == 200
+
+
+def test_referenced_result_is_not_evicted(tmp_path):
+    store = ResultStore(str(tmp_path / 'store'), max_bytes=150, min_retention=0)
+    store.put('a', make_file(tmp_path, 'a.mp4'))
+    path = store.acquire('a')
+    store.put('b', make_file(tmp_path, 'b.mp4'))
+    assert os.path.exists(path)
+    assert store.stats()['in_use'] == 1
+
+    store.release('a')
+    assert not os.path.exists(path)
+    assert store.stats()['in_use'] == 0
+    assert store.acquire('a') is None
+
+
+def test_recently_used_result_is_retained(tmp_path):
+    store = ResultStore(str(tmp_path / 'store'), max_bytes=150, min_retention=60)
+    first = store.put('a', make_file(tmp_path, 'a.mp4'))
+    store.put('b', make_file(tmp_path, 'b.mp4'))
+    assert os.path.exists(first)
+    assert store.stats()['bytes'] == 200
+
+
+def test_results_survive_restart(tmp_path):
+    root = str(tmp_path / 'store')
+    path = ResultStore(root).put('a', make_file(tmp_path, 'a.webm'))
+    open(os.path.join(root, 'b.mp4.part'), 'wb').close()
+    store = ResultStore(root)
+    assert store.lookup('a') == path
+    assert store.stats()['entries'] == 1
+
+
+def test_shared_index_protects_results_served_by_other_instances(tmp_path):
+    root = str(tmp_path / 'store')
+    index = SqliteStateBackend(str(tmp_path / 'state.db'))
+    serving = ResultStore(root, max_bytes=150, min_retention=0, index=index)
+    other = ResultStore(root, max_bytes=150, min_retention=0, index=index)
+    path = serving.put('a', make_file(tmp_path, 'a.mp4'))
+    assert serving.acquire('a') == path
+
+    other.put('b', make_file(tmp_path, 'b.mp4'))
+    assert os.path.exists(path)
+    assert other.lookup('a') == path
+
+    serving.release('a')
+    time.sleep(0.01)
+    other.put('c', make_file(tmp_path, 'c.mp4'))
+    assert not os.path.exists(path)
+    assert serving.acquire('a') is None
+
+
+def test_storing_key_again_with_other_extension_replaces_file(tmp_path):
+    root = str(tmp_path / 'store')
+    store = ResultStore(root, min_retention=0)
+    old = store.put('a', make_file(tmp_path, 'a.webm'))
+    new = store.put('a', make_file(tmp_path, 'a.mp4', size=50))
+    assert not os.path.exists(old)
+    assert store.lookup('a') == new
+    assert store.stats()['bytes'] == 50
+    assert ResultStore(root).stats()['bytes'] == 50
+
+
+def test_other_extension_replaces_file_stored_by_other_instance(tmp_path):
+    root = str(tmp_path / 'store')
+    index = SqliteStateBackend(str(tmp_path / 'state.db'))
+    old = ResultStore(root, index=index).put('a', make_file(tmp_path, 'a.webm'))
+    new = ResultStore(root, index=index).put('a', make_file(tmp_path, 'a.mp4'))
+    assert not os.path.exists(old)
+    assert index.lookup_result('a') == new
@@ -0,0 +1,56 @@
+import pytest
+from yt_dlp.postprocessor import (
+    FFmpegExtractAudioPP, FFmpegFixupM4aPP, FFmpegMergerPP, FFmpegMetadataPP,
+    FFmpegVideoConvertorPP, FFmpegVideoRemuxerPP, MoveFilesAfterDownloadPP,
+)
+
+from src.routes.youtube import FFMPEG_POSTPROCESSORS
+
+
+@pytest.mark.parametrize('pp', [
+    FFmpegMergerPP, FFmpegExtractAudioPP, FFmpegVideoConvertorPP, FFmpegVideoRemuxerPP,
+    FFmpegMetadataPP, FFmpegFixupM4aPP,
+], ids=lambda pp: pp.__name__)
+def test_ffmpeg_postprocessors_match_yt_dlp_pp_keys(pp):
+    # yt-dlp meldet im Hook pp_key(), also ohne das Präfix 'FFmpeg'
+    assert pp.pp_key() in FFMPEG_POSTPROCESSORS
+
+
+def test_other_postprocessors_do_not_take_a_postprocess_slot():
+    assert MoveFilesAfterDownloadPP.pp_key() not in FFMPEG_POSTPROCESSORS
+
+
+@pytest.fixture
+def client():
+    from src.main import app
+    return app.test_client()
+
+
+@pytest.mark.parametrize('body, error', [
+    ({}, 'urls or playlist is required'),
+    ({'urls': 5}, 'urls must be a list of strings'),
+    ({'urls': ['https://youtu.be/dQw4w9WgXcQ', 1]}, 'urls must be a list of strings'),
+    ({'playlist': ['https://example.com']}, 'playlist must be a string'),
+    ([1, 2], 'JSON object expected'),
+])
+def test_analyze_batch_rejects_invalid_input(client, body, error):
+    response = client.post('/api/analyze/batch', json=body)
+    assert response.status_code == 400
+    assert response.get_json() == {'error': error}
+
+
+@pytest.mark.parametrize('body, error', [
+    ([], 'JSON object expected'),
+    ('x', 'JSON object expected'),
+    ({'url': 'https://youtu.be/dQw4w9WgXcQ', 'type': 'video', 'quality': 18, 'format': 'mp4'},
+     'quality must be a string'),
+    ({'url': ['https://youtu.be/dQw4w9WgXcQ'], 'type': 'video', 'quality': '18', 'format': 'mp4'},
+     'url must be a string'),
+    ({'url': 'https://youtu.be/dQw4w9WgXcQ', 'type': 'video', 'quality': '18', 'format': 'mp4', 'filename': 1},
+     'filename must be a string'),
+    ({'url': 'https://youtu.be/dQw4w9WgXcQ', 'type': 'video'}, 'Missing required parameters'),
+])
+def test_create_job_rejects_invalid_input(client, body, error):
+    response = client.post('/api/jobs', json=body)
+    assert response.status_code == 400
+    assert response.get_json() == {'error': error}
@@ -0,0 +1,170 @@
+import threading
+import time
+
+import pytest
+
+from src.services.jobs import COMPLETE, Job, JobScheduler
+from src.services.state import SqliteStateBackend, StateBackend
+
+
+def make_backend(tmp_path):
+    return SqliteStateBackend(str(tmp_path / 'state.db'))
+
+
+def make_job(backend, client_id='a', priority=0, dedup_key=None):
+    job = Job({'url': 'https://example.com'}, priority=priority, client_id=client_id, dedup_key=dedup_key)
+    # Eindeutige Einreihungszeit, damit FIFO unabhängig von der Uhrauflösung ist
+    time.sleep(0.002)
+    backend.save(job)
+    return job
+
+
+def test_claim_prefers_priority_then_idle_client_then_fifo(tmp_path):
+    backend = make_backend(tmp_path)
+    a1, a2 = make_job(backend, 'a'), make_job(backend, 'a')
+    b1 = make_job(backend, 'b')
+    urgent = make_job(backend, 'c', priority=5)
+    assert backend.queue_depth() == 4
+    assert backend.queue_position(urgent.id) == 1
+    assert backend.queue_position(b1.id) == 4
+
+    assert backend.claim('one', 30) == urgent.id
+    assert backend.claim('one', 30) == a1.id
+    # Client a hat bereits einen laufenden Job
+    assert backend.claim('two', 30) == b1.id
+    assert backend.claim('two', 30) == a2.id
+    assert backend.claim('two', 30) is None
+    assert backend.load(a1.id)['status'] == 'running'
+
+
+def test_expired_lease_is_claimed_by_another_instance(tmp_path):
+    backend = make_backend(tmp_path)
+    job = make_job(backend)
+    assert backend.claim('one', 30) == job.id
+    assert backend.claim('two', 30) is None
+
+    backend.renew('one', [job.id], -1)
+    assert backend.claim('two', 30) == job.id
+    # Die alte Instanz kann die Lease nicht mehr verlängern
+    backend.renew('one', [job.id], -1)
+    assert backend.claim('three', 30) is None
+
+
+def test_dequeue_and_cancel_requests(tmp_path):
+    backend = make_backend(tmp_path)
+    running, waiting = make_job(backend), make_job(backend)
+    backend.claim('one', 30)
+    assert backend.dequeue(running.id) is False
+    assert backend.dequeue(waiting.id) is True
+    assert backend.load(waiting.id)['status'] == 'cancelled'
+    assert backend.queue_depth() == 0
+
+    assert backend.cancel_requested([running.id]) == set()
+    backend.request_cancel(running.id)
+    assert backend.cancel_requested([running.id]) == {running.id}
+
+
+def test_events_and_active_dedup_key(tmp_path):
+    backend = make_backend(tmp_path)
+    job = make_job(backend, dedup_key='key')
+    for index, event in enumerate([{'status': 'queued'}, {'status': 'downloading'}]):
+        backend.append_event(job.id, index, event)
+    assert backend.events_since(job.id, 1) == [{'status': 'downloading'}]
+    assert backend.active_job('key') == job.id
+
+    job.set_status(COMPLETE, finished_at=time.time())
+    backend.save(job)
+    assert backend.active_job('key') is None
+
+
+def test_purge_removes_finished_jobs_and_events(tmp_path):
+    backend = make_backend(tmp_path)
+    finished, queued = make_job(backend), make_job(backend)
+    backend.append_event(finished.id, 0, {'status': 'complete'})
+    finished.set_status(COMPLETE, finished_at=time.time())
+    backend.save(finished)
+
+    backend.purge(time.time() + 1)
+    assert backend.load(finished.id) is None
+    assert backend.events_since(finished.id) == []
+    assert backend.load(queued.id) is not None
+
+
+def put_results(backend, *keys):
+    for key in keys:
+        backend.put_result(key, f'/results/{key}.mp4', 100)
+        time.sleep(0.002)
+
+
+def test_evict_results_least_recently_used_without_refs(tmp_path):
+    backend = make_backend(tmp_path)
+    put_results(backend, 'a', 'b', 'c')
+    backend.touch_result('a')
+    assert backend.acquire_result('b') == '/results/b.mp4'
+    future = time.time() + 1
+
+    assert backend.evict_results(150, retain_after=future, stale_after=0) == [
+        ('c', '/results/c.mp4'), ('a', '/results/a.mp4'),
+    ]
+    assert backend.lookup_result('b') == '/results/b.mp4'
+    assert backend.evict_results(0, retain_after=future, stale_after=0) == []
+
+
+def test_evict_results_respects_retention_keep_and_stale_refs(tmp_path):
+    backend = make_backend(tmp_path)
+    put_results(backend, 'a')
+    assert backend.evict_results(0, retain_after=time.time() - 60, stale_after=0) == []
+    assert backend.evict_results(0, retain_after=time.time() + 1, stale_after=0, keep='a') == []
+
+    backend.acquire_result('a')
+    assert backend.evict_results(0, retain_after=time.time() + 1, stale_after=0) == []
+    # Referenz einer abgestürzten Instanz
+    assert backend.evict_results(0, retain_after=time.time() + 1, stale_after=time.time() + 1) == [
+        ('a', '/results/a.mp4'),
+    ]
+
+
+def test_put_result_keeps_references(tmp_path):
+    backend = make_backend(tmp_path)
+    put_results(backend, 'a')
+    backend.acquire_result('a')
+    backend.put_result('a', '/results/a.webm', 100)
+    assert backend.evict_results(0, retain_after=time.time() + 1, stale_after=0) == []
+    backend.release_result('a')
+    assert backend.evict_results(0, retain_after=time.time() + 1, stale_after=0) == [('a', '/results/a.webm')]
+
+
+def test_remote_events_are_mirrored_once(tmp_path):
+    backend = make_backend(tmp_path)
+    job = make_job(backend)
+    scheduler = JobScheduler(lambda job, scheduler: None, store=backend)
+    mirrored = scheduler.get(job.id)
+    assert mirrored.remote and mirrored.events == []
+    for index in range(3):
+        backend.append_event(job.id, index, {'status': 'downloading', 'percent': index})
+
+    events_since = backend.events_since
+
+    def slow_events_since(job_id, cursor=0):
+        events = events_since(job_id, cursor)
+        time.sleep(0.05)
+        return events
+
+    backend.events_since = slow_events_since
+    # Sync-Thread und ein Worker (claim) spiegeln denselben Job gleichzeitig
+    threads = [threading.Thread(target=scheduler._mirror_events, args=(mirrored,)) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert [event['percent'] for event in mirrored.events] == [0, 1, 2]
+    assert mirrored.synced == 3
+
+
+def test_incomplete_backend_fails_on_instantiation():
+    class ReadOnlyBackend(StateBackend):
+        def load(self, job_id):
+            return None
+
+    with pytest.raises(TypeError):
+        ReadOnlyBackend()
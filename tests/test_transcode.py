@@ -0,0 +1,98 @@
+from src.services.codecs import codec_family, container_accepts
+from src.services.transcode import COPY, NONE, REENCODE, REMUX, plan_transcode, resolve_formats
+
+
+def video(format_id, vcodec, ext='mp4'):
+    return {'format_id': format_id, 'vcodec': vcodec, 'acodec': 'none', 'ext': ext}
+
+
+def audio(format_id, acodec, abr=None, ext='m4a'):
+    return {'format_id': format_id, 'vcodec': 'none', 'acodec': acodec, 'abr': abr, 'ext': ext}
+
+
+# ====== CODECS ======
+def test_codec_family_normalizes_yt_dlp_codec_strings():
+    assert codec_family('avc1.640028') == 'h264'
+    assert codec_family('vp09.00.40.08') == 'vp9'
+    assert codec_family('mp4a.40.2') == 'aac'
+    assert codec_family('mp4a.6B') == 'mp3'
+    assert codec_family('opus') == 'opus'
+
+
+def test_codec_family_none_and_unknown():
+    assert codec_family(None) is None
+    assert codec_family('none') is None
+    assert codec_family('theora.1') == 'theora'
+
+
+def test_container_accepts():
+    assert container_accepts('mp4', vcodec='h264', acodec='aac')
+    assert not container_accepts('webm', vcodec='h264')
+    assert container_accepts('mkv', vcodec='theora', acodec='pcm')
+    assert not container_accepts('avi', vcodec='h264')
+
+
+# ====== AUDIO ======
+def test_audio_copy_when_codec_matches():
+    plan = plan_transcode('audio', 'm4a', [audio('140', 'mp4a.40.2', abr=129)])
+    assert plan.action == COPY
+    assert plan.postprocessors == [{'key': 'FFmpegExtractAudio', 'preferredcodec': 'm4a'}]
+    assert not plan.reencode
+
+
+def test_audio_reencode_caps_bitrate_at_source():
+    plan = plan_transcode('audio', 'mp3', [audio('251', 'opus', abr=130, ext='webm')])
+    assert plan.action == REENCODE
+    assert plan.bitrate == 130
+    assert plan.postprocessors[0]['preferredquality'] == '130'
+
+
+def test_audio_lossless_target_has_no_bitrate():
+    plan = plan_transcode('audio', 'flac', [audio('251', 'opus', abr=130, ext='webm')])
+    assert plan.action == REENCODE
+    assert plan.bitrate is None
+    assert 'preferredquality' not in plan.postprocessors[0]
+
+
+def test_audio_unknown_source_uses_default_quality():
+    plan = plan_transcode('audio', 'ogg', None)
+    assert plan.action == REENCODE
+    assert plan.postprocessors[0]['preferredcodec'] == 'vorbis'
+    assert plan.postprocessors[0]['preferredquality'] == '192'
+
+
+# ====== VIDEO ======
+def test_video_none_when_single_format_already_in_target():
+    plan = plan_transcode('video', 'mp4', [{'format_id': '18', 'vcodec': 'avc1', 'acodec': 'mp4a.40.2', 'ext': 'mp4'}])
+    assert plan.action == NONE
+    assert plan.postprocessors == []
+
+
+def test_video_remux_merges_into_target_container():
+    plan = plan_transcode('video', 'mp4', [video('137', 'avc1.640028'), audio('140', 'mp4a.40.2')])
+    assert plan.action == REMUX
+    assert plan.merge_output_format == 'mp4'
+    assert plan.postprocessors == [{'key': 'FFmpegVideoRemuxer', 'preferedformat': 'mp4'}]
+
+
+def test_video_reencode_when_container_rejects_codecs():
+    plan = plan_transcode('video', 'webm', [video('137', 'avc1.640028'), audio('140', 'mp4a.40.2')])
+    assert plan.action == REENCODE
+    assert plan.merge_output_format is None
+    assert plan.postprocessors == [{'key': 'FFmpegVideoConvertor', 'preferedformat': 'webm'}]
+
+
+def test_video_unknown_source():
+    assert plan_transcode('video', 'mp4', None).action == NONE
+    assert plan_transcode('video', 'mkv', None).action == REENCODE
+
+
+def test_resolve_formats_requires_known_codecs():
+    metadata = {
+        'video_formats': [video('137', 'avc1.640028'), {'format_id': '22', 'ext': 'mp4'}],
+        'audio_formats': [audio('140', 'mp4a.40.2')],
+    }
+    assert [f['format_id'] for f in resolve_formats('137+140', metadata)] == ['137', '140']
+    assert [f['format_id'] for f in resolve_formats('999+140/137+140', metadata)] == ['137', '140']
+    assert resolve_formats('22', metadata) is None
+    assert resolve_formats('bestaudio', metadata) is None
@@ -0,0 +1,40 @@
+from src.services.transfer import ConcurrencyController
+
+
+def test_controller_keeps_level_that_pays_off():
+    controller = ConcurrencyController(minimum=1, maximum=8)
+    assert controller.choose('host') == 1
+    controller.report('host', 1, 100, 1.0)
+    assert controller.choose('host') == 2
+    controller.report('host', 2, 200, 1.0)
+    assert controller.choose('host') == 4
+
+
+def test_controller_falls_back_when_probe_does_not_help():
+    controller = ConcurrencyController(minimum=1, maximum=8)
+    controller.report('host', 1, 100, 1.0)
+    controller.report('host', 2, 105, 1.0)
+    assert controller.choose('host') == 1
+
+
+def test_controller_reprobes_and_halves_on_collapse():
+    controller = ConcurrencyController(minimum=1, maximum=8, reprobe_after=2)
+    controller.report('host', 1, 100, 1.0)
+    controller.report('host', 2, 200, 1.0)
+    controller.report('host', 4, 210, 1.0)
+    assert controller.choose('host') == 2
+    controller.report('host', 2, 200, 1.0)
+    controller.report('host', 2, 200, 1.0)
+    assert controller.choose('host') == 4
+    controller.report('host', 4, 200, 1.0)
+    controller.report('host', 4, 50, 1.0)
+    assert controller.choose('host') == 2
+
+
+def test_controller_respects_maximum_and_ignores_empty_reports():
+    controller = ConcurrencyController(minimum=2, maximum=3)
+    controller.report('host', 2, 0, 1.0)
+    assert controller.levels() == {}
+    controller.report('host', 2, 100, 1.0)
+    assert controller.choose('host') == 3
+    assert controller.levels() == {'host': 3}
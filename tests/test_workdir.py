@@ -0,0 +1,113 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from src.services.workdir import OWNER_FILE, InsufficientSpace, WorkDirManager, projected_bytes
+
+MB = 1024 ** 2
+
+
+def make_manager(tmp_path, **options):
+    options = {'quota': 10 * MB, 'min_free': 0, 'admission_timeout': 5, **options}
+    return WorkDirManager(str(tmp_path / 'work'), **options)
+
+
+def write_owner(path, pid, age=0):
+    os.makedirs(path, exist_ok=True)
+    marker = os.path.join(path, OWNER_FILE)
+    with open(marker, 'w', encoding='utf-8') as f:
+        json.dump({'pid': pid}, f)
+    stamp = time.time() - age
+    os.utime(marker, (stamp, stamp))
+    os.utime(path, (stamp, stamp))
+
+
+def test_projected_bytes():
+    formats = [{'filesize_bytes': 60 * MB}, {'filesize_bytes': 40 * MB}]
+    assert projected_bytes(formats, overhead=2.0) == 200 * MB
+    assert projected_bytes([{'filesize_bytes': None}]) == projected_bytes(None)
+
+
+def test_admit_reserves_and_release_deletes(tmp_path):
+    manager = make_manager(tmp_path)
+    work_dir = manager.admit('job', 4 * MB)
+    assert os.path.isfile(os.path.join(work_dir.path, OWNER_FILE))
+    assert manager.stats()['reserved_bytes'] == 4 * MB
+
+    work_dir.release()
+    assert not os.path.exists(work_dir.path)
+    stats = manager.stats()
+    assert (stats['active'], stats['reserved_bytes'], stats['admitted']) == (0, 0, 1)
+
+
+def test_job_larger_than_quota_is_rejected_immediately(tmp_path):
+    manager = make_manager(tmp_path)
+    started = time.monotonic()
+    with pytest.raises(InsufficientSpace):
+        manager.admit('big', 11 * MB)
+    assert time.monotonic() - started < 1
+    assert manager.stats()['rejected'] == 1
+
+
+def test_admit_waits_until_space_is_released(tmp_path):
+    manager = make_manager(tmp_path)
+    first = manager.admit('first', 6 * MB)
+    waited = []
+    threading.Timer(0.2, first.release).start()
+    second = manager.admit('second', 6 * MB, on_wait=lambda: waited.append(True))
+    assert second is not None
+    assert waited == [True]
+    assert manager.stats()['waited'] == 1
+
+
+def test_admit_gives_up_after_timeout(tmp_path):
+    manager = make_manager(tmp_path, admission_timeout=0.2)
+    manager.admit('first', 6 * MB)
+    with pytest.raises(InsufficientSpace):
+        manager.admit('second', 6 * MB)
+
+
+def test_cancel_while_waiting_for_space(tmp_path):
+    manager = make_manager(tmp_path)
+    manager.admit('first', 6 * MB)
+    cancel = threading.Event()
+    threading.Timer(0.1, cancel.set).start()
+    assert manager.admit('second', 6 * MB, cancel_event=cancel) is None
+    assert manager.stats()['active'] == 1
+
+
+def test_growing_download_beyond_quota_fails(tmp_path):
+    manager = make_manager(tmp_path)
+    work_dir = manager.admit('job', 4 * MB)
+    work_dir.progress_hook({'status': 'downloading', 'filename': 'video', 'total_bytes': 8 * MB})
+    assert work_dir.reserved == 8 * MB
+    with pytest.raises(InsufficientSpace):
+        work_dir.progress_hook({'status': 'downloading', 'filename': 'audio', 'total_bytes': 4 * MB})
+
+
+def test_sweep_removes_orphans_and_keeps_live_dirs(tmp_path):
+    manager = make_manager(tmp_path, sweep_interval=10, max_age=600)
+    own = manager.admit('own', MB)
+    alive = os.path.join(manager.root, 'other-instance')
+    write_owner(alive, pid=os.getpid() + 1)
+    crashed = os.path.join(manager.root, 'crashed')
+    write_owner(crashed, pid=os.getpid() + 1, age=3600)
+    leftover = os.path.join(manager.root, 'leftover.part')
+    open(leftover, 'wb').close()
+    os.utime(leftover, (time.time() - 3600, time.time() - 3600))
+
+    assert manager.sweep() == 2
+    assert os.path.isdir(own.path) and os.path.isdir(alive)
+    assert not os.path.exists(crashed) and not os.path.exists(leftover)
+    assert manager.stats()['swept'] == 2
+
+
+def test_startup_removes_dirs_of_previous_run(tmp_path):
+    root = tmp_path / 'work'
+    write_owner(str(root / 'job-previous'), pid=os.getpid())
+    manager = make_manager(tmp_path)
+    assert os.listdir(manager.root) == []
+    assert manager.stats()['recovered'] == 1